@@ -4,12 +4,17 @@ Streamlit in Snowflake (SiS) Version - V3.2
 Multi-turn conversation for both Agent Chat and Data Insights
 """
 
+import hashlib
+import io
 import json
+import threading
+import time
+import urllib.request
 import uuid
 import pandas as pd
 import streamlit as st
 from datetime import datetime, timezone, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 APP_VERSION = "3.2.0"
 
@@ -190,10 +195,19 @@ CREATE TABLE IF NOT EXISTS {schema}.INSIGHTS_MESSAGES (
 );
 """
 
+# Large prompt contexts (the semantic model) by content hash, see _prompt_expr
+PROMPT_CONTEXTS_SQL = """
+CREATE TABLE IF NOT EXISTS {schema}.PROMPT_CONTEXTS (
+    context_hash VARCHAR(64) PRIMARY KEY,
+    content TEXT,
+    created_at TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+);
+"""
+
 
 def ensure_all_tables(session, schema: str) -> bool:
     try:
-        for sql in [AGENT_TABLES_SQL, INSIGHTS_TABLES_SQL]:
+        for sql in [AGENT_TABLES_SQL, INSIGHTS_TABLES_SQL, PROMPT_CONTEXTS_SQL]:
             for stmt in sql.format(schema=schema).split(';'):
                 stmt = stmt.strip()
                 if stmt:
@@ -203,48 +217,218 @@ def ensure_all_tables(session, schema: str) -> bool:
         return False
 
 
-# Agent Chat history functions
-def save_agent_session(session, schema: str, session_id: str, user_id: str, 
-                       title: str, semantic_model: str = None) -> bool:
-    try:
-        sql = f"""
-        MERGE INTO {schema}.AGENT_CHAT_SESSIONS t
-        USING (SELECT '{session_id}' as session_id) s
+# Write-behind history store: the chat saves messages and session updates into a queue and returns at once, and a
+# background thread writes them in batches, one multi-row INSERT per messages table and one MERGE per sessions table.
+# Session message counts are kept by adding the number of new messages instead of recounting them. A failed flush is
+# retried with the next batch and never reaches the chat (see last_error); reads that must see every message of a
+# session (opening or deleting it) wait for the pending writes first.
+HISTORY_FLUSH_DELAY_SEC = 0.5
+HISTORY_MAX_RETRIES = 3
+HISTORY_WAIT_TIMEOUT_SEC = 10
+HISTORY_RESULT_ROWS = 50
+
+# Sessions table, messages table and message columns (after message_id and session_id) of each history
+HISTORY_TABLES = {
+    "agent": ("AGENT_CHAT_SESSIONS", "AGENT_CHAT_MESSAGES", ("role", "content", "tool_info", "query_result")),
+    "insights": ("INSIGHTS_SESSIONS", "INSIGHTS_MESSAGES",
+                 ("role", "content", "sql_query", "query_result", "insights")),
+}
+
+
+def _history_value(value: Any) -> str:
+    if value is None:
+        return "NULL"
+    if isinstance(value, pd.DataFrame):
+        if value.empty:
+            return "NULL"
+        value = value.to_json(orient='records', force_ascii=False)
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False)
+    return _sql_literal(str(value))
+
+
+class HistoryWriter:
+    """Write-behind store of the agent and insights chat history, see above. Shared by the sessions of the app."""
+
+    def __init__(self, session):
+        self._session = session
+        self._cond = threading.Condition()
+        # (schema, history) -> message rows, in order
+        self._messages: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        # (schema, history) -> session_id -> user_id, title, semantic_model_name and number of new messages
+        self._sessions: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+        self._flushing = False
+        self._failures = 0
+        self.last_error: Optional[str] = None
+        threading.Thread(target=self._run, name="history-writer", daemon=True).start()
+
+    def _session_update(self, key: Tuple[str, str], session_id: str) -> Dict[str, Any]:
+        return self._sessions.setdefault(key, {}).setdefault(
+            session_id, {"user_id": None, "title": None, "semantic_model_name": None, "added": 0})
+
+    def save_session(self, history: str, schema: str, session_id: str, user_id: str,
+                     title: str, semantic_model: str = None):
+        with self._cond:
+            update = self._session_update((schema, history), session_id)
+            update.update(user_id=user_id, title=title)
+            if semantic_model:
+                update["semantic_model_name"] = semantic_model
+            self._cond.notify_all()
+
+    def save_message(self, history: str, schema: str, session_id: str, message: Dict[str, Any]):
+        with self._cond:
+            self._messages.setdefault((schema, history), []).append(
+                {**message, "session_id": session_id, "queued_at": time.time()})
+            self._session_update((schema, history), session_id)["added"] += 1
+            self._cond.notify_all()
+
+    def wait(self, timeout: float = HISTORY_WAIT_TIMEOUT_SEC) -> bool:
+        """Waits until every queued write was flushed (or dropped), returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: not (self._messages or self._sessions or self._flushing), timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._messages or self._sessions)
+            # Let the rest of the turn (the assistant message) join the batch
+            time.sleep(HISTORY_FLUSH_DELAY_SEC)
+            with self._cond:
+                messages, self._messages = self._messages, {}
+                sessions, self._sessions = self._sessions, {}
+                self._flushing = True
+            try:
+                for key, rows in list(messages.items()):
+                    self._insert_messages(*key, rows)
+                    del messages[key]
+                for key, updates in list(sessions.items()):
+                    self._merge_sessions(*key, updates)
+                    del sessions[key]
+                self._failures = 0
+                self.last_error = None
+            except Exception as e:
+                self._failures += 1
+                self.last_error = str(e)
+            with self._cond:
+                if self._failures >= HISTORY_MAX_RETRIES:
+                    # Give up on this batch, last_error stays until a flush succeeds
+                    self._failures = 0
+                elif self._failures:
+                    # Put back what was not written, ahead of what was queued meanwhile
+                    for key, rows in messages.items():
+                        self._messages[key] = rows + self._messages.get(key, [])
+                    for key, updates in sessions.items():
+                        for session_id, failed in updates.items():
+                            update = self._session_update(key, session_id)
+                            for col in ("user_id", "title", "semantic_model_name"):
+                                update[col] = update[col] or failed[col]
+                            update["added"] += failed["added"]
+                self._flushing = False
+                self._cond.notify_all()
+            if self._failures:
+                time.sleep(HISTORY_FLUSH_DELAY_SEC * 2 ** self._failures)
+
+    def _insert_messages(self, schema: str, history: str, rows: List[Dict[str, Any]]):
+        _, table, columns = HISTORY_TABLES[history]
+        now = time.time()
+        # created_at is when the message was queued, so that messages flushed together keep their order
+        values = ",\n".join(
+            "(" + ", ".join([_history_value(row["message_id"]), _history_value(row["session_id"])]
+                            + [_history_value(row.get(c)) for c in columns]
+                            + [str(int((now - row["queued_at"]) * 1e6))]) + ")"
+            for row in rows)
+        n = len(columns) + 2
+        self._session.sql(f"""
+        INSERT INTO {schema}.{table} (message_id, session_id, {", ".join(columns)}, created_at)
+        SELECT {", ".join(f"column{i}" for i in range(1, n + 1))},
+            TIMESTAMPADD(microsecond, -column{n + 1}, CURRENT_TIMESTAMP())::TIMESTAMP_NTZ
+        FROM VALUES {values}
+        """).collect()
+
+    def _merge_sessions(self, schema: str, history: str, updates: Dict[str, Dict[str, Any]]):
+        table = HISTORY_TABLES[history][0]
+        values = ",\n".join(
+            f"({_history_value(session_id)}, {_history_value(u['user_id'])}, {_history_value(u['title'])}, "
+            f"{_history_value(u['semantic_model_name'])}, {u['added']})"
+            for session_id, u in updates.items())
+        self._session.sql(f"""
+        MERGE INTO {schema}.{table} t
+        USING (
+            SELECT column1 AS session_id, column2 AS user_id, column3 AS title,
+                column4 AS semantic_model_name, column5 AS added
+            FROM VALUES {values}
+        ) s
         ON t.session_id = s.session_id
         WHEN MATCHED THEN UPDATE SET
             updated_at = CURRENT_TIMESTAMP(),
-            title = '{title.replace("'", "''")}',
-            message_count = (SELECT COUNT(*) FROM {schema}.AGENT_CHAT_MESSAGES WHERE session_id = '{session_id}')
-        WHEN NOT MATCHED THEN INSERT (session_id, user_id, title, semantic_model_name)
-        VALUES ('{session_id}', '{user_id}', '{title.replace("'", "''")}', 
-                {f"'{semantic_model}'" if semantic_model else 'NULL'})
-        """
-        session.sql(sql).collect()
-        return True
-    except:
-        return False
+            title = COALESCE(s.title, t.title),
+            message_count = COALESCE(t.message_count, 0) + s.added
+        WHEN NOT MATCHED AND s.user_id IS NOT NULL THEN
+            INSERT (session_id, user_id, title, semantic_model_name, message_count)
+            VALUES (s.session_id, s.user_id, s.title, s.semantic_model_name, s.added)
+        """).collect()
+
+
+@st.cache_resource(show_spinner=False)
+def get_history_writer(_session) -> HistoryWriter:
+    return HistoryWriter(_session)
+
+
+# Messages are loaded a page at a time, most recent first: opening a session reads its last HISTORY_PAGE_SIZE
+# messages, and older pages are read on demand before the oldest loaded message (the cursor), so that opening a long
+# session costs about the same as a short one. Stored query results and tool calls stay as their JSON text until they
+# are shown, see message_data and message_tool_info.
+HISTORY_PAGE_SIZE = MAX_HISTORY_MESSAGES
+
+
+def _history_page_sql(table: str, columns: str, session_id: str, before: Dict = None) -> str:
+    """
+    Query of the (up to) HISTORY_PAGE_SIZE + 1 messages of a session before the message before (all if None), newest
+    first. The extra message tells whether there is an older page.
+    """
+    cursor = ""
+    if before is not None and before.get("created_at") is not None:
+        created_at = f"{_sql_literal(str(before['created_at']))}::TIMESTAMP_NTZ"
+        cursor = (f"AND (created_at < {created_at} OR "
+                  f"(created_at = {created_at} AND message_id < {_sql_literal(before['message_id'])}))")
+    return f"""
+    SELECT {columns}, created_at
+    FROM {table}
+    WHERE session_id = {_sql_literal(session_id)} {cursor}
+    ORDER BY created_at DESC, message_id DESC
+    LIMIT {HISTORY_PAGE_SIZE + 1}
+    """
+
+
+def message_tool_info(msg: Dict) -> Optional[Dict]:
+    """Tool call of a message, parsed from its stored JSON on first use."""
+    if "tool_info" not in msg and msg.get("tool_info_json"):
+        try: msg["tool_info"] = json.loads(msg["tool_info_json"])
+        except: msg["tool_info"] = None
+    return msg.get("tool_info")
+
+
+def message_data(msg: Dict) -> Optional[pd.DataFrame]:
+    """Query result of a message, parsed from its stored JSON on first use."""
+    if "data" not in msg and msg.get("data_json"):
+        try: msg["data"] = pd.read_json(io.StringIO(msg["data_json"]))
+        except: msg["data"] = None
+    return msg.get("data")
+
+
+# Agent Chat history functions
+def save_agent_session(session, schema: str, session_id: str, user_id: str, 
+                       title: str, semantic_model: str = None):
+    get_history_writer(session).save_session("agent", schema, session_id, user_id, title, semantic_model)
 
 
 def save_agent_message(session, schema: str, session_id: str, message_id: str,
                        role: str, content: str, tool_info: dict = None,
-                       query_result: pd.DataFrame = None) -> bool:
-    try:
-        escaped = content.replace("'", "''").replace("\\", "\\\\") if content else ""
-        tool_json = json.dumps(tool_info, ensure_ascii=False).replace("'", "''") if tool_info else None
-        result_json = None
-        if query_result is not None and len(query_result) > 0:
-            result_json = query_result.head(50).to_json(orient='records', force_ascii=False).replace("'", "''")
-        
-        sql = f"""
-        INSERT INTO {schema}.AGENT_CHAT_MESSAGES (message_id, session_id, role, content, tool_info, query_result)
-        VALUES ('{message_id}', '{session_id}', '{role}', $${escaped}$$,
-                {f"$${tool_json}$$" if tool_json else 'NULL'},
-                {f"$${result_json}$$" if result_json else 'NULL'})
-        """
-        session.sql(sql).collect()
-        return True
-    except:
-        return False
+                       query_result: pd.DataFrame = None):
+    get_history_writer(session).save_message("agent", schema, session_id, {
+        "message_id": message_id, "role": role, "content": content or "", "tool_info": tool_info,
+        "query_result": query_result.head(HISTORY_RESULT_ROWS) if query_result is not None else None})
 
 
 def load_agent_sessions(session, schema: str, user_id: str, limit: int = 15) -> List[Dict]:
@@ -262,30 +446,27 @@ def load_agent_sessions(session, schema: str, user_id: str, limit: int = 15) ->
         return []
 
 
-def load_agent_messages(session, schema: str, session_id: str) -> List[Dict]:
+def load_agent_messages(session, schema: str, session_id: str,
+                        before: Dict = None) -> Tuple[List[Dict], bool]:
+    """Page of the messages of a session, see _history_page_sql."""
+    if before is None:
+        # Include the messages still queued for writing
+        get_history_writer(session).wait()
     try:
-        sql = f"""
-        SELECT message_id, role, content, tool_info, query_result
-        FROM {schema}.AGENT_CHAT_MESSAGES
-        WHERE session_id = '{session_id}' ORDER BY created_at ASC
-        """
-        result = session.sql(sql).collect()
-        msgs = []
-        for r in result:
-            msg = {"message_id": r['MESSAGE_ID'], "role": r['ROLE'], "content": r['CONTENT']}
-            if r['TOOL_INFO']:
-                try: msg["tool_info"] = json.loads(r['TOOL_INFO'])
-                except: pass
-            if r['QUERY_RESULT']:
-                try: msg["data"] = pd.read_json(r['QUERY_RESULT'])
-                except: pass
-            msgs.append(msg)
-        return msgs
+        result = session.sql(_history_page_sql(
+            f"{schema}.AGENT_CHAT_MESSAGES", "message_id, role, content, tool_info, query_result",
+            session_id, before)).collect()
+        msgs = [{"message_id": r['MESSAGE_ID'], "role": r['ROLE'], "content": r['CONTENT'],
+                 "created_at": r['CREATED_AT'], "tool_info_json": r['TOOL_INFO'], "data_json": r['QUERY_RESULT']}
+                for r in result[:HISTORY_PAGE_SIZE]]
+        return msgs[::-1], len(result) > HISTORY_PAGE_SIZE
     except:
-        return []
+        return [], False
 
 
 def delete_agent_session(session, schema: str, session_id: str) -> bool:
+    # Include the messages still queued for writing
+    get_history_writer(session).wait()
     try:
         session.sql(f"DELETE FROM {schema}.AGENT_CHAT_MESSAGES WHERE session_id = '{session_id}'").collect()
         session.sql(f"DELETE FROM {schema}.AGENT_CHAT_SESSIONS WHERE session_id = '{session_id}'").collect()
@@ -296,48 +477,17 @@ def delete_agent_session(session, schema: str, session_id: str) -> bool:
 
 # Insights history functions
 def save_insights_session(session, schema: str, session_id: str, user_id: str, 
-                          title: str, semantic_model: str = None) -> bool:
-    try:
-        sql = f"""
-        MERGE INTO {schema}.INSIGHTS_SESSIONS t
-        USING (SELECT '{session_id}' as session_id) s
-        ON t.session_id = s.session_id
-        WHEN MATCHED THEN UPDATE SET
-            updated_at = CURRENT_TIMESTAMP(),
-            title = '{title.replace("'", "''")}',
-            message_count = (SELECT COUNT(*) FROM {schema}.INSIGHTS_MESSAGES WHERE session_id = '{session_id}')
-        WHEN NOT MATCHED THEN INSERT (session_id, user_id, title, semantic_model_name)
-        VALUES ('{session_id}', '{user_id}', '{title.replace("'", "''")}', 
-                {f"'{semantic_model}'" if semantic_model else 'NULL'})
-        """
-        session.sql(sql).collect()
-        return True
-    except:
-        return False
+                          title: str, semantic_model: str = None):
+    get_history_writer(session).save_session("insights", schema, session_id, user_id, title, semantic_model)
 
 
 def save_insights_message(session, schema: str, session_id: str, message_id: str,
                           role: str, content: str, sql_query: str = None,
-                          query_result: pd.DataFrame = None, insights: str = None) -> bool:
-    try:
-        escaped = content.replace("'", "''").replace("\\", "\\\\") if content else ""
-        sql_escaped = sql_query.replace("'", "''") if sql_query else None
-        insights_escaped = insights.replace("'", "''") if insights else None
-        result_json = None
-        if query_result is not None and len(query_result) > 0:
-            result_json = query_result.head(50).to_json(orient='records', force_ascii=False).replace("'", "''")
-        
-        sql = f"""
-        INSERT INTO {schema}.INSIGHTS_MESSAGES (message_id, session_id, role, content, sql_query, query_result, insights)
-        VALUES ('{message_id}', '{session_id}', '{role}', $${escaped}$$,
-                {f"$${sql_escaped}$$" if sql_escaped else 'NULL'},
-                {f"$${result_json}$$" if result_json else 'NULL'},
-                {f"$${insights_escaped}$$" if insights_escaped else 'NULL'})
-        """
-        session.sql(sql).collect()
-        return True
-    except:
-        return False
+                          query_result: pd.DataFrame = None, insights: str = None):
+    get_history_writer(session).save_message("insights", schema, session_id, {
+        "message_id": message_id, "role": role, "content": content or "", "sql_query": sql_query,
+        "query_result": query_result.head(HISTORY_RESULT_ROWS) if query_result is not None else None,
+        "insights": insights})
 
 
 def load_insights_sessions(session, schema: str, user_id: str, limit: int = 15) -> List[Dict]:
@@ -355,28 +505,28 @@ def load_insights_sessions(session, schema: str, user_id: str, limit: int = 15)
         return []
 
 
-def load_insights_messages(session, schema: str, session_id: str) -> List[Dict]:
+def load_insights_messages(session, schema: str, session_id: str,
+                           before: Dict = None) -> Tuple[List[Dict], bool]:
+    """Page of the messages of a session, see _history_page_sql."""
+    if before is None:
+        # Include the messages still queued for writing
+        get_history_writer(session).wait()
     try:
-        sql = f"""
-        SELECT message_id, role, content, sql_query, query_result, insights
-        FROM {schema}.INSIGHTS_MESSAGES
-        WHERE session_id = '{session_id}' ORDER BY created_at ASC
-        """
-        result = session.sql(sql).collect()
-        msgs = []
-        for r in result:
-            msg = {"message_id": r['MESSAGE_ID'], "role": r['ROLE'], "content": r['CONTENT'],
-                   "sql_query": r['SQL_QUERY'], "insights": r['INSIGHTS']}
-            if r['QUERY_RESULT']:
-                try: msg["data"] = pd.read_json(r['QUERY_RESULT'])
-                except: pass
-            msgs.append(msg)
-        return msgs
+        result = session.sql(_history_page_sql(
+            f"{schema}.INSIGHTS_MESSAGES", "message_id, role, content, sql_query, query_result, insights",
+            session_id, before)).collect()
+        msgs = [{"message_id": r['MESSAGE_ID'], "role": r['ROLE'], "content": r['CONTENT'],
+                 "created_at": r['CREATED_AT'], "sql_query": r['SQL_QUERY'], "insights": r['INSIGHTS'],
+                 "data_json": r['QUERY_RESULT']}
+                for r in result[:HISTORY_PAGE_SIZE]]
+        return msgs[::-1], len(result) > HISTORY_PAGE_SIZE
     except:
-        return []
+        return [], False
 
 
 def delete_insights_session(session, schema: str, session_id: str) -> bool:
+    # Include the messages still queued for writing
+    get_history_writer(session).wait()
     try:
         session.sql(f"DELETE FROM {schema}.INSIGHTS_MESSAGES WHERE session_id = '{session_id}'").collect()
         session.sql(f"DELETE FROM {schema}.INSIGHTS_SESSIONS WHERE session_id = '{session_id}'").collect()
@@ -430,6 +580,190 @@ def extract_tables_from_semantic_model(yaml_content: str) -> List[str]:
     return tables
 
 
+# ===============================
+# Schema Linking
+# ===============================
+# Prompts only include the tables/columns relevant to the question plus the joins between them.
+# BM25 over words, char trigrams and Chinese char unigrams/bigrams. This app cannot import
+# semantic_model_generator, so this mirrors semantic_model_generator/data_processing/schema_linking.py.
+SCHEMA_LINK_MAX_TABLES = 5
+SCHEMA_LINK_MAX_COLUMNS = 30
+_COLUMN_SECTIONS = ("columns", "dimensions", "time_dimensions", "measures", "facts", "metrics")
+
+
+def _tokenize(text: str) -> List[str]:
+    import re
+    import unicodedata
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens = []
+    for word in re.findall(r"[a-z0-9]+", text):
+        tokens.append(word)
+        if len(word) > 4:
+            tokens.extend(f"#{word[i:i + 3]}" for i in range(len(word) - 2))
+    for run in re.findall("[\u3400-\u4dbf\u4e00-\u9fff]+", text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _entry_text(entry: Dict, keys: Tuple[str, ...]) -> str:
+    parts = []
+    for k in keys:
+        v = entry.get(k)
+        if isinstance(v, list):
+            parts.extend(str(x) for x in v)
+        elif v is not None:
+            parts.append(str(v))
+    return " ".join(parts)
+
+
+def _bm25_index(docs: List[List[str]]) -> Dict[str, Any]:
+    import math
+    from collections import Counter
+    tfs = [Counter(d) for d in docs]
+    dfs = Counter()
+    for tf in tfs:
+        dfs.update(tf.keys())
+    n = len(docs)
+    return {
+        "tfs": tfs,
+        "lens": [len(d) for d in docs],
+        "avg": (sum(len(d) for d in docs) / n) if n else 0.0,
+        "idf": {t: math.log(1 + (n - df + 0.5) / (df + 0.5)) for t, df in dfs.items()},
+    }
+
+
+def _bm25_scores(index: Dict[str, Any], query: List[str], k1: float = 1.2, b: float = 0.75) -> List[float]:
+    terms = [t for t in set(query) if t in index["idf"]]
+    scores = []
+    for tf, dl in zip(index["tfs"], index["lens"]):
+        norm = k1 * (1 - b + b * dl / (index["avg"] or 1))
+        scores.append(sum(index["idf"][t] * tf[t] * (k1 + 1) / (tf[t] + norm) for t in terms if tf.get(t)))
+    return scores
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def build_schema_index(yaml_content: str) -> Dict[str, Any]:
+    model = parse_semantic_model(yaml_content) or {}
+    tables = model.get("tables") or []
+    columns, column_docs = [], []
+    for i, t in enumerate(tables):
+        for sec in _COLUMN_SECTIONS:
+            for j, c in enumerate(t.get(sec) or []):
+                columns.append((i, sec, j))
+                column_docs.append(_tokenize(_entry_text(c, ("name", "synonyms", "description", "expr", "sample_values"))))
+    return {
+        "model": model,
+        "tables": _bm25_index([_tokenize(_entry_text(t, ("name", "synonyms", "description"))) for t in tables]),
+        "columns": _bm25_index(column_docs),
+        "column_refs": columns,
+        # Tables kept whole are rendered with this text in every linked model, so prompts can reference them
+        "table_yamls": [_yaml_dump([t]) for t in tables],
+    }
+
+
+def _yaml_dump(data) -> str:
+    import yaml
+    return yaml.safe_dump(data, allow_unicode=True, sort_keys=False)
+
+
+def prompt_contexts(yaml_content: Optional[str]) -> Tuple[str, ...]:
+    """Parts of prompts that are the same for every question: the full model and the YAML of each table."""
+    if not yaml_content:
+        return ()
+    try:
+        return (yaml_content, *build_schema_index(yaml_content)["table_yamls"])
+    except Exception:
+        return (yaml_content,)
+
+
+def _join_path(graph: Dict[str, List], connected: set, target: str) -> Optional[Tuple[List[str], List[int]]]:
+    from collections import deque
+    parents = {t: None for t in connected}
+    queue = deque(connected)
+    while queue:
+        node = queue.popleft()
+        if node == target:
+            path_tables, path_rels = [], []
+            while parents[node] is not None:
+                path_tables.append(node)
+                path_rels.append(parents[node][1])
+                node = parents[node][0]
+            return path_tables, path_rels
+        for nb, rel in graph.get(node, []):
+            if nb not in parents:
+                parents[nb] = (node, rel)
+                queue.append(nb)
+    return None
+
+
+def link_schema(yaml_content: str, question: str) -> str:
+    """Returns the semantic model YAML pruned to the parts relevant to the question (full YAML if nothing matches)."""
+    try:
+        index = build_schema_index(yaml_content)
+        model = index["model"]
+        tables = model.get("tables") or []
+        query = _tokenize(question)
+        col_scores = {ref: sc for ref, sc in zip(index["column_refs"], _bm25_scores(index["columns"], query)) if sc > 0}
+        table_scores = _bm25_scores(index["tables"], query)
+        per_table = {}
+        for (i, _, _), sc in col_scores.items():
+            per_table.setdefault(i, []).append(sc)
+        for i, scs in per_table.items():
+            table_scores[i] += sum(sorted(scs, reverse=True)[:3])
+        ranked = sorted((i for i, sc in enumerate(table_scores) if sc > 0), key=lambda i: -table_scores[i])[:SCHEMA_LINK_MAX_TABLES]
+        if not ranked:
+            return yaml_content
+
+        names = [t.get("name") for t in tables]
+        rels = model.get("relationships") or []
+        graph = {}
+        for k, r in enumerate(rels):
+            graph.setdefault(r.get("left_table"), []).append((r.get("right_table"), k))
+            graph.setdefault(r.get("right_table"), []).append((r.get("left_table"), k))
+        selected, rel_ids = [names[ranked[0]]], set()
+        for i in ranked[1:]:
+            if names[i] in selected:
+                continue
+            path = _join_path(graph, set(selected), names[i])
+            if path is None:
+                selected.append(names[i])
+                continue
+            selected.extend(t for t in reversed(path[0]) if t not in selected)
+            rel_ids.update(path[1])
+        kept_rels = [r for k, r in enumerate(rels) if k in rel_ids]
+        join_cols = {}
+        for r in kept_rels:
+            for key in r.get("relationship_columns") or []:
+                join_cols.setdefault(r.get("left_table"), set()).add(key.get("left_column"))
+                join_cols.setdefault(r.get("right_table"), set()).add(key.get("right_column"))
+
+        table_texts = []
+        for name in selected:
+            i = names.index(name)
+            t = tables[i]
+            if sum(len(t.get(sec) or []) for sec in _COLUMN_SECTIONS) <= SCHEMA_LINK_MAX_COLUMNS:
+                table_texts.append(index["table_yamls"][i])
+                continue
+            required = set(join_cols.get(name, set())) | set((t.get("primary_key") or {}).get("columns") or [])
+            best = sorted(((sc, ref) for ref, sc in col_scores.items() if ref[0] == i), reverse=True)
+            keep = {ref for _, ref in best[:SCHEMA_LINK_MAX_COLUMNS]}
+            pt = {k: v for k, v in t.items() if k not in _COLUMN_SECTIONS}
+            for sec in _COLUMN_SECTIONS:
+                cols = [c for j, c in enumerate(t.get(sec) or []) if (i, sec, j) in keep or c.get("name") in required]
+                if cols:
+                    pt[sec] = cols
+            table_texts.append(_yaml_dump([pt]))
+
+        header = {k: v for k, v in model.items() if k not in ("tables", "relationships", "verified_queries")}
+        text = (_yaml_dump(header) if header else "") + "tables:\n" + "".join(table_texts)
+        if kept_rels:
+            text += _yaml_dump({"relationships": kept_rels})
+        return text
+    except Exception:
+        return yaml_content
+
+
 # ===============================
 # Styles
 # ===============================
@@ -480,7 +814,64 @@ DEFAULT_MODEL = "qwen-max"
 # ===============================
 # LLM Calls
 # ===============================
-def call_llm(conn, model: str, prompt: str, system_prompt: str = None) -> str:
+# Contexts shorter than this are cheaper to inline than to register
+MIN_PROMPT_REFERENCE_CHARS = 1000
+
+
+def _sql_literal(text: str) -> str:
+    return "'" + text.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def _register_prompt_context(table: str, context: str) -> str:
+    context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+    registered = st.session_state.setdefault("registered_prompt_contexts", set())
+    if context_hash not in registered:
+        get_snowpark_session().sql(f"""
+        MERGE INTO {table} t
+        USING (SELECT '{context_hash}' AS context_hash, {_sql_literal(context)} AS content) s
+        ON t.context_hash = s.context_hash
+        WHEN NOT MATCHED THEN INSERT (context_hash, content) VALUES (s.context_hash, s.content)
+        """).collect()
+        registered.add(context_hash)
+    return f"(SELECT content FROM {table} WHERE context_hash = '{context_hash}')"
+
+
+def _prompt_expr(prompt: str, contexts: Tuple[str, ...] = ()) -> str:
+    """
+    Prompt as a SQL expression. With chat history configured, large contexts such as the semantic model or the YAML
+    of its tables (see prompt_contexts) are registered once per content hash in PROMPT_CONTEXTS and referenced by
+    hash, so that they are not inlined in the statement of every call.
+    """
+    contexts = sorted({c for c in contexts if c and len(c) >= MIN_PROMPT_REFERENCE_CHARS and c in prompt},
+                      key=len, reverse=True)
+    if (not contexts or not st.session_state.get("history_configured")
+            or st.session_state.get("prompt_contexts_unavailable")):
+        return _sql_literal(prompt)
+    table = f"{st.session_state.history_schema}.PROMPT_CONTEXTS"
+    # Literal text and (True, context) references, splitting on the longest contexts first
+    segments = [(False, prompt)]
+    for context in contexts:
+        split = []
+        for is_ref, text in segments:
+            if is_ref or context not in text:
+                split.append((is_ref, text))
+                continue
+            for k, part in enumerate(text.split(context)):
+                if k:
+                    split.append((True, context))
+                split.append((False, part))
+        segments = split
+    try:
+        parts = [_register_prompt_context(table, text) if is_ref else _sql_literal(text)
+                 for is_ref, text in segments if is_ref or text]
+    except Exception:
+        # E.g. no privileges to create the table, stop trying for this session
+        st.session_state["prompt_contexts_unavailable"] = True
+        return _sql_literal(prompt)
+    return f"CONCAT({', '.join(parts)})" if len(parts) > 1 else parts[0]
+
+
+def call_llm(conn, model: str, prompt: str, system_prompt: str = None, contexts: Tuple[str, ...] = ()) -> str:
     backend = st.session_state.get("model_backend", DEFAULT_BACKEND)
     udf = MODEL_BACKENDS[backend]["udf"]
     
@@ -489,21 +880,83 @@ def call_llm(conn, model: str, prompt: str, system_prompt: str = None) -> str:
     else:
         full = prompt
     
-    escaped = full.replace("'", "''").replace("\\", "\\\\")
+    prompt_expr = _prompt_expr(full, contexts)
     
     try:
         if backend == "SPCS (Local)":
             session = get_snowpark_session()
-            result = session.sql(f"SELECT {udf}($${escaped}$$)").collect()
+            result = session.sql(f"SELECT {udf}({prompt_expr})").collect()
         else:
             cursor = conn.cursor()
-            cursor.execute(f"SELECT {udf}('{model}', $${escaped}$$)")
+            cursor.execute(f"SELECT {udf}('{model}', {prompt_expr})")
             result = [cursor.fetchone()]
         return result[0][0] if result and result[0][0] else ""
     except Exception as e:
         return f"Error: {str(e)}"
 
 
+def _stream_endpoint() -> Optional[Tuple[str, Dict[str, str]]]:
+    """OpenAI compatible endpoint set in the sidebar, e.g. DashScope compatible-mode or the SPCS proxy."""
+    url = (st.session_state.get("stream_endpoint") or "").strip().rstrip("/")
+    if not url:
+        return None
+    key = (st.session_state.get("stream_api_key") or "").strip()
+    headers = {"Content-Type": "application/json", "Accept": "text/event-stream"}
+    if key:
+        if st.session_state.get("model_backend") == "SPCS (Local)":
+            headers["Authorization"] = f'Snowflake Token="{key}"'
+        else:
+            headers["Authorization"] = f"Bearer {key}"
+    return url, headers
+
+
+def _sse_content(resp) -> Iterator[str]:
+    for raw in resp:
+        line = raw.decode("utf-8").strip()
+        if not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return
+        try:
+            choices = json.loads(data).get("choices") or []
+        except json.JSONDecodeError:
+            continue
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def stream_llm(conn, model: str, prompt: str, system_prompt: str = None) -> Iterator[str]:
+    """
+    Streams the completion for st.write_stream from the endpoint set in the sidebar. Without an endpoint, or if the
+    stream fails before the first chunk, yields the blocking call_llm response at once.
+    """
+    endpoint = _stream_endpoint()
+    if endpoint:
+        url, headers = endpoint
+        messages = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        messages.append({"role": "user", "content": prompt})
+        payload = {"messages": messages, "stream": True}
+        if st.session_state.get("model_backend") != "SPCS (Local)":
+            payload["model"] = model  # The SPCS proxy fills in the model it serves
+        req = urllib.request.Request(f"{url}/chat/completions", data=json.dumps(payload).encode("utf-8"),
+                                     headers=headers, method="POST")
+        received = False
+        try:
+            with urllib.request.urlopen(req, timeout=60) as resp:
+                for chunk in _sse_content(resp):
+                    received = True
+                    yield chunk
+            return
+        except Exception as e:
+            if received:
+                yield f"\n\nError: {str(e)}"
+                return
+    yield call_llm(conn, model, prompt, system_prompt)
+
+
 # ===============================
 # Database Operations
 # ===============================
@@ -550,6 +1003,124 @@ def execute_sql(conn, sql: str) -> Dict[str, Any]:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+
+# ===============================
+# SQL Guard
+# ===============================
+# LLM generated SQL is checked with sqlglot before it runs: only a single read-only query over the base tables and
+# columns of the semantic model passes, and LIMIT is added or clamped. Errors come back as a list so the LLM can fix
+# the SQL without a warehouse round trip. Mirrors semantic_model_generator/validate/sql_guard.py.
+SQL_GUARD_DEFAULT_LIMIT = 100
+SQL_GUARD_MAX_LIMIT = 1000
+
+
+def _guard_tables(yaml_content: str) -> Dict[str, Dict[str, str]]:
+    """{DB.SCHEMA.TABLE: {COLUMN: type}} of the columns that the model's expressions use, cached per model."""
+    cache = st.session_state.setdefault("sql_guard_tables", {})
+    key = hashlib.sha256(yaml_content.encode("utf-8")).hexdigest()
+    if key in cache:
+        return cache[key]
+    import sqlglot
+    from sqlglot import exp
+    tables: Dict[str, Dict[str, str]] = {}
+    model = parse_semantic_model(yaml_content)
+    for t in (model.get("tables") or []) if isinstance(model, dict) else []:
+        bt = t.get("base_table") or {}
+        if not (bt.get("database") and bt.get("schema") and bt.get("table")):
+            continue
+        fqn = ".".join(str(bt[k]).strip('"').upper() for k in ("database", "schema", "table"))
+        columns = tables.setdefault(fqn, {})
+        for section in _COLUMN_SECTIONS:
+            for c in t.get(section) or []:
+                try:
+                    parsed = sqlglot.parse_one(str(c.get("expr") or ""), read="snowflake")
+                except Exception:
+                    continue
+                for col in parsed.find_all(exp.Column):
+                    columns.setdefault(col.name.upper(), str(c.get("data_type") or "VARCHAR"))
+    cache[key] = tables
+    return tables
+
+
+def guard_sql(sql: str, yaml_content: str = None) -> Tuple[str, List[str]]:
+    """
+    Returns (SQL to run, errors). Without a semantic model only the statement type and LIMIT are checked. Without
+    sqlglot installed the SQL is returned unchecked.
+    """
+    try:
+        import sqlglot
+        from sqlglot import exp
+        from sqlglot.optimizer.qualify import qualify
+        from sqlglot.schema import MappingSchema
+    except ImportError:
+        return sql, []
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="snowflake") if s is not None]
+    except Exception as e:
+        details = getattr(e, "errors", None)
+        msg = "; ".join(f"{d.get('description')} (line {d.get('line')}, col {d.get('col')})"
+                        for d in details) if details else str(e)
+        return sql, [f"[parse_error] SQL cannot be parsed: {msg}"]
+    if len(statements) != 1:
+        return sql, ["[multiple_statements] Only a single SELECT query is allowed"]
+    query = statements[0]
+    if not isinstance(query, exp.Query) or query.find(
+            exp.DML, exp.DDL, exp.Drop, exp.AlterTable, exp.TruncateTable, exp.Command):
+        return sql, [f"[not_a_query] Only read-only SELECT queries are allowed, not {query.key.upper()}"]
+
+    tables = _guard_tables(yaml_content) if yaml_content else {}
+    if tables:
+        ctes = {cte.alias_or_name.upper() for cte in query.find_all(exp.CTE)}
+        resolved = query.copy()
+        errors = []
+        for t in resolved.find_all(exp.Table):
+            if not isinstance(t.this, exp.Identifier) or (not t.db and t.name.upper() in ctes):
+                continue
+            parts = [p.upper() for p in (t.catalog, t.db, t.name) if p]
+            matches = [fqn for fqn in tables if fqn.split(".")[-len(parts):] == parts]
+            if len(matches) == 1:
+                db, sch, name = matches[0].split(".")
+                t.set("catalog", exp.to_identifier(db))
+                t.set("db", exp.to_identifier(sch))
+                t.set("this", exp.to_identifier(name))
+            else:
+                errors.append(f"[unknown_table] Table '{t.sql(dialect='snowflake')}' is "
+                              f"{'ambiguous' if matches else 'not in the semantic model'}, "
+                              f"available tables: {', '.join(sorted(tables))}")
+        if errors:
+            return sql, errors
+        nested: Dict[str, Dict[str, Dict[str, Dict[str, str]]]] = {}
+        for fqn, columns in tables.items():
+            db, sch, name = fqn.split(".")
+            nested.setdefault(db, {}).setdefault(sch, {})[name] = columns
+        try:
+            qualify(resolved, schema=MappingSchema(nested, dialect="snowflake"), dialect="snowflake",
+                    validate_qualify_columns=True)
+        except Exception as e:
+            # Only unresolvable columns are errors, the warehouse judges what sqlglot cannot resolve
+            if "could not be resolved" in str(e).lower():
+                return sql, [f"[unknown_column] {e}"]
+
+    limit = query.args.get("limit")
+    if limit is None and not (isinstance(query, exp.Select) and query.args.get("fetch")):
+        return query.limit(SQL_GUARD_DEFAULT_LIMIT).sql(dialect="snowflake"), []
+    value = limit.expression if limit is not None else None
+    if isinstance(value, exp.Literal) and value.is_int and int(value.name) > SQL_GUARD_MAX_LIMIT:
+        return query.limit(SQL_GUARD_MAX_LIMIT).sql(dialect="snowflake"), []
+    return sql, []
+
+
+def execute_guarded_sql(conn, sql: str, yaml_content: str = None) -> Dict[str, Any]:
+    """Runs LLM generated SQL if it passes guard_sql. The SQL that ran is returned as "sql"."""
+    if st.session_state.get("sql_guard", True):
+        sql, errors = guard_sql(sql, yaml_content)
+        if errors:
+            return {"success": False, "error": "SQL check failed:\n" + "\n".join(errors),
+                    "guard_errors": errors, "sql": sql}
+    result = execute_sql(conn, sql)
+    result["sql"] = sql
+    return result
+
 def get_table_info(conn, table: str) -> Dict[str, Any]:
     try:
         cursor = conn.cursor()
@@ -607,6 +1178,8 @@ def parse_response(text: str) -> Dict:
 
 def run_agent(conn, question: str, context: Dict) -> Dict:
     sem = context.get("semantic_model")
+    if sem:
+        sem = link_schema(sem, question)
     sys_prompt = AGENT_SYSTEM.format(semantic=format_semantic_for_prompt(sem) if sem else "No semantic model loaded.")
     history = format_history_for_prompt(context.get("messages", []))
     
@@ -615,14 +1188,19 @@ def run_agent(conn, question: str, context: Dict) -> Dict:
         df = context["last_result"]
         ctx = f"\n[Context: Last query returned {len(df)} rows, columns: {', '.join(df.columns[:8])}]\n"
     
+    if context.get("sql_errors"):
+        ctx += (f"\n[Your previous SQL failed the pre-execution check, fix it]:\n{context['failed_sql']}\n"
+                + "\n".join(context["sql_errors"]) + "\n")
+    
     prompt = f"{history}{ctx}\n[Question]: {question}"
-    response = call_llm(conn, st.session_state.get("selected_model", DEFAULT_MODEL), prompt, sys_prompt)
+    response = call_llm(conn, st.session_state.get("selected_model", DEFAULT_MODEL), prompt, sys_prompt,
+                        contexts=prompt_contexts(context.get("semantic_model")))
     return parse_response(response)
 
 
-def execute_tool(conn, name: str, params: Dict) -> Dict:
+def execute_tool(conn, name: str, params: Dict, semantic: str = None) -> Dict:
     if name == "execute_sql":
-        return execute_sql(conn, params.get("sql", ""))
+        return execute_guarded_sql(conn, params.get("sql", ""), semantic)
     elif name == "get_table_info":
         return get_table_info(conn, params.get("table_name", ""))
     return {"success": False, "error": f"Unknown tool: {name}"}
@@ -643,6 +1221,8 @@ Rules:
 
 def generate_sql(conn, question: str, context: Dict) -> str:
     sem = context.get("semantic_model", "")
+    if sem:
+        sem = link_schema(sem, question)
     sys = INSIGHTS_SYSTEM.format(semantic=f"```yaml\n{sem}\n```" if sem else "No model")
     
     history = ""
@@ -656,9 +1236,22 @@ def generate_sql(conn, question: str, context: Dict) -> str:
                 history += f"SQL used: {m['sql_query'][:200]}\n"
     
     prompt = f"{history}\nCurrent question: {question}\n\nGenerate SQL:"
-    response = call_llm(conn, st.session_state.get("selected_model", DEFAULT_MODEL), prompt, sys)
+    model = st.session_state.get("selected_model", DEFAULT_MODEL)
+    contexts = prompt_contexts(context.get("semantic_model"))
+    sql = _clean_sql(call_llm(conn, model, prompt, sys, contexts=contexts))
     
-    # Clean response
+    # Fix SQL that fails the pre-execution check once, before it reaches the warehouse
+    if st.session_state.get("sql_guard", True):
+        guarded, errors = guard_sql(sql, context.get("semantic_model"))
+        if not errors:
+            return guarded
+        fix_prompt = (f"{prompt}\n\nPrevious SQL:\n{sql}\n\nIt failed these checks:\n"
+                      + "\n".join(errors) + "\n\nReturn the fixed SQL:")
+        sql = _clean_sql(call_llm(conn, model, fix_prompt, sys, contexts=contexts))
+    return sql
+
+
+def _clean_sql(response: str) -> str:
     sql = response.strip()
     if "```" in sql:
         lines = []
@@ -686,7 +1279,7 @@ ANALYSIS_SYSTEM = """Analyze the data and provide business insights.
 3. **Recommended Actions** (2-3 concrete, actionable next steps the user can take based on this data, such as: investigate specific anomalies, set up alerts, adjust strategy, create reports, etc.)"""
 
 
-def generate_insights(conn, df: pd.DataFrame, question: str, semantic: str = None) -> str:
+def _insights_prompt(df: pd.DataFrame, question: str, semantic: str = None) -> str:
     summary = f"Question: {question}\nRows: {len(df)}, Columns: {list(df.columns)}\n"
     summary += f"Sample:\n{df.head(5).to_string()}\n"
     if len(df) > 0:
@@ -696,11 +1289,21 @@ def generate_insights(conn, df: pd.DataFrame, question: str, semantic: str = Non
     if semantic:
         ctx += f"\nSemantic Model:\n{semantic[:1500]}"
     
-    sys = ANALYSIS_SYSTEM.format(context=ctx)
+    return ANALYSIS_SYSTEM.format(context=ctx)
+
+
+def generate_insights(conn, df: pd.DataFrame, question: str, semantic: str = None) -> str:
+    sys = _insights_prompt(df, question, semantic)
     return call_llm(conn, st.session_state.get("selected_model", DEFAULT_MODEL), 
                     "Analyze this data and provide insights", sys)
 
 
+def stream_insights(conn, df: pd.DataFrame, question: str, semantic: str = None) -> Iterator[str]:
+    sys = _insights_prompt(df, question, semantic)
+    return stream_llm(conn, st.session_state.get("selected_model", DEFAULT_MODEL),
+                      "Analyze this data and provide insights", sys)
+
+
 # ===============================
 # UI Components
 # ===============================
@@ -716,6 +1319,28 @@ def render_data(df: pd.DataFrame, title: str = "Results"):
     st.dataframe(df, use_container_width=True, height=min(350, 35 * len(df) + 40))
 
 
+def render_message_data(msg: Dict, title: str = "Results"):
+    """Query result of a message. Results loaded from history are only parsed and shown once the user asks."""
+    if msg.get("data_json"):
+        if st.toggle(f"📊 {title}", key=f"show_data_{msg['message_id']}"):
+            df = message_data(msg)
+            if df is not None:
+                render_data(df, title)
+    elif msg.get("data") is not None:
+        render_data(msg["data"], title)
+
+
+def render_older_messages_button(key: str, load_page) -> None:
+    """Loads the page of messages before the oldest one shown, see HISTORY_PAGE_SIZE."""
+    messages = st.session_state[f"{key}_messages"]
+    if st.session_state.get(f"{key}_history_more") and messages:
+        if st.button("⬆️ Load earlier messages", key=f"{key}_older", use_container_width=True):
+            older, more = load_page(messages[0])
+            st.session_state[f"{key}_messages"] = older + messages
+            st.session_state[f"{key}_history_more"] = more
+            st.rerun()
+
+
 # ===============================
 # Main Application
 # ===============================
@@ -738,6 +1363,7 @@ def main():
         "history_schema": None, "history_configured": False,
         "agent_session_id": str(uuid.uuid4()), "agent_messages": [], "agent_last_result": None,
         "insights_session_id": str(uuid.uuid4()), "insights_messages": [], "insights_last_result": None,
+        "agent_history_more": False, "insights_history_more": False,
     }
     for k, v in defaults.items():
         if k not in st.session_state:
@@ -775,6 +1401,9 @@ def main():
                             st.error("Failed to create tables")
         else:
             st.success(f"📁 {st.session_state.history_schema.split('.')[-1]}")
+            history_error = get_history_writer(sp_session).last_error
+            if history_error:
+                st.caption(f"⚠️ History not saved yet: {history_error[:120]}")
             
             # New chat buttons
             col1, col2 = st.columns(2)
@@ -782,12 +1411,14 @@ def main():
                 if st.button("➕ New Agent", use_container_width=True):
                     st.session_state.agent_session_id = str(uuid.uuid4())
                     st.session_state.agent_messages = []
+                    st.session_state.agent_history_more = False
                     st.session_state.agent_last_result = None
                     st.rerun()
             with col2:
                 if st.button("➕ New Insights", use_container_width=True):
                     st.session_state.insights_session_id = str(uuid.uuid4())
                     st.session_state.insights_messages = []
+                    st.session_state.insights_history_more = False
                     st.session_state.insights_last_result = None
                     st.rerun()
             
@@ -800,7 +1431,8 @@ def main():
                     with cols[0]:
                         if st.button(f"💬 {title}", key=f"ag_{s['session_id']}", use_container_width=True):
                             st.session_state.agent_session_id = s["session_id"]
-                            st.session_state.agent_messages = load_agent_messages(sp_session, st.session_state.history_schema, s["session_id"])
+                            st.session_state.agent_messages, st.session_state.agent_history_more = \
+                                load_agent_messages(sp_session, st.session_state.history_schema, s["session_id"])
                             st.rerun()
                     with cols[1]:
                         if st.button("🗑️", key=f"agd_{s['session_id']}"):
@@ -815,7 +1447,8 @@ def main():
                     with cols[0]:
                         if st.button(f"📊 {title}", key=f"in_{s['session_id']}", use_container_width=True):
                             st.session_state.insights_session_id = s["session_id"]
-                            st.session_state.insights_messages = load_insights_messages(sp_session, st.session_state.history_schema, s["session_id"])
+                            st.session_state.insights_messages, st.session_state.insights_history_more = \
+                                load_insights_messages(sp_session, st.session_state.history_schema, s["session_id"])
                             st.rerun()
                     with cols[1]:
                         if st.button("🗑️", key=f"ind_{s['session_id']}"):
@@ -882,6 +1515,16 @@ def main():
             model = st.selectbox("Model", list(models.keys()), format_func=lambda x: models[x], key="model")
             st.session_state.selected_model = model
         
+        with st.expander("⚡ Streaming"):
+            st.text_input("Endpoint", key="stream_endpoint",
+                          placeholder="https://dashscope.aliyuncs.com/compatible-mode/v1",
+                          help="OpenAI compatible endpoint to stream insights from. Leave empty to use the UDF.")
+            st.text_input("API key / token", key="stream_api_key", type="password")
+        
+        st.toggle("🛡️ Check SQL before running", value=True, key="sql_guard",
+                  help="Only run read-only queries over the semantic model's tables and columns, with LIMIT "
+                       f"{SQL_GUARD_DEFAULT_LIMIT} added (or clamped to {SQL_GUARD_MAX_LIMIT}). Needs sqlglot.")
+        
         st.markdown("---")
         st.caption(f"v{APP_VERSION}")
     
@@ -896,10 +1539,11 @@ def main():
             st.warning("Load a semantic model for best results")
         
         # Messages
+        render_older_messages_button("agent", lambda before: load_agent_messages(
+            sp_session, st.session_state.history_schema, st.session_state.agent_session_id, before))
         for msg in st.session_state.agent_messages:
-            render_msg(msg["role"], msg["content"], msg.get("tool_info"))
-            if msg.get("data") is not None:
-                render_data(msg["data"])
+            render_msg(msg["role"], msg["content"], message_tool_info(msg))
+            render_message_data(msg)
         
         # Input
         def submit_agent():
@@ -949,7 +1593,21 @@ def main():
                 asst_msg["tool_info"] = {"name": name, "parameters": params}
                 
                 with st.spinner(f"🔧 {name}..."):
-                    result = execute_tool(conn, name, params)
+                    result = execute_tool(conn, name, params, st.session_state.semantic_model)
+                
+                if result.get("guard_errors"):
+                    # The SQL failed locally, let the agent fix it once
+                    with st.spinner("🔁 Fixing SQL..."):
+                        resp = run_agent(conn, question, {**ctx, "sql_errors": result["guard_errors"],
+                                                          "failed_sql": params.get("sql", "")})
+                    if resp.get("tool_call"):
+                        thought = resp.get("thought", thought)
+                        name, params = resp["tool_call"].get("name"), resp["tool_call"].get("parameters", {})
+                        asst_msg["tool_info"] = {"name": name, "parameters": params}
+                        with st.spinner(f"🔧 {name}..."):
+                            result = execute_tool(conn, name, params, st.session_state.semantic_model)
+                if result.get("sql"):
+                    asst_msg["tool_info"]["parameters"] = {**params, "sql": result["sql"]}
                 
                 if result.get("success"):
                     if "data" in result:
@@ -972,9 +1630,6 @@ def main():
                 save_agent_message(sp_session, st.session_state.history_schema,
                                   st.session_state.agent_session_id, asst_msg["message_id"],
                                   "assistant", asst_msg["content"], asst_msg.get("tool_info"), asst_msg.get("data"))
-                save_agent_session(sp_session, st.session_state.history_schema,
-                                  st.session_state.agent_session_id, user_id,
-                                  generate_title(st.session_state.agent_messages[0]["content"]))
             
             st.rerun()
     
@@ -986,6 +1641,8 @@ def main():
             st.warning("Load a semantic model for best results")
         
         # Show conversation history
+        render_older_messages_button("insights", lambda before: load_insights_messages(
+            sp_session, st.session_state.history_schema, st.session_state.insights_session_id, before))
         for msg in st.session_state.insights_messages:
             if msg["role"] == "user":
                 st.markdown(f'<div class="user-message">{msg["content"]}</div>', unsafe_allow_html=True)
@@ -994,8 +1651,7 @@ def main():
                 if msg.get("sql_query"):
                     with st.expander("📝 SQL Query"):
                         st.code(msg["sql_query"], language="sql")
-                if msg.get("data") is not None:
-                    render_data(msg["data"], "Query Results")
+                render_message_data(msg, "Query Results")
                 if msg.get("insights"):
                     st.markdown('<div class="insights-card">', unsafe_allow_html=True)
                     st.markdown("### 💡 AI Insights")
@@ -1049,7 +1705,8 @@ def main():
             
             # Execute query
             with st.spinner("⚡ Executing query..."):
-                result = execute_sql(conn, sql)
+                result = execute_guarded_sql(conn, sql, st.session_state.semantic_model)
+            sql = asst_msg["sql_query"] = result.get("sql", sql)
             
             if result["success"]:
                 df = result["data"]
@@ -1063,17 +1720,10 @@ def main():
                 st.markdown(f"**Query Results** ({result['row_count']} rows)")
                 st.dataframe(df, use_container_width=True, height=min(350, 35 * len(df) + 40))
                 
-                # Now generate insights with spinner
-                insights_placeholder = st.empty()
-                with insights_placeholder.container():
-                    with st.spinner("💡 Generating insights..."):
-                        insights = generate_insights(conn, df, question, st.session_state.semantic_model)
-                
-                # Display insights
-                insights_placeholder.empty()
+                # Stream insights as they are generated (all at once without a streaming endpoint)
                 st.markdown('<div class="insights-card">', unsafe_allow_html=True)
                 st.markdown("### 💡 AI Insights")
-                st.markdown(insights)
+                insights = st.write_stream(stream_insights(conn, df, question, st.session_state.semantic_model))
                 st.markdown('</div>', unsafe_allow_html=True)
                 asst_msg["insights"] = insights
             else:
@@ -1088,9 +1738,6 @@ def main():
                                      st.session_state.insights_session_id, asst_msg["message_id"],
                                      "assistant", asst_msg["content"], asst_msg.get("sql_query"),
                                      asst_msg.get("data"), asst_msg.get("insights"))
-                save_insights_session(sp_session, st.session_state.history_schema,
-                                     st.session_state.insights_session_id, user_id,
-                                     generate_title(st.session_state.insights_messages[0]["content"]))
             
             # Rerun to position input box after new content
             st.rerun()
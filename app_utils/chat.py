@@ -1,13 +1,42 @@
+import concurrent.futures
+import functools
 import json
 import os
 import re
 import uuid
-from typing import Any, Dict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import requests
 import streamlit as st
+from loguru import logger
 from snowflake.connector import SnowflakeConnection
 
+from app_utils.response_cache import ResponseCache, create_response_cache, model_hash
+from semantic_model_generator.data_processing.cte_utils import (
+    context_to_column_format,
+    expand_all_logical_tables_as_ctes,
+)
+from semantic_model_generator.data_processing.proto_utils import yaml_to_semantic_model
+from semantic_model_generator.data_processing.schema_linking import (
+    SchemaIndex,
+    link_schema_yaml,
+)
+from semantic_model_generator.data_processing.verified_query_index import (
+    VerifiedQueryIndex,
+    VerifiedQueryMatch,
+)
+from semantic_model_generator.snowflake_utils import qwen_llm
+from semantic_model_generator.snowflake_utils.prompt_context import (
+    get_prompt_context_store,
+    prompt_sql,
+)
+from semantic_model_generator.validate.sql_guard import (
+    SqlGuardResult,
+    allowed_tables,
+    guard_sql,
+    with_catalog_columns,
+)
+
 def _get_snowpark_session():
     """Get Snowpark Session for SiS compatibility"""
     try:
@@ -72,7 +101,7 @@ QWEN_SQL_PROMPT_TEMPLATE = """你是一个专业的 SQL 专家。根据以下语
 {semantic_model}
 ```
 
-## 用户问题:
+{examples}## 用户问题:
 {question}
 
 ## 要求:
@@ -84,6 +113,49 @@ QWEN_SQL_PROMPT_TEMPLATE = """你是一个专业的 SQL 专家。根据以下语
 ## SQL 查询:
 """
 
+QWEN_STRUCTURED_PROMPT_TEMPLATE = """你是一个专业的 SQL 专家。根据以下语义模型和用户问题，生成正确的 Snowflake SQL 查询，并用一句中文简要解释这个查询做了什么。
+
+## 语义模型 (YAML 格式):
+```yaml
+{semantic_model}
+```
+
+{examples}## 用户问题:
+{question}
+
+## 要求:
+1. 使用语义模型中定义的表和列
+2. 确保 SQL 语法正确，适用于 Snowflake
+3. 只返回一个 JSON 对象，不要包含任何其他内容，格式为: {{"sql": "<SQL 查询>", "explanation": "<一句话解释>"}}
+4. 如果问题无法用给定的语义模型回答，返回: {{"cannot_answer": "<原因>"}}
+
+## JSON:
+"""
+
+QWEN_SQL_FIX_PROMPT_TEMPLATE = """你是一个专业的 SQL 专家。以下 SQL 查询没有通过执行前的检查，请根据语义模型修正它。
+
+## 语义模型 (YAML 格式):
+```yaml
+{semantic_model}
+```
+
+## 用户问题:
+{question}
+
+## 原 SQL:
+{sql}
+
+## 检查错误:
+{errors}
+
+## 要求:
+1. 只返回修正后的 SQL 查询，不要包含任何解释
+2. 只使用语义模型中定义的表和列
+3. 只能是一条只读的 SELECT 查询
+
+## SQL 查询:
+"""
+
 QWEN_EXPLANATION_PROMPT_TEMPLATE = """根据以下 SQL 查询，用中文简要解释这个查询做了什么：
 
 SQL: {sql}
@@ -126,14 +198,25 @@ def _get_qwen_udf_path() -> str:
     return "SNOWFLAKE_PROD_USER1.CORTEX_ANALYST.QWEN_COMPLETE"
 
 
-def _call_spcs_model(conn: SnowflakeConnection, model: str, prompt: str) -> str:
+def _prompt_sql(
+    conn: SnowflakeConnection, prompt: str, contexts: Tuple[str, ...]
+) -> str:
+    """SQL expression of the prompt, referencing the contexts from PROMPT_CONTEXT_TABLE if it is set."""
+    store = get_prompt_context_store(conn) if contexts else None
+    return prompt_sql(prompt, contexts, store)
+
+
+def _call_spcs_model(
+    conn: SnowflakeConnection,
+    model: str,
+    prompt: str,
+    contexts: Tuple[str, ...] = (),
+) -> str:
     """Call locally deployed model via SPCS service."""
     
     # 直接使用简单的 prompt 调用 /complete 端点
-    escaped_prompt = prompt.replace("'", "''")
-    
     udf_path = MODEL_BACKENDS_CHAT["SPCS (本地)"]["udf_path"]
-    query = f"SELECT {udf_path}('{escaped_prompt}')"
+    query = f"SELECT {udf_path}({_prompt_sql(conn, prompt, contexts)})"
     
     try:
         # 使用 Snowpark session 以获得更好的 SiS 兼容性
@@ -168,11 +251,15 @@ def _call_spcs_model(conn: SnowflakeConnection, model: str, prompt: str) -> str:
         raise ValueError(f"SPCS call error: {str(e)}")
 
 
-def _call_external_api(conn: SnowflakeConnection, model: str, prompt: str) -> str:
+def _call_external_api(
+    conn: SnowflakeConnection,
+    model: str,
+    prompt: str,
+    contexts: Tuple[str, ...] = (),
+) -> str:
     """Call LLM via external API UDF."""
-    escaped_prompt = prompt.replace("'", "''").replace("\\", "\\\\")
     udf_path = MODEL_BACKENDS_CHAT["外部 API"]["udf_path"]
-    query = f"SELECT {udf_path}('{model}', $${escaped_prompt}$$)"
+    query = f"SELECT {udf_path}('{model}', {_prompt_sql(conn, prompt, contexts)})"
     
     try:
         cursor = conn.cursor()
@@ -185,58 +272,230 @@ def _call_external_api(conn: SnowflakeConnection, model: str, prompt: str) -> st
         raise ValueError(f"外部 API 调用失败: {str(e)}")
 
 
-def _call_qwen_udf(conn: SnowflakeConnection, model: str, prompt: str) -> str:
+def _call_qwen_udf(
+    conn: SnowflakeConnection,
+    model: str,
+    prompt: str,
+    backend: Optional[str] = None,
+    contexts: Tuple[str, ...] = (),
+) -> str:
     """
     Call Qwen UDF in Snowflake to generate response.
-    Routes to different backends based on user selection.
+    Routes to different backends based on user selection. Pass in the backend when calling from a thread without
+    access to st.session_state. Large contexts in the prompt, like the semantic model, are passed by reference
+    instead of being inlined in the statement, see prompt_context.
     """
-    backend = _get_model_backend()
+    backend = backend or _get_model_backend()
     
     if backend == "SPCS (本地)":
-        return _call_spcs_model(conn, model, prompt)
+        return _call_spcs_model(conn, model, prompt, contexts)
     else:
-        return _call_external_api(conn, model, prompt)
+        return _call_external_api(conn, model, prompt, contexts)
 
 
-def _generate_sql_with_qwen(
-    conn: SnowflakeConnection, 
-    semantic_model: str, 
-    question: str
-) -> Dict[str, Any]:
+def _streaming_endpoint(
+    backend: Optional[str] = None,
+) -> Optional[Tuple[str, Dict[str, str]]]:
     """
-    Use Qwen to generate SQL based on semantic model and user question.
-    Returns a response in the same format as Cortex Analyst API.
+    Returns the base URL and headers of the OpenAI compatible endpoint to stream completions of the backend from,
+    or None if the backend can only be called through its UDF.
     """
-    # Generate SQL using Qwen
-    sql_prompt = QWEN_SQL_PROMPT_TEMPLATE.format(
-        semantic_model=semantic_model,
-        question=question
-    )
-    
-    # 使用用户选择的模型
-    selected_model = _get_selected_model()
-    sql_response = _call_qwen_udf(conn, selected_model, sql_prompt)
-    sql_response = sql_response.strip()
-    
-    # Check if Qwen couldn't answer
-    if sql_response.startswith("CANNOT_ANSWER:"):
-        reason = sql_response.replace("CANNOT_ANSWER:", "").strip()
-        return {
-            "request_id": str(uuid.uuid4()),
-            "message": {
-                "role": "analyst",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"抱歉，我无法根据当前语义模型回答这个问题。原因：{reason}"
-                    }
-                ]
-            }
+    backend = backend or _get_model_backend()
+    if backend == "SPCS (本地)":
+        if qwen_llm.SPCS_ENDPOINT_URL:
+            return qwen_llm.SPCS_ENDPOINT_URL, qwen_llm.spcs_auth_headers()
+        return None
+    if qwen_llm.QWEN_API_KEY:
+        return qwen_llm.QWEN_API_BASE_URL, {
+            "Authorization": f"Bearer {qwen_llm.QWEN_API_KEY}"
         }
-    
-    # Clean up SQL (remove markdown code blocks if present)
-    if sql_response.startswith("```"):
-        lines = sql_response.split("\n")
+    return None
+
+
+def streaming_available() -> bool:
+    """Whether streaming is enabled and the selected backend has an endpoint to stream from."""
+    return (
+        st.session_state.get("stream_responses", True)
+        and _streaming_endpoint() is not None
+    )
+
+
+def _stream_qwen(
+    conn: SnowflakeConnection, model: str, prompt: str, backend: str
+) -> Iterator[str]:
+    """
+    Streams the completion from the endpoint of the backend, for use with st.write_stream. Falls back to the blocking
+    UDF, yielding its response at once, if the backend has no endpoint or the stream fails before the first chunk.
+    """
+    endpoint = _streaming_endpoint(backend)
+    if endpoint is not None:
+        base_url, headers = endpoint
+        received = False
+        try:
+            for chunk in qwen_llm.qwen_complete_stream(
+                prompt,
+                # The SPCS proxy fills in the model it serves.
+                model="" if backend == "SPCS (本地)" else model,
+                base_url=base_url,
+                headers=headers,
+            ):
+                received = True
+                yield chunk
+            return
+        except Exception as e:
+            if received:
+                raise ValueError(f"流式响应中断: {str(e)}")
+            logger.warning(f"Streaming failed, using the UDF instead: {e}")
+    yield _call_qwen_udf(conn, model, prompt, backend)
+
+
+@functools.lru_cache(maxsize=8)
+def _schema_index(semantic_model: str) -> SchemaIndex:
+    return SchemaIndex.from_yaml(semantic_model)
+
+
+@functools.lru_cache(maxsize=8)
+def _prompt_contexts(semantic_model: str) -> Tuple[str, ...]:
+    """
+    The parts of SQL prompts that are the same for every question about the semantic model, which are passed by
+    reference: the full model, used when schema linking is off or finds nothing, and the yaml of every table, which
+    linked models repeat as is for the tables they keep whole.
+    """
+    return (semantic_model, *_schema_index(semantic_model).table_yamls())
+
+
+def _link_schema(
+    semantic_model: str, question: str, include_verified_queries: bool = True
+) -> str:
+    """
+    Prunes the semantic model to the tables and columns relevant to the question, together with their join paths,
+    so that the prompt size scales with the question instead of the model. Falls back to the full model.
+    """
+    if not st.session_state.get("schema_linking", True):
+        return semantic_model
+    try:
+        return link_schema_yaml(
+            semantic_model,
+            question,
+            index=_schema_index(semantic_model),
+            max_verified_queries=3 if include_verified_queries else 0,
+        )
+    except Exception as e:
+        logger.warning(f"Schema linking failed, using the full semantic model: {e}")
+        return semantic_model
+
+
+@functools.lru_cache(maxsize=8)
+def _verified_query_index(semantic_model: str) -> VerifiedQueryIndex:
+    return VerifiedQueryIndex.from_dict(_schema_index(semantic_model).model)
+
+
+@functools.lru_cache(maxsize=4)
+def _column_format_context(semantic_model: str) -> Any:
+    return context_to_column_format(yaml_to_semantic_model(semantic_model))
+
+
+def _expand_logical_tables(semantic_model: str, sql: str) -> str:
+    """
+    Expands the logical tables (e.g. __orders) that verified queries are written against into CTEs over the base
+    tables, so that the SQL can run as is. SQL over base tables is returned unchanged.
+    """
+    tables = _schema_index(semantic_model).model.get("tables") or []
+    if not any(
+        re.search(rf"\b__{re.escape(str(t.get('name')))}\b", sql, re.IGNORECASE)
+        for t in tables
+    ):
+        return sql
+    try:
+        return expand_all_logical_tables_as_ctes(
+            sql, _column_format_context(semantic_model)
+        )
+    except Exception as e:
+        logger.warning(f"Unable to expand the logical tables of the SQL: {e}")
+        return sql
+
+
+@functools.lru_cache(maxsize=8)
+def _model_tables(semantic_model: str) -> Dict[str, Dict[str, str]]:
+    return allowed_tables(_schema_index(semantic_model).model)
+
+
+def _guard_sql(semantic_model: str, sql: str) -> SqlGuardResult:
+    """
+    Checks the SQL against the base tables of the semantic model (and the cached catalog snapshot if there is one),
+    rejecting anything but read-only queries and bounding the rows it returns.
+    """
+    if not st.session_state.get("sql_guard", True):
+        return SqlGuardResult(sql)
+    tables = with_catalog_columns(
+        _model_tables(semantic_model), st.session_state.get("catalog_snapshot")
+    )
+    return guard_sql(sql, tables)
+
+
+def _guard_generated_sql(
+    conn: SnowflakeConnection,
+    semantic_model: str,
+    linked_semantic_model: str,
+    question: str,
+    sql: str,
+    model: str,
+) -> SqlGuardResult:
+    """
+    Guards generated SQL, and if the checks fail, asks the LLM once to fix it with the errors, which are found
+    locally instead of by a failed query in the warehouse.
+    """
+    result = _guard_sql(semantic_model, sql)
+    if result.ok:
+        return result
+    logger.info(f"Generated SQL failed the checks, retrying:\n{result.error_text()}")
+    fix_prompt = QWEN_SQL_FIX_PROMPT_TEMPLATE.format(
+        semantic_model=linked_semantic_model,
+        question=question,
+        sql=sql,
+        errors=result.error_text(),
+    )
+    fixed = _strip_code_block(
+        _call_qwen_udf(
+            conn, model, fix_prompt, contexts=_prompt_contexts(semantic_model)
+        ).strip()
+    )
+    return _guard_sql(semantic_model, _expand_logical_tables(semantic_model, fixed))
+
+
+def _rejected_sql_response(result: SqlGuardResult) -> Dict[str, Any]:
+    return _cannot_answer_response(
+        f"生成的 SQL 没有通过执行前的检查:\n{result.error_text()}"
+        f"\n\n```sql\n{result.sql}\n```"
+    )
+
+
+def _few_shot_examples(examples: List[VerifiedQueryMatch]) -> str:
+    if not examples:
+        return ""
+    text = "## 参考示例 (已验证的问题和 SQL):\n"
+    for example in examples:
+        text += f"问题: {example.question}\nSQL:\n```sql\n{example.sql}\n```\n"
+    return text + "\n"
+
+
+# In the two call mode, SQL and explanation are generated by separate LLM calls. In the structured mode, a single call
+# returns both as JSON, falling back to the two call mode if the JSON cannot be parsed.
+SQL_GENERATION_MODE_TWO_CALL = "two_call"
+SQL_GENERATION_MODE_STRUCTURED = "structured"
+DEFAULT_SQL_GENERATION_MODE = os.environ.get(
+    "QWEN_SQL_GENERATION_MODE", SQL_GENERATION_MODE_TWO_CALL
+)
+QWEN_EXPLANATION_MODEL = "qwen-turbo"
+
+_explanation_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+
+def _strip_code_block(text: str) -> str:
+    """Removes a surrounding markdown code block, if present."""
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
         sql_lines = []
         in_code_block = False
         for line in lines:
@@ -245,13 +504,55 @@ def _generate_sql_with_qwen(
                 continue
             if in_code_block or not line.startswith("```"):
                 sql_lines.append(line)
-        sql_response = "\n".join(sql_lines).strip()
-    
-    # Generate explanation
-    explanation_prompt = QWEN_EXPLANATION_PROMPT_TEMPLATE.format(sql=sql_response)
-    explanation = _call_qwen_udf(conn, "qwen-turbo", explanation_prompt)
-    
-    # Format response like Cortex Analyst API
+        text = "\n".join(sql_lines).strip()
+    return text
+
+
+def _parse_structured_response(text: str) -> Optional[Dict[str, str]]:
+    """
+    Strictly parses the JSON answer of QWEN_STRUCTURED_PROMPT_TEMPLATE.
+    Returns {"sql", "explanation"} or {"cannot_answer"}, or None if the answer does not match either shape.
+    """
+    try:
+        parsed = json.loads(_strip_code_block(text))
+    except json.JSONDecodeError:
+        return None
+    if not isinstance(parsed, dict):
+        return None
+    if isinstance(parsed.get("cannot_answer"), str):
+        return {"cannot_answer": parsed["cannot_answer"]}
+    sql, explanation = parsed.get("sql"), parsed.get("explanation")
+    if isinstance(sql, str) and sql.strip() and isinstance(explanation, str):
+        return {"sql": _strip_code_block(sql), "explanation": explanation.strip()}
+    return None
+
+
+def explain_sql(
+    conn: SnowflakeConnection, sql: str, backend: Optional[str] = None
+) -> str:
+    """Generates a one sentence explanation of the SQL."""
+    explanation_prompt = QWEN_EXPLANATION_PROMPT_TEMPLATE.format(sql=sql)
+    return _call_qwen_udf(conn, QWEN_EXPLANATION_MODEL, explanation_prompt, backend)
+
+
+def explain_sql_concurrently(
+    conn: SnowflakeConnection, sql: str
+) -> "concurrent.futures.Future[str]":
+    """
+    Starts generating the explanation of the SQL in the background, so that it can overlap with executing the SQL.
+    """
+    return _explanation_executor.submit(explain_sql, conn, sql, _get_model_backend())
+
+
+def stream_explanation(conn: SnowflakeConnection, sql: str) -> Iterator[str]:
+    """Streams the one sentence explanation of the SQL, see _stream_qwen."""
+    explanation_prompt = QWEN_EXPLANATION_PROMPT_TEMPLATE.format(sql=sql)
+    return _stream_qwen(
+        conn, QWEN_EXPLANATION_MODEL, explanation_prompt, _get_model_backend()
+    )
+
+
+def _cannot_answer_response(reason: str) -> Dict[str, Any]:
     return {
         "request_id": str(uuid.uuid4()),
         "message": {
@@ -259,17 +560,306 @@ def _generate_sql_with_qwen(
             "content": [
                 {
                     "type": "text",
-                    "text": f"__{question}__\n\n{explanation}"
-                },
-                {
-                    "type": "sql",
-                    "statement": sql_response
+                    "text": f"抱歉，我无法根据当前语义模型回答这个问题。原因：{reason}"
                 }
             ]
         }
     }
 
 
+def _sql_response(
+    question: str, sql: str, explanation: Optional[str]
+) -> Dict[str, Any]:
+    """
+    Formats a response like the Cortex Analyst API. If the explanation is None, the message is marked with
+    explanation_pending, and the caller is expected to generate it with stream_explanation or
+    explain_sql_concurrently.
+    """
+    text = f"__{question}__"
+    if explanation is not None:
+        text += f"\n\n{explanation}"
+    message: Dict[str, Any] = {
+        "role": "analyst",
+        "content": [
+            {
+                "type": "text",
+                "text": text
+            },
+            {
+                "type": "sql",
+                "statement": sql
+            }
+        ]
+    }
+    if explanation is None:
+        message["explanation_pending"] = True
+    return {"request_id": str(uuid.uuid4()), "message": message}
+
+
+def _generate_sql_with_qwen(
+    conn: SnowflakeConnection, 
+    semantic_model: str, 
+    question: str
+) -> Dict[str, Any]:
+    """
+    Use Qwen to generate SQL based on semantic model and user question.
+    Returns a response in the same format as Cortex Analyst API.
+    """
+    examples: List[VerifiedQueryMatch] = []
+    use_verified_queries = st.session_state.get("use_verified_queries", True)
+    if use_verified_queries:
+        index = _verified_query_index(semantic_model)
+        match = index.match(question)
+        guarded = (
+            _guard_sql(
+                semantic_model, _expand_logical_tables(semantic_model, match.sql)
+            )
+            if match is not None
+            else None
+        )
+        if guarded is not None and guarded.ok:
+            # The question was already answered by a verified query, no need to ask the LLM.
+            return _sql_response(
+                question,
+                guarded.sql,
+                f"该问题与已验证的问题「{match.question}」匹配，直接使用其已验证的 SQL。",
+            )
+        examples = index.search(question)
+
+    # The most similar verified queries are given as examples, instead of those picked by schema linking.
+    linked_semantic_model = _link_schema(
+        semantic_model, question, include_verified_queries=not use_verified_queries
+    )
+    # 使用用户选择的模型
+    selected_model = _get_selected_model()
+    # With streaming, the caller streams the explanation into the chat instead.
+    explain_later = (
+        st.session_state.get("explain_concurrently", False) or streaming_available()
+    )
+
+    if (
+        st.session_state.get("sql_generation_mode", DEFAULT_SQL_GENERATION_MODE)
+        == SQL_GENERATION_MODE_STRUCTURED
+    ):
+        structured_prompt = QWEN_STRUCTURED_PROMPT_TEMPLATE.format(
+            semantic_model=linked_semantic_model,
+            examples=_few_shot_examples(examples),
+            question=question
+        )
+        parsed = _parse_structured_response(
+            _call_qwen_udf(
+                conn,
+                selected_model,
+                structured_prompt,
+                contexts=_prompt_contexts(semantic_model),
+            )
+        )
+        if parsed is not None:
+            if "cannot_answer" in parsed:
+                return _cannot_answer_response(parsed["cannot_answer"])
+            sql = _expand_logical_tables(semantic_model, parsed["sql"])
+            guarded = _guard_generated_sql(
+                conn,
+                semantic_model,
+                linked_semantic_model,
+                question,
+                sql,
+                selected_model,
+            )
+            if not guarded.ok:
+                return _rejected_sql_response(guarded)
+            return _sql_response(question, guarded.sql, parsed["explanation"])
+        logger.warning("Unable to parse structured SQL response, using two calls.")
+
+    # Generate SQL using Qwen
+    sql_prompt = QWEN_SQL_PROMPT_TEMPLATE.format(
+        semantic_model=linked_semantic_model,
+        examples=_few_shot_examples(examples),
+        question=question
+    )
+    sql_response = _call_qwen_udf(
+        conn, selected_model, sql_prompt, contexts=_prompt_contexts(semantic_model)
+    )
+    sql_response = sql_response.strip()
+    
+    # Check if Qwen couldn't answer
+    if sql_response.startswith("CANNOT_ANSWER:"):
+        reason = sql_response.replace("CANNOT_ANSWER:", "").strip()
+        return _cannot_answer_response(reason)
+    
+    # Clean up SQL (remove markdown code blocks if present)
+    sql_response = _strip_code_block(sql_response)
+    # The examples are written against logical tables, which the generated SQL may copy.
+    sql_response = _expand_logical_tables(semantic_model, sql_response)
+    guarded = _guard_generated_sql(
+        conn,
+        semantic_model,
+        linked_semantic_model,
+        question,
+        sql_response,
+        selected_model,
+    )
+    if not guarded.ok:
+        return _rejected_sql_response(guarded)
+    sql_response = guarded.sql
+
+    # The explanation is either streamed or generated by the caller while executing the SQL, or generated here.
+    if explain_later:
+        return _sql_response(question, sql_response, None)
+    return _sql_response(question, sql_response, explain_sql(conn, sql_response))
+
+
+# Responses are cached in this Snowflake table if set, and otherwise in a local SQLite file that survives restarts
+# (in memory if the path is ":memory:" or its directory cannot be created).
+RESPONSE_CACHE_TABLE = os.environ.get("RESPONSE_CACHE_TABLE", "")
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH",
+    os.path.join(
+        os.path.expanduser("~"),
+        ".cache",
+        "semantic_model_generator",
+        "response_cache.sqlite3",
+    ),
+)
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+
+_CORTEX_ANALYST_BACKEND = "cortex_analyst"
+
+
+@st.cache_resource(show_spinner=False)
+def get_response_cache(_conn: SnowflakeConnection) -> ResponseCache:
+    """
+    Returns the NL-to-SQL response cache shared by all sessions of this app instance.
+    Marked with st.cache_resource in order to reuse the cache across the app.
+    """
+    path = RESPONSE_CACHE_PATH
+    if not RESPONSE_CACHE_TABLE and path != ":memory:":
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        except OSError as e:
+            logger.warning(f"Unable to create the response cache directory: {e}")
+            path = ":memory:"
+    return create_response_cache(
+        _conn,
+        table_fqn=RESPONSE_CACHE_TABLE,
+        path=path,
+        max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+    )
+
+
+def _semantic_model_name(semantic_model: str) -> str:
+    match = re.search(r"^name:\s*(.+)$", semantic_model, re.MULTILINE)
+    return match.group(1).strip().strip("'\"") if match else ""
+
+
+def _latest_question(messages: list[dict[str, str]]) -> str:
+    latest_message = messages[-1] if messages else None
+    if not latest_message or latest_message.get("role") != "user":
+        raise ValueError("没有找到用户消息")
+    content = latest_message.get("content", [])
+    if isinstance(content, list) and len(content) > 0:
+        return content[0].get("text", "")  # type: ignore[no-any-return]
+    elif isinstance(content, str):
+        return content
+    return str(content)
+
+
+def _has_sql(response: Dict[str, Any]) -> bool:
+    content = response.get("message", {}).get("content", [])
+    return any(item.get("type") == "sql" for item in content)
+
+
+def _qwen_generation_settings() -> Dict[str, Any]:
+    """Returns the settings that change the SQL that _generate_sql_with_qwen returns for a question."""
+    return {
+        "sql_generation_mode": st.session_state.get(
+            "sql_generation_mode", DEFAULT_SQL_GENERATION_MODE
+        ),
+        "schema_linking": st.session_state.get("schema_linking", True),
+        "use_verified_queries": st.session_state.get("use_verified_queries", True),
+        "sql_guard": st.session_state.get("sql_guard", True),
+    }
+
+
+def _response_cache_entry(
+    _conn: SnowflakeConnection, semantic_model: str, messages: list[dict[str, str]]
+) -> Optional[Tuple[str, str, str, str, Optional[Dict[str, Any]]]]:
+    """
+    Returns the question, semantic model hash, model, backend and settings that a response to messages is cached
+    under, or None if it is not cached: with the response cache off, or for multi turn requests to Cortex Analyst,
+    whose responses depend on the full chat history.
+    """
+    if not st.session_state.get("use_response_cache", True):
+        return None
+    if _is_china_region_chat(_conn):
+        model, backend = _get_selected_model(), _get_model_backend()
+        settings = _qwen_generation_settings()
+    elif len(messages) == 1:
+        model, backend = _CORTEX_ANALYST_BACKEND, _CORTEX_ANALYST_BACKEND
+        settings = None
+    else:
+        return None
+    question = _latest_question(messages)
+    return question, model_hash(semantic_model), model, backend, settings
+
+
+def cache_response(
+    _conn: SnowflakeConnection,
+    semantic_model: str,
+    messages: list[dict[str, str]],
+    response: Dict[str, Any],
+) -> None:
+    """
+    Stores the response to messages in the persistent response cache, if it contains SQL and its explanation is not
+    pending. Callers that fill in a pending explanation store the completed response with this.
+    """
+    entry = _response_cache_entry(_conn, semantic_model, messages)
+    if (
+        entry is None
+        or not _has_sql(response)
+        or response["message"].get("explanation_pending")
+    ):
+        return
+    question, semantic_model_hash, model, backend, settings = entry
+    try:
+        get_response_cache(_conn).put(
+            question,
+            semantic_model_hash,
+            model,
+            backend,
+            response,
+            semantic_model_name=_semantic_model_name(semantic_model),
+            settings=settings,
+        )
+    except Exception as e:
+        logger.warning(f"Response cache write failed: {e}")
+
+
+def send_message_cached(
+    _conn: SnowflakeConnection, semantic_model: str, messages: list[dict[str, str]]
+) -> Dict[str, Any]:
+    """
+    Same as send_message, but first looks up the response in the persistent response cache (see
+    _response_cache_entry). Qwen responses are cached per generation settings. Responses whose explanation is pending
+    are not cached here, the caller stores them with cache_response once the explanation is filled in.
+    """
+    entry = _response_cache_entry(_conn, semantic_model, messages)
+    if entry is None:
+        return send_message(_conn, semantic_model, messages)
+    try:
+        # Entries of other versions of the semantic model are never hit, since the key has its hash, and are left to
+        # the LRU eviction: other sessions and app instances sharing the cache may still use them.
+        cached = get_response_cache(_conn).get(*entry)
+        if cached is not None:
+            return cached
+    except Exception as e:
+        logger.warning(f"Response cache lookup failed: {e}")
+
+    response = send_message(_conn, semantic_model, messages)
+    cache_response(_conn, semantic_model, messages, response)
+    return response
+
+
 @st.cache_data(ttl=60, show_spinner=False)
 def send_message(
     _conn: SnowflakeConnection, semantic_model: str, messages: list[dict[str, str]]
@@ -288,20 +878,8 @@ def send_message(
     
     # For China region, use Qwen-based SQL generation
     if _is_china_region_chat(_conn):
-        # Extract the latest user message
-        latest_message = messages[-1] if messages else None
-        if latest_message and latest_message.get("role") == "user":
-            content = latest_message.get("content", [])
-            if isinstance(content, list) and len(content) > 0:
-                question = content[0].get("text", "")
-            elif isinstance(content, str):
-                question = content
-            else:
-                question = str(content)
-            
-            return _generate_sql_with_qwen(_conn, semantic_model, question)
-        else:
-            raise ValueError("没有找到用户消息")
+        question = _latest_question(messages)
+        return _generate_sql_with_qwen(_conn, semantic_model, question)
     
     # Original Cortex Analyst API call for non-China regions
     request_body = {
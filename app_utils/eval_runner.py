@@ -0,0 +1,1041 @@
+# Evaluation of a semantic model against an evaluation table (ID, QUERY, GOLD_SQL). EvaluationRunner is the one
+# implementation of the evaluation pipeline: the evaluation mode of the app (journeys/evaluation.py) wraps it with
+# progress bars and session state, and the benchmarks.evaluation CLI runs it headless.
+#
+# Every question goes to Analyst (or Qwen), several at once on a thread pool. Then all the analyst and gold queries
+# are submitted at once with async execution, reusing the cached results of gold queries whose tables have not
+# changed. Results are compared exactly, and the rest are judged by an LLM, several comparisons to a prompt and all
+# prompts in one query. The latency of every call is recorded by stage (LLM, analyst SQL, gold SQL and judge), which
+# EvaluationReport summarizes as p50/p95 next to the accuracy. In incremental runs, questions already evaluated with
+# the same semantic model are taken from the results table instead (see reusable_results).
+#
+# EvaluationRunner.run_quick evaluates a stratified sample of the questions instead, batch by batch, and stops as soon
+# as the accuracy is known well enough or is clearly below the last accepted run (see quick_eval).
+
+import concurrent.futures
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from textwrap import dedent
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import snowflake.snowpark._internal.utils as snowpark_utils
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+from snowflake.connector.pandas_tools import write_pandas
+
+from app_utils.chat import _is_china_region_chat
+from app_utils.response_cache import ResponseCache
+from app_utils.shared_utils import get_qwen_udf_path
+from semantic_model_generator.data_processing.llm_judge import (
+    Comparison,
+    Verdict,
+    encode_frame,
+    judge_key,
+    pack_comparisons,
+    pack_prompt,
+    parse_pack,
+    parse_verdict,
+    single_prompt,
+    verdict_from_json,
+    verdict_to_json,
+)
+from semantic_model_generator.data_processing.query_result_cache import (
+    QueryResultCache,
+    cacheable_queries,
+    result_key,
+)
+from semantic_model_generator.data_processing.quick_eval import (
+    QuickEvalConfig,
+    accuracy_interval,
+    stop_reason,
+    stratified_order,
+)
+from semantic_model_generator.data_processing.result_matching import match_results
+from semantic_model_generator.data_processing.result_storage import (
+    read_preview,
+    result_digest,
+    result_preview,
+    write_result_files,
+)
+from semantic_model_generator.snowflake_utils.snowflake_connector import (
+    create_table_in_schema,
+    execute_queries_async,
+    fetch_table_fingerprints,
+    fetch_table_schema,
+)
+
+STAGE_LLM = "llm"
+STAGE_ANALYST_SQL = "analyst_sql"
+STAGE_GOLD_SQL = "gold_sql"
+STAGE_JUDGE = "judge"
+STAGES = (STAGE_LLM, STAGE_ANALYST_SQL, STAGE_GOLD_SQL, STAGE_JUDGE)
+
+QWEN_JUDGE_MODEL = os.environ.get("QWEN_JUDGE_MODEL", "qwen-max")
+CORTEX_JUDGE_MODEL = "mistral-large2"
+# Verdicts of the LLM judge are kept in the response cache under this name, apart from chat responses.
+JUDGE_CACHE_NAMESPACE = "__llm_judge__"
+# Explanation of the rows that exact_comparisons leaves to the LLM judge.
+USE_LLM_JUDGE = "<use llm judge>"
+
+# Query results are stored as a digest plus a preview, with the full results as Parquet files on the results stage,
+# and semantic models once per MODEL_HASH in the models table (see result_storage and eval_storage_names).
+RESULTS_TABLE_SCHEMA = {
+    "TIMESTAMP": "TIMESTAMP_NTZ",
+    "ID": "VARCHAR",
+    "QUERY": "VARCHAR",
+    "ANALYST_TEXT": "VARCHAR",
+    "ANALYST_SQL": "VARCHAR",
+    "ANALYST_RESULT_DIGEST": "VARCHAR",
+    "ANALYST_RESULT_PREVIEW": "VARCHAR",
+    "GOLD_SQL": "VARCHAR",
+    "GOLD_RESULT_DIGEST": "VARCHAR",
+    "GOLD_RESULT_PREVIEW": "VARCHAR",
+    "CORRECT": "BOOLEAN",
+    "EXPLANATION": "VARCHAR",
+    "MODEL_HASH": "VARCHAR",
+    "EVAL_TABLE": "VARCHAR",
+    "EVAL_HASH": "VARCHAR",
+    "EVAL_RUN_NAME": "VARCHAR",
+}
+MODELS_TABLE_SCHEMA = {
+    "MODEL_HASH": "VARCHAR",
+    "SEMANTIC_MODEL_STRING": "VARCHAR",
+    "TIMESTAMP": "TIMESTAMP_NTZ",
+}
+# Results tables created before results were stored compactly, with the full results as JSON records and the semantic
+# model on every row. prepare_results_table migrates them to RESULTS_TABLE_SCHEMA.
+LEGACY_RESULTS_TABLE_SCHEMA = {
+    "TIMESTAMP": "TIMESTAMP_NTZ",
+    "ID": "VARCHAR",
+    "QUERY": "VARCHAR",
+    "ANALYST_TEXT": "VARCHAR",
+    "ANALYST_SQL": "VARCHAR",
+    "ANALYST_RESULT": "VARCHAR",
+    "GOLD_SQL": "VARCHAR",
+    "GOLD_RESULT": "VARCHAR",
+    "CORRECT": "BOOLEAN",
+    "EXPLANATION": "VARCHAR",
+    "MODEL_HASH": "VARCHAR",
+    "SEMANTIC_MODEL_STRING": "VARCHAR",
+    "EVAL_TABLE": "VARCHAR",
+    "EVAL_HASH": "VARCHAR",
+    "EVAL_RUN_NAME": "VARCHAR",
+}
+
+QueryResult = Union[pd.DataFrame, str]
+
+
+def semantic_model_hash(semantic_model: str) -> str:
+    """Returns the MODEL_HASH of a semantic model yaml, as stored in the results table."""
+    return hashlib.md5(semantic_model.encode()).hexdigest()
+
+
+def analyst_content(response: Dict[str, Any]) -> Dict[str, str]:
+    """Returns the ANALYST_TEXT and ANALYST_SQL of an Analyst (or Qwen) response."""
+
+    def _get_content(item_type: str, key: str) -> str:
+        return next(
+            (
+                item[key]
+                for item in response["message"]["content"]
+                if item["type"] == item_type
+            ),
+            "",
+        )
+
+    return dict(
+        ANALYST_TEXT=_get_content("text", "text"),
+        ANALYST_SQL=_get_content("sql", "statement"),
+    )
+
+
+def exact_comparisons(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Returns the CORRECT and EXPLANATION of the rows of frame (with ANALYST_RESULT and GOLD_RESULT) whose results
+    are errors or match exactly. The EXPLANATION of the other rows is USE_LLM_JUDGE.
+    """
+    matches = pd.Series(False, index=frame.index)
+    explanations = pd.Series("", index=frame.index)
+    for row_id, row in frame.iterrows():
+        analyst_is_frame = isinstance(row["ANALYST_RESULT"], pd.DataFrame)
+        gold_is_frame = isinstance(row["GOLD_RESULT"], pd.DataFrame)
+        if (not analyst_is_frame) and (not gold_is_frame):
+            explanations[row_id] = dedent(
+                f"""
+                analyst sql had an error: {row["ANALYST_RESULT"]}
+                gold sql had an error: {row["GOLD_RESULT"]}
+                """
+            )
+        elif (not analyst_is_frame) and gold_is_frame:
+            explanations[row_id] = dedent(
+                f"""
+                analyst sql had an error: {row["ANALYST_RESULT"]}
+                """
+            )
+        elif analyst_is_frame and (not gold_is_frame):
+            explanations[row_id] = dedent(
+                f"""
+                gold sql had an error: {row["GOLD_RESULT"]}
+                """
+            )
+        else:
+            result_match = match_results(
+                result_frame=row["ANALYST_RESULT"], gold_frame=row["GOLD_RESULT"]
+            )
+            matches[row_id] = result_match.matched
+            if not result_match.matched:
+                explanations[row_id] = USE_LLM_JUDGE
+            elif result_match.same_order:
+                explanations[row_id] = "Data matches exactly"
+            else:
+                explanations[row_id] = (
+                    "Data matches exactly (rows in a different order)"
+                )
+    return pd.DataFrame({"CORRECT": matches, "EXPLANATION": explanations})
+
+
+def judge_comparisons(
+    comparisons: List[Comparison],
+    complete_prompts: Callable[[List[str]], List[str]],
+) -> Dict[str, Verdict]:
+    """
+    Judges small comparisons several to a prompt. Comparisons whose verdict is missing from the answer to their
+    pack are judged again on their own. complete_prompts returns the answers of the judge to prompts, in order.
+    """
+    packs = pack_comparisons(comparisons)
+    answers = complete_prompts([pack_prompt(pack) for pack in packs])
+    verdicts: Dict[str, Verdict] = {}
+    unanswered = []
+    for pack, answer in zip(packs, answers):
+        pack_verdicts = parse_pack(pack, answer)
+        verdicts.update(pack_verdicts)
+        unanswered += [c for c in pack if c.key not in pack_verdicts]
+    if unanswered:
+        logger.info(f"Judging {len(unanswered)} unanswered comparisons on their own")
+        answers = complete_prompts([single_prompt(c) for c in unanswered])
+        for comparison, answer in zip(unanswered, answers):
+            verdicts[comparison.key] = parse_verdict(answer)
+    return verdicts
+
+
+def llm_judge(
+    frame: pd.DataFrame,
+    model: str,
+    complete_prompts: Callable[[List[str]], List[str]],
+    cache: Optional[ResponseCache] = None,
+) -> pd.DataFrame:
+    """
+    Returns the CORRECT and EXPLANATION of the LLM judge for the rows of frame. Each distinct comparison is judged
+    once, and only if the cache (if given) has no verdict for it yet.
+    """
+    if frame.empty:
+        return pd.DataFrame({"EXPLANATION": [], "CORRECT": []})
+
+    verdicts: Dict[str, Verdict] = {}
+    row_keys = {}
+    to_judge: Dict[str, Comparison] = {}
+    for row_id, row in frame.iterrows():
+        key = judge_key(row["QUERY"], row["ANALYST_RESULT"], row["GOLD_RESULT"], model)
+        row_keys[row_id] = key
+        if key in verdicts or key in to_judge:
+            continue
+        cached = None
+        if cache is not None:
+            try:
+                cached = verdict_from_json(
+                    cache.get(key, JUDGE_CACHE_NAMESPACE, model, "llm_judge")
+                )
+            except Exception as e:
+                logger.warning(f"LLM judge cache lookup failed: {e}")
+        if cached is not None:
+            verdicts[key] = cached
+            continue
+        to_judge[key] = Comparison(
+            key=key,
+            question=row["QUERY"],
+            frame1=encode_frame(row["ANALYST_RESULT"]),
+            frame2=encode_frame(row["GOLD_RESULT"]),
+        )
+    logger.info(
+        f"LLM judge: {len(to_judge)} comparisons to judge, {len(verdicts)} cached"
+    )
+
+    if to_judge:
+        judged = judge_comparisons(list(to_judge.values()), complete_prompts)
+        verdicts.update(judged)
+        if cache is not None:
+            for key, verdict in judged.items():
+                if not verdict.parsed:
+                    continue
+                try:
+                    cache.put(
+                        key,
+                        JUDGE_CACHE_NAMESPACE,
+                        model,
+                        "llm_judge",
+                        verdict_to_json(verdict),
+                        semantic_model_name=JUDGE_CACHE_NAMESPACE,
+                    )
+                except Exception as e:
+                    logger.warning(f"LLM judge cache write failed: {e}")
+
+    return pd.DataFrame(
+        {
+            "EXPLANATION": [verdicts[row_keys[i]].explanation for i in frame.index],
+            "CORRECT": [verdicts[row_keys[i]].correct for i in frame.index],
+        },
+        index=frame.index,
+    )
+
+
+def eval_storage_names(results_table: str) -> Tuple[str, str]:
+    """Returns the names of the models table and of the results stage that go with a results table."""
+    return f"{results_table}_MODELS", f"{results_table}_FILES"
+
+
+def create_eval_storage(conn: SnowflakeConnection, results_table: str) -> bool:
+    """Creates the models table and the results stage of a results table, if they do not exist."""
+    models_table, results_stage = eval_storage_names(results_table)
+    if not create_table_in_schema(
+        conn=conn, table_fqn=models_table, columns_schema=MODELS_TABLE_SCHEMA
+    ):
+        return False
+    try:
+        conn.cursor().execute(f"CREATE STAGE IF NOT EXISTS {results_stage}")
+    except Exception as e:
+        logger.error(f"Error creating stage {results_stage}: {e}")
+        return False
+    return True
+
+
+def put_files(conn: SnowflakeConnection, local_glob: str, stage: str) -> None:
+    """Uploads local files to a stage with the connector. Files already on the stage are not uploaded again."""
+    conn.cursor().execute(
+        f"PUT 'file://{local_glob}' @{stage} AUTO_COMPRESS=FALSE OVERWRITE=FALSE PARALLEL=8"
+    )
+
+
+def _upload_result_files(
+    conn: SnowflakeConnection,
+    result_files: Dict[str, pd.DataFrame],
+    results_stage: str,
+    upload: Optional[Callable[[str, str], None]],
+) -> None:
+    if not result_files:
+        return
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_result_files(result_files, temp_dir)
+        local_glob = os.path.join(temp_dir, "*.parquet")
+        if upload is None:
+            put_files(conn, local_glob, results_stage)
+        else:
+            upload(local_glob, results_stage)
+
+
+def _has_schema(table_schema: Dict[str, str], schema: Dict[str, str]) -> bool:
+    """Returns whether a table schema from fetch_table_schema matches schema, like validate_table_schema."""
+    return set(table_schema) == set(schema) and all(
+        schema[name] in column_type for name, column_type in table_schema.items()
+    )
+
+
+def _legacy_result(stored: Optional[str]) -> QueryResult:
+    """Reads a result stored in a legacy results table, the JSON records of a result frame or an error message."""
+    if stored is None:
+        return ""
+    try:
+        records = json.loads(stored)
+    except ValueError:
+        return stored
+    if not isinstance(records, list):
+        return stored
+    return pd.DataFrame.from_records(records)
+
+
+def migrate_results_table(
+    conn: SnowflakeConnection,
+    results_table: str,
+    upload: Optional[Callable[[str, str], None]] = None,
+) -> None:
+    """
+    Migrates a legacy results table to RESULTS_TABLE_SCHEMA in place: the semantic models move to the models table,
+    the digests and previews of the stored results are added, with the full results as files on the results stage,
+    and the columns of full results and semantic models are dropped. Needs the storage of create_eval_storage.
+    """
+    models_table, results_stage = eval_storage_names(results_table)
+    start_time = time.time()
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        MERGE INTO {models_table} t
+        USING (
+            SELECT MODEL_HASH, ANY_VALUE(SEMANTIC_MODEL_STRING) AS SEMANTIC_MODEL_STRING, MIN(TIMESTAMP) AS TIMESTAMP
+            FROM {results_table}
+            GROUP BY MODEL_HASH
+        ) s
+        ON t.MODEL_HASH = s.MODEL_HASH
+        WHEN NOT MATCHED THEN INSERT (MODEL_HASH, SEMANTIC_MODEL_STRING, TIMESTAMP)
+        VALUES (s.MODEL_HASH, s.SEMANTIC_MODEL_STRING, s.TIMESTAMP)
+        """
+    )
+
+    # Each distinct stored result is read once, and its digest and preview go to every row that stored it.
+    cursor.execute(
+        f"""
+        SELECT ANALYST_RESULT AS STORED_RESULT FROM {results_table} WHERE ANALYST_RESULT IS NOT NULL
+        UNION
+        SELECT GOLD_RESULT FROM {results_table} WHERE GOLD_RESULT IS NOT NULL
+        """
+    )
+    stored = cursor.fetch_pandas_all()["STORED_RESULT"]
+    results = stored.apply(_legacy_result)
+    digests = results.apply(result_digest)
+    _upload_result_files(
+        conn,
+        {d: r for d, r in zip(digests, results) if d is not None},
+        results_stage,
+        upload,
+    )
+    table_name = snowpark_utils.random_name_for_temp_object(
+        snowpark_utils.TempObjectType.TABLE
+    )
+    write_pandas(
+        conn=conn,
+        df=pd.DataFrame(
+            {
+                "STORED_RESULT": stored,
+                "DIGEST": digests,
+                "PREVIEW": results.apply(result_preview),
+            }
+        ),
+        table_name=table_name,
+        quote_identifiers=False,
+        auto_create_table=True,
+        table_type="temporary",
+    )
+    cursor.execute(
+        f"""
+        ALTER TABLE {results_table} ADD COLUMN
+            ANALYST_RESULT_DIGEST VARCHAR, ANALYST_RESULT_PREVIEW VARCHAR,
+            GOLD_RESULT_DIGEST VARCHAR, GOLD_RESULT_PREVIEW VARCHAR
+        """
+    )
+    for col in ("ANALYST_RESULT", "GOLD_RESULT"):
+        cursor.execute(
+            f"""
+            UPDATE {results_table} t
+            SET {col}_DIGEST = s.DIGEST, {col}_PREVIEW = s.PREVIEW
+            FROM {conn.database}.{conn.schema}.{table_name} s
+            WHERE t.{col} = s.STORED_RESULT
+            """
+        )
+    cursor.execute(
+        f"""
+        ALTER TABLE {results_table}
+        DROP COLUMN ANALYST_RESULT, GOLD_RESULT, SEMANTIC_MODEL_STRING
+        """
+    )
+    logger.info(
+        f"Migrated {results_table} with {len(stored)} distinct results "
+        f"in {time.time() - start_time:.2f} seconds"
+    )
+
+
+def prepare_results_table(
+    conn: SnowflakeConnection,
+    results_table: str,
+    upload: Optional[Callable[[str, str], None]] = None,
+) -> None:
+    """
+    Gets a results table ready to store evaluation runs: creates it with RESULTS_TABLE_SCHEMA if it does not exist,
+    creates its models table and results stage, and migrates it if it is a legacy results table. upload is passed to
+    migrate_results_table. Raises ValueError if the table has another schema or cannot be created.
+    """
+    if not create_table_in_schema(
+        conn=conn, table_fqn=results_table, columns_schema=RESULTS_TABLE_SCHEMA
+    ):
+        raise ValueError(f"Failed to create table {results_table}")
+    if not create_eval_storage(conn, results_table):
+        raise ValueError(
+            f"Failed to create the models table and stage of {results_table}"
+        )
+    table_schema = fetch_table_schema(conn, results_table)
+    if _has_schema(table_schema, RESULTS_TABLE_SCHEMA):
+        return
+    if not _has_schema(table_schema, LEGACY_RESULTS_TABLE_SCHEMA):
+        raise ValueError(
+            f"Evaluation result table must have schema {RESULTS_TABLE_SCHEMA}."
+        )
+    logger.info(f"Migrating the legacy results table {results_table}")
+    migrate_results_table(conn, results_table, upload)
+
+
+def store_results(
+    conn: SnowflakeConnection,
+    frame: pd.DataFrame,
+    results_table: str,
+    semantic_model: str,
+    run: Dict[str, str],
+    upload: Optional[Callable[[str, str], None]] = None,
+) -> None:
+    """
+    Stores the results of an evaluation run: one row per row of frame in the results table with one bulk
+    write_pandas, each distinct full result as a Parquet file on the results stage, and the semantic model in the
+    models table. run has the TIMESTAMP, EVAL_HASH, EVAL_RUN_NAME and EVAL_TABLE of the run. upload(local_glob, stage)
+    uploads the result files, with put_files by default.
+    """
+    models_table, results_stage = eval_storage_names(results_table)
+    model_hash = semantic_model_hash(semantic_model)
+
+    frame_to_write = frame.copy()
+    for column, value in run.items():
+        frame_to_write[column] = value
+    frame_to_write["MODEL_HASH"] = model_hash
+
+    # Store each result as a digest and a preview, and each distinct full result once on the stage. Rows reused from
+    # earlier runs only have their previews in memory, so keep their stored digests.
+    result_files: Dict[str, pd.DataFrame] = {}
+    for col in ("ANALYST_RESULT", "GOLD_RESULT"):
+        digests = frame[col].apply(result_digest)
+        previews = frame[col].apply(result_preview)
+        if f"{col}_DIGEST" in frame:
+            reused = frame[f"{col}_DIGEST"].notna()
+            digests[reused] = frame.loc[reused, f"{col}_DIGEST"]
+            previews[reused] = frame.loc[reused, f"{col}_PREVIEW"]
+        else:
+            reused = pd.Series(False, index=frame.index)
+        frame_to_write[f"{col}_DIGEST"] = digests
+        frame_to_write[f"{col}_PREVIEW"] = previews
+        for digest, result in zip(digests[~reused], frame.loc[~reused, col]):
+            if digest is not None:
+                result_files[digest] = result
+
+    start_time = time.time()
+    _upload_result_files(conn, result_files, results_stage, upload)
+    conn.cursor().execute(
+        f"""
+        MERGE INTO {models_table} t
+        USING (SELECT %s AS MODEL_HASH, %s AS SEMANTIC_MODEL_STRING) s
+        ON t.MODEL_HASH = s.MODEL_HASH
+        WHEN NOT MATCHED THEN INSERT (MODEL_HASH, SEMANTIC_MODEL_STRING, TIMESTAMP)
+        VALUES (s.MODEL_HASH, s.SEMANTIC_MODEL_STRING, CURRENT_TIMESTAMP())
+        """,
+        (model_hash, semantic_model),
+    )
+    frame_to_write = frame_to_write.reset_index()[list(RESULTS_TABLE_SCHEMA)]
+    write_pandas(
+        conn=conn,
+        df=frame_to_write,
+        table_name=results_table,
+        overwrite=False,
+        quote_identifiers=False,
+        auto_create_table=False,
+    )
+    logger.info(
+        f"Stored {len(frame_to_write)} evaluation results and {len(result_files)} "
+        f"result files in {time.time() - start_time:.2f} seconds"
+    )
+
+
+def last_results(
+    conn: SnowflakeConnection, results_table: str, eval_table: str
+) -> pd.DataFrame:
+    """
+    Returns the latest QUERY, GOLD_SQL and CORRECT of every question of eval_table stored in the results table,
+    whatever the semantic model it was evaluated with.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT QUERY, GOLD_SQL, CORRECT
+        FROM {results_table}
+        WHERE EVAL_TABLE = %s
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY QUERY, GOLD_SQL ORDER BY TIMESTAMP DESC) = 1
+        """,
+        (eval_table,),
+    )
+    return cursor.fetch_pandas_all()
+
+
+def last_full_run_accuracy(
+    conn: SnowflakeConnection, results_table: str, eval_table: str, num_questions: int
+) -> Optional[float]:
+    """
+    Returns the accuracy, in percent, of the latest run stored in the results table that evaluated all num_questions
+    questions of eval_table, or None if there is none. It is the accepted run that quick evaluations are compared to,
+    since quick runs only store the questions of their sample.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT AVG(IFF(CORRECT, 100, 0))
+        FROM {results_table}
+        WHERE EVAL_TABLE = %s
+        GROUP BY EVAL_HASH
+        HAVING COUNT(*) >= %s
+        ORDER BY MAX(TIMESTAMP) DESC
+        LIMIT 1
+        """,
+        (eval_table, num_questions),
+    )
+    row = cursor.fetchone()
+    return float(row[0]) if row and row[0] is not None else None
+
+
+def reusable_results(
+    conn: SnowflakeConnection,
+    results_table: str,
+    eval_frame: pd.DataFrame,
+    semantic_model: str,
+) -> pd.DataFrame:
+    """
+    Returns the latest results in the results table of the rows of eval_frame whose question and gold SQL were
+    already evaluated with semantic_model, indexed by row ID. Results are read back from their previews. Rows whose
+    Analyst request failed are left out, so that they are run again.
+    """
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT QUERY, GOLD_SQL, ANALYST_TEXT, ANALYST_SQL, CORRECT, EXPLANATION,
+            ANALYST_RESULT_DIGEST, ANALYST_RESULT_PREVIEW, GOLD_RESULT_DIGEST, GOLD_RESULT_PREVIEW
+        FROM {results_table}
+        WHERE MODEL_HASH = %s AND ANALYST_TEXT NOT LIKE 'Analyst request failed:%%'
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY QUERY, GOLD_SQL ORDER BY TIMESTAMP DESC) = 1
+        """,
+        (semantic_model_hash(semantic_model),),
+    )
+    stored = cursor.fetch_pandas_all()
+    previous = (
+        eval_frame.reset_index()
+        .merge(stored, on=["QUERY", "GOLD_SQL"], how="inner")
+        .set_index("ID")
+    )
+    for col in ("ANALYST_RESULT", "GOLD_RESULT"):
+        previous[col] = previous[f"{col}_PREVIEW"].apply(read_preview)
+    previous["CORRECT"] = previous["CORRECT"].astype(bool)
+    return previous
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Returns the q-th percentile (0 to 100) of values, interpolated, or NaN if there are none."""
+    return float(np.percentile(values, q)) if values else float("nan")
+
+
+class StageLatencies:
+    """Thread safe record of the latency of every call, by stage."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._values: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+
+    def record(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._values.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def measure(self, stage: str) -> Generator[None, None, None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def values(self, stage: str) -> List[float]:
+        with self._lock:
+            return list(self._values.get(stage, []))
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Returns the count, p50, p95, max and total seconds of every stage."""
+        summary = {}
+        for stage in list(self._values):
+            values = self.values(stage)
+            summary[stage] = {
+                "count": len(values),
+                "p50_sec": percentile(values, 50),
+                "p95_sec": percentile(values, 95),
+                "max_sec": max(values) if values else float("nan"),
+                "total_sec": sum(values),
+            }
+        return summary
+
+
+@dataclass
+class EvaluationReport:
+    # The evaluation table with the ANALYST_*, GOLD_RESULT, CORRECT and EXPLANATION of every row.
+    results: pd.DataFrame
+    latencies: StageLatencies
+    wall_time_sec: float
+    # Set by quick evaluations, whose results are a sample of the population questions of the evaluation table.
+    population: Optional[int] = None
+    interval: Optional[Tuple[float, float]] = None
+    stop_reason: str = ""
+
+    @property
+    def accuracy(self) -> float:
+        if self.results.empty:
+            return float("nan")
+        return float(self.results["CORRECT"].sum() / len(self.results) * 100)
+
+    def to_dict(self) -> Dict[str, Any]:
+        report: Dict[str, Any] = {
+            "questions": len(self.results),
+            "correct": int(self.results["CORRECT"].sum()),
+            "accuracy": self.accuracy,
+            "wall_time_sec": self.wall_time_sec,
+            "stages": self.latencies.summary(),
+        }
+        if self.population is not None:
+            report["quick"] = {
+                "population": self.population,
+                "interval": list(self.interval or ()),
+                "stop_reason": self.stop_reason,
+            }
+        return report
+
+    def format(self) -> str:
+        report = self.to_dict()
+        lines = [
+            f"Accuracy: {report['correct']}/{report['questions']} "
+            f"({report['accuracy']:.2f}%), wall time {self.wall_time_sec:.2f}s",
+        ]
+        if self.population is not None and self.interval is not None:
+            lines.append(
+                f"Quick evaluation of {report['questions']}/{self.population} "
+                f"questions, accuracy interval {self.interval[0]:.2f}% to "
+                f"{self.interval[1]:.2f}%, stopped as {self.stop_reason}"
+            )
+        lines.append(
+            f"{'stage':<12} {'count':>6} {'p50 (s)':>9} {'p95 (s)':>9} {'max (s)':>9}"
+        )
+        for stage, stats in report["stages"].items():
+            lines.append(
+                f"{stage:<12} {stats['count']:>6} {stats['p50_sec']:>9.2f} "
+                f"{stats['p95_sec']:>9.2f} {stats['max_sec']:>9.2f}"
+            )
+        return "\n".join(lines)
+
+
+def complete_judge_prompts(
+    conn: SnowflakeConnection, model: str, prompts: List[str]
+) -> List[str]:
+    """
+    Returns the answers of the judge model to the prompts, in order, from one query over a temporary table of the
+    prompts. The judge runs with the Qwen UDF in the China region and with Cortex otherwise.
+    """
+    if not prompts:
+        return []
+    table_name = snowpark_utils.random_name_for_temp_object(
+        snowpark_utils.TempObjectType.TABLE
+    )
+    write_pandas(
+        conn=conn,
+        df=pd.DataFrame({"IDX": range(len(prompts)), "LLM_JUDGE_PROMPT": prompts}),
+        table_name=table_name,
+        quote_identifiers=False,
+        auto_create_table=True,
+        table_type="temporary",
+    )
+
+    if _is_china_region_chat(conn):
+        complete = f"{get_qwen_udf_path()}('{model}', LLM_JUDGE_PROMPT)"
+    else:
+        complete = f"SNOWFLAKE.CORTEX.COMPLETE('{model}', LLM_JUDGE_PROMPT)"
+    cursor = conn.cursor()
+    cursor.execute(
+        f"""
+        SELECT IDX, {complete} AS LLM_JUDGE
+        FROM {conn.database}.{conn.schema}.{table_name}
+        ORDER BY IDX
+        """
+    )
+    return list(cursor.fetch_pandas_all()["LLM_JUDGE"].fillna(""))
+
+
+def gold_result_keys(
+    conn: SnowflakeConnection, gold_queries: List[str]
+) -> Dict[int, str]:
+    """Returns the gold result cache keys of the cacheable gold queries, by their index in gold_queries."""
+    tables_by_query, tables = cacheable_queries(
+        gold_queries, conn.database, conn.schema
+    )
+    if not tables:
+        return {}
+    fingerprints = fetch_table_fingerprints(conn, tables)
+    return {
+        i: result_key(gold_queries[i], {t: fingerprints[t] for t in query_tables})
+        for i, query_tables in tables_by_query.items()
+        if all(t in fingerprints for t in query_tables)
+    }
+
+
+@dataclass
+class EvaluationConfig:
+    # Number of Analyst requests in flight at once.
+    concurrency: int = 8
+    # Queries still running after this many seconds are cancelled and count as failed.
+    query_timeout_sec: float = 300
+    use_llm_judge: bool = True
+    # The default judge model of the region if empty.
+    judge_model: str = ""
+
+
+SendMessage = Callable[[SnowflakeConnection, str, List[Dict[str, Any]]], Dict[str, Any]]
+
+
+@dataclass
+class EvaluationRunner:
+    """
+    Runs an evaluation, see the module comment. send_message is the function that answers a question with a
+    semantic model, app_utils.chat.send_message or send_message_cached (which reads its settings, like the backend
+    and LLM model, from st.session_state). Gold results are reused from gold_cache, if given, while their tables do
+    not change. on_progress(stage, done, total) reports progress from the calling thread, and thread_initializer is
+    run in every thread sending Analyst requests, e.g. to give it the Streamlit script run context.
+    """
+
+    conn: SnowflakeConnection
+    semantic_model: str
+    send_message: SendMessage
+    config: EvaluationConfig = field(default_factory=EvaluationConfig)
+    judge_cache: Optional[ResponseCache] = None
+    gold_cache: Optional[QueryResultCache] = None
+    on_progress: Optional[Callable[[str, int, int], None]] = None
+    thread_initializer: Optional[Callable[[], None]] = None
+    latencies: StageLatencies = field(default_factory=StageLatencies, init=False)
+    # Number of gold results reused from gold_cache since the last run started.
+    cached_gold_results: int = field(default=0, init=False)
+
+    def _progress(self, stage: str, done: int, total: int) -> None:
+        if self.on_progress is not None:
+            self.on_progress(stage, done, total)
+
+    def send_analyst_requests(self, eval_frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the ANALYST_TEXT and ANALYST_SQL of the answer to the QUERY of every row of eval_frame. The text of
+        a failed request says so, and it has no SQL, so that the row is scored as failed instead of aborting the run.
+        """
+
+        def _ask(question: str) -> Dict[str, str]:
+            messages = [
+                {"role": "user", "content": [{"type": "text", "text": question}]}
+            ]
+            with self.latencies.measure(STAGE_LLM):
+                response = self.send_message(self.conn, self.semantic_model, messages)
+            return analyst_content(response)
+
+        answers: Dict[Any, Dict[str, str]] = {}
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.config.concurrency, initializer=self.thread_initializer
+        ) as pool:
+            futures = {
+                pool.submit(_ask, row["QUERY"]): row_id
+                for row_id, row in eval_frame.iterrows()
+            }
+            for done, future in enumerate(
+                concurrent.futures.as_completed(futures), start=1
+            ):
+                row_id = futures[future]
+                try:
+                    answers[row_id] = future.result()
+                except Exception as e:
+                    logger.warning(f"Analyst request for {row_id} failed: {e}")
+                    answers[row_id] = dict(
+                        ANALYST_TEXT=f"Analyst request failed: {e}", ANALYST_SQL=""
+                    )
+                self._progress(STAGE_LLM, done, len(futures))
+        return pd.DataFrame(
+            [answers[row_id] for row_id in eval_frame.index],
+            index=eval_frame.index,
+            columns=["ANALYST_TEXT", "ANALYST_SQL"],
+        )
+
+    def run_queries(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the ANALYST_RESULT and GOLD_RESULT of the rows of frame (with ANALYST_SQL and GOLD_SQL). All the
+        queries are run at once, so the warehouse rather than round trips bounds this stage. Rows with the same gold
+        SQL share a single run of it.
+        """
+        analyst_queries = list(frame["ANALYST_SQL"])
+        gold_queries = list(frame["GOLD_SQL"])
+
+        gold_results: Dict[int, QueryResult] = {}
+        gold_keys: Dict[int, str] = {}
+        if self.gold_cache is not None:
+            try:
+                gold_keys = gold_result_keys(self.conn, gold_queries)
+            except Exception as e:
+                logger.warning(
+                    f"Unable to fingerprint the tables of the gold queries: {e}"
+                )
+            for i, key in gold_keys.items():
+                cached = self.gold_cache.get(key)
+                if cached is not None:
+                    gold_results[i] = cached
+        self.cached_gold_results += len(gold_results)
+        gold_to_run = list(
+            dict.fromkeys(
+                q for i, q in enumerate(gold_queries) if i not in gold_results
+            )
+        )
+
+        def _on_result(i: int, seconds: float) -> None:
+            stage = STAGE_ANALYST_SQL if i < len(analyst_queries) else STAGE_GOLD_SQL
+            self.latencies.record(stage, seconds)
+
+        results = execute_queries_async(
+            conn=self.conn,
+            queries=analyst_queries + gold_to_run,
+            timeout=self.config.query_timeout_sec,
+            on_progress=lambda done, total: self._progress("queries", done, total),
+            on_result=_on_result,
+        )
+
+        results_by_gold_sql = dict(zip(gold_to_run, results[len(analyst_queries) :]))
+        for i, sql in enumerate(gold_queries):
+            if i in gold_results:
+                continue
+            gold_results[i] = results_by_gold_sql[sql]
+            if i in gold_keys and self.gold_cache is not None:
+                self.gold_cache.put(gold_keys[i], gold_results[i])
+        return pd.DataFrame(
+            dict(
+                ANALYST_RESULT=results[: len(analyst_queries)],
+                GOLD_RESULT=[gold_results[i] for i in range(len(gold_queries))],
+            ),
+            index=frame.index,
+        )
+
+    def _complete_prompts(self, prompts: List[str], model: str) -> List[str]:
+        try:
+            with self.latencies.measure(STAGE_JUDGE):
+                return complete_judge_prompts(self.conn, model, prompts)
+        except Exception as e:
+            logger.warning(f"LLM judge call failed: {e}")
+            return [""] * len(prompts)
+
+    def compare(self, frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the CORRECT and EXPLANATION of the rows of frame (with QUERY, ANALYST_RESULT and GOLD_RESULT):
+        results that match exactly are correct, and the others are judged by the LLM judge if config.use_llm_judge.
+        """
+        comparisons = exact_comparisons(frame)
+        to_judge = comparisons["EXPLANATION"] == USE_LLM_JUDGE
+        if self.config.use_llm_judge and to_judge.any():
+            model = self.config.judge_model or (
+                QWEN_JUDGE_MODEL
+                if _is_china_region_chat(self.conn)
+                else CORTEX_JUDGE_MODEL
+            )
+            self._progress(STAGE_JUDGE, 0, int(to_judge.sum()))
+            judged = llm_judge(
+                frame[to_judge],
+                model,
+                lambda prompts: self._complete_prompts(prompts, model),
+                self.judge_cache,
+            )
+            for col in ("CORRECT", "EXPLANATION"):
+                comparisons[col] = judged[col].combine_first(comparisons[col])
+            self._progress(STAGE_JUDGE, int(to_judge.sum()), int(to_judge.sum()))
+        else:
+            comparisons.loc[to_judge, "EXPLANATION"] = "Data does not match exactly"
+        comparisons["CORRECT"] = comparisons["CORRECT"].astype(bool)
+        return comparisons
+
+    def evaluate(self, eval_frame: pd.DataFrame) -> pd.DataFrame:
+        """
+        Returns the rows of eval_frame (QUERY and GOLD_SQL, indexed by ID) with their ANALYST_TEXT, ANALYST_SQL,
+        ANALYST_RESULT, GOLD_RESULT, CORRECT and EXPLANATION.
+        """
+        frame = pd.concat([eval_frame, self.send_analyst_requests(eval_frame)], axis=1)
+        frame = pd.concat([frame, self.run_queries(frame)], axis=1)
+        comparisons = self.compare(frame)
+        frame["CORRECT"] = comparisons["CORRECT"]
+        frame["EXPLANATION"] = comparisons["EXPLANATION"]
+        return frame
+
+    def _evaluate_reusing(
+        self, eval_frame: pd.DataFrame, previous: Optional[pd.DataFrame]
+    ) -> pd.DataFrame:
+        """Like evaluate, but takes the rows of eval_frame found in previous (see reusable_results) from there."""
+        if previous is None or previous.empty:
+            return self.evaluate(eval_frame)
+        reused = previous[previous.index.isin(eval_frame.index)]
+        to_run = eval_frame[~eval_frame.index.isin(reused.index)]
+        frames = [reused]
+        if not to_run.empty:
+            frames.append(self.evaluate(to_run))
+        return pd.concat(frames).loc[eval_frame.index]
+
+    def run(
+        self, eval_frame: pd.DataFrame, previous: Optional[pd.DataFrame] = None
+    ) -> EvaluationReport:
+        """
+        Evaluates the rows of eval_frame (QUERY and GOLD_SQL, indexed by ID). Rows with results in previous (see
+        reusable_results) are not run again.
+        """
+        start = time.perf_counter()
+        self.latencies = StageLatencies()
+        self.cached_gold_results = 0
+        results = self._evaluate_reusing(eval_frame, previous)
+        return EvaluationReport(
+            results=results,
+            latencies=self.latencies,
+            wall_time_sec=time.perf_counter() - start,
+        )
+
+    def run_quick(
+        self,
+        eval_frame: pd.DataFrame,
+        strata: pd.Series,
+        quick: QuickEvalConfig,
+        baseline: Optional[float] = None,
+        previous: Optional[pd.DataFrame] = None,
+    ) -> EvaluationReport:
+        """
+        Evaluates the rows of eval_frame in stratified order (see quick_eval) batch by batch, until a stopping rule
+        of quick applies. strata has the stratum of every row, and baseline is the accuracy of the last accepted run.
+        The sample is drawn from all rows, and the rows with results in previous are taken from there.
+        """
+        start = time.perf_counter()
+        self.latencies = StageLatencies()
+        self.cached_gold_results = 0
+        order = stratified_order(strata, quick.seed)
+        population = len(eval_frame)
+        batches: List[pd.DataFrame] = []
+        evaluated = correct = 0
+        reason = stop_reason(correct, evaluated, population, quick, baseline)
+        while reason is None:
+            size = quick.batch_size
+            if quick.max_questions:
+                size = min(size, quick.max_questions - evaluated)
+            batch = self._evaluate_reusing(
+                eval_frame.loc[order[evaluated : evaluated + size]], previous
+            )
+            batches.append(batch)
+            evaluated += len(batch)
+            correct += int(batch["CORRECT"].sum())
+            self._progress("quick", evaluated, population)
+            reason = stop_reason(correct, evaluated, population, quick, baseline)
+            logger.info(
+                f"Quick evaluation: {correct}/{evaluated} correct of {population}"
+                + (f", stopping as {reason}" if reason else "")
+            )
+        results = pd.concat(batches) if batches else eval_frame.iloc[:0]
+        return EvaluationReport(
+            # In the order of the evaluation table, like full runs.
+            results=results.loc[eval_frame.index.intersection(results.index)],
+            latencies=self.latencies,
+            wall_time_sec=time.perf_counter() - start,
+            population=population,
+            interval=accuracy_interval(
+                correct, evaluated, population, quick.confidence
+            ),
+            stop_reason=reason,
+        )
@@ -0,0 +1,310 @@
+# Persistent cache of NL-to-SQL responses. Entries are keyed by the normalized question, the content hash of the
+# semantic model, the LLM model name, the backend and the generation settings, so a cached response is only reused
+# for the exact same semantic model and options. Two backends are supported: a local SQLite file (or in-memory
+# database) for a single app instance, and a Snowflake table that survives restarts and is shared across instances.
+
+import abc
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+
+_DEFAULT_MAX_ENTRIES = 1000
+# Trailing punctuation, including the full width Chinese variants, does not change the meaning of a question.
+_TRAILING_PUNCTUATION = re.compile(r"[\s?？.。!！,，;；:：]+$")
+
+
+def normalize_question(question: str) -> str:
+    """Normalizes a question so that trivially different spellings of it share a cache entry."""
+    question = unicodedata.normalize("NFKC", question)
+    question = " ".join(question.lower().split())
+    return _TRAILING_PUNCTUATION.sub("", question)
+
+
+def model_hash(semantic_model: str) -> str:
+    """Returns the content hash of a semantic model yaml."""
+    return hashlib.sha256(semantic_model.encode("utf-8")).hexdigest()
+
+
+def cache_key(
+    question: str,
+    semantic_model_hash: str,
+    model: str,
+    backend: str,
+    settings: Optional[Dict[str, Any]] = None,
+) -> str:
+    """
+    Returns the cache key of a question. settings are the other options the response depends on (e.g. the SQL
+    generation mode), so that responses generated with other options are not reused.
+    """
+    parts: List[Any] = [
+        normalize_question(question),
+        semantic_model_hash,
+        model,
+        backend,
+    ]
+    if settings:
+        parts.append(sorted(settings.items()))
+    return hashlib.sha256(
+        json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class ResponseCache(abc.ABC):
+    """Size bounded cache of responses, evicting the least recently used entries first."""
+
+    def __init__(self, max_entries: int = _DEFAULT_MAX_ENTRIES) -> None:
+        self.max_entries = max_entries
+
+    @abc.abstractmethod
+    def get(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abc.abstractmethod
+    def put(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        response: Dict[str, Any],
+        semantic_model_name: str = "",
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        ...
+
+    @abc.abstractmethod
+    def invalidate(
+        self, semantic_model_name: str, keep_model_hash: Optional[str] = None
+    ) -> None:
+        """Drops all entries of a semantic model, except for those of keep_model_hash if given."""
+
+    @abc.abstractmethod
+    def clear(self) -> None:
+        ...
+
+
+class LocalResponseCache(ResponseCache):
+    """
+    Response cache in a local SQLite database. Use a file path for a cache that survives restarts, or ":memory:" for
+    a cache that lives as long as the process.
+    """
+
+    def __init__(
+        self, path: str = ":memory:", max_entries: int = _DEFAULT_MAX_ENTRIES
+    ) -> None:
+        super().__init__(max_entries)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            """CREATE TABLE IF NOT EXISTS response_cache (
+                cache_key TEXT PRIMARY KEY,
+                semantic_model_name TEXT,
+                semantic_model_hash TEXT,
+                response TEXT,
+                last_hit_at REAL
+            )"""
+        )
+        self._db.commit()
+
+    def get(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        key = cache_key(question, semantic_model_hash, model, backend, settings)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT response FROM response_cache WHERE cache_key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE response_cache SET last_hit_at = ? WHERE cache_key = ?",
+                (time.time(), key),
+            )
+            self._db.commit()
+        return json.loads(row[0])  # type: ignore[no-any-return]
+
+    def put(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        response: Dict[str, Any],
+        semantic_model_name: str = "",
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        key = cache_key(question, semantic_model_hash, model, backend, settings)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?)",
+                (
+                    key,
+                    semantic_model_name,
+                    semantic_model_hash,
+                    json.dumps(response, ensure_ascii=False),
+                    time.time(),
+                ),
+            )
+            self._db.execute(
+                """DELETE FROM response_cache WHERE cache_key NOT IN (
+                    SELECT cache_key FROM response_cache ORDER BY last_hit_at DESC LIMIT ?
+                )""",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def invalidate(
+        self, semantic_model_name: str, keep_model_hash: Optional[str] = None
+    ) -> None:
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM response_cache WHERE semantic_model_name = ? AND semantic_model_hash != ?",
+                (semantic_model_name, keep_model_hash or ""),
+            )
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM response_cache")
+            self._db.commit()
+
+
+class SnowflakeResponseCache(ResponseCache):
+    """
+    Response cache in a Snowflake table, shared by all app instances using the same table.
+    The table is created if it does not exist. Eviction runs every evict_every writes to keep writes cheap.
+    """
+
+    def __init__(
+        self,
+        conn: SnowflakeConnection,
+        table_fqn: str,
+        max_entries: int = _DEFAULT_MAX_ENTRIES,
+        evict_every: int = 50,
+    ) -> None:
+        super().__init__(max_entries)
+        self.conn = conn
+        self.table_fqn = table_fqn
+        self.evict_every = evict_every
+        self._writes = 0
+        self._execute(
+            f"""CREATE TABLE IF NOT EXISTS {table_fqn} (
+                CACHE_KEY STRING PRIMARY KEY,
+                SEMANTIC_MODEL_NAME STRING,
+                SEMANTIC_MODEL_HASH STRING,
+                RESPONSE STRING,
+                LAST_HIT_AT TIMESTAMP_NTZ
+            )"""
+        )
+
+    def _execute(self, query: str, params: Optional[tuple[Any, ...]] = None) -> Any:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+            return cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def get(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> Optional[Dict[str, Any]]:
+        key = cache_key(question, semantic_model_hash, model, backend, settings)
+        rows = self._execute(
+            f"SELECT RESPONSE FROM {self.table_fqn} WHERE CACHE_KEY = %s", (key,)
+        )
+        if not rows:
+            return None
+        self._execute(
+            f"UPDATE {self.table_fqn} SET LAST_HIT_AT = CURRENT_TIMESTAMP() WHERE CACHE_KEY = %s",
+            (key,),
+        )
+        return json.loads(rows[0][0])  # type: ignore[no-any-return]
+
+    def put(
+        self,
+        question: str,
+        semantic_model_hash: str,
+        model: str,
+        backend: str,
+        response: Dict[str, Any],
+        semantic_model_name: str = "",
+        settings: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        key = cache_key(question, semantic_model_hash, model, backend, settings)
+        self._execute(
+            f"""MERGE INTO {self.table_fqn} t
+            USING (SELECT %s AS CACHE_KEY, %s AS SEMANTIC_MODEL_NAME, %s AS SEMANTIC_MODEL_HASH, %s AS RESPONSE) s
+            ON t.CACHE_KEY = s.CACHE_KEY
+            WHEN MATCHED THEN UPDATE SET RESPONSE = s.RESPONSE, LAST_HIT_AT = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT (CACHE_KEY, SEMANTIC_MODEL_NAME, SEMANTIC_MODEL_HASH, RESPONSE, LAST_HIT_AT)
+            VALUES (s.CACHE_KEY, s.SEMANTIC_MODEL_NAME, s.SEMANTIC_MODEL_HASH, s.RESPONSE, CURRENT_TIMESTAMP())""",
+            (
+                key,
+                semantic_model_name,
+                semantic_model_hash,
+                json.dumps(response, ensure_ascii=False),
+            ),
+        )
+        self._writes += 1
+        if self._writes % self.evict_every == 0:
+            self._execute(
+                f"""DELETE FROM {self.table_fqn} WHERE CACHE_KEY NOT IN (
+                    SELECT CACHE_KEY FROM {self.table_fqn} ORDER BY LAST_HIT_AT DESC LIMIT {int(self.max_entries)}
+                )"""
+            )
+
+    def invalidate(
+        self, semantic_model_name: str, keep_model_hash: Optional[str] = None
+    ) -> None:
+        self._execute(
+            f"DELETE FROM {self.table_fqn} WHERE SEMANTIC_MODEL_NAME = %s AND SEMANTIC_MODEL_HASH != %s",
+            (semantic_model_name, keep_model_hash or ""),
+        )
+
+    def clear(self) -> None:
+        self._execute(f"DELETE FROM {self.table_fqn}")
+
+
+def create_response_cache(
+    conn: Optional[SnowflakeConnection],
+    table_fqn: str = "",
+    path: str = ":memory:",
+    max_entries: int = _DEFAULT_MAX_ENTRIES,
+) -> ResponseCache:
+    """
+    Returns a Snowflake table backed cache if table_fqn is set, and a local cache at path otherwise.
+    Falls back to the local cache if the Snowflake table cannot be used.
+    """
+    if table_fqn and conn is not None:
+        try:
+            return SnowflakeResponseCache(conn, table_fqn, max_entries)
+        except Exception as e:
+            logger.warning(
+                f"Unable to use response cache table {table_fqn}, using a local cache: {e}"
+            )
+    return LocalResponseCache(path or ":memory:", max_entries)
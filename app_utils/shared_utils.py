@@ -11,11 +11,17 @@ from typing import Any, Dict, List, Optional, Union
 
 import pandas as pd
 import streamlit as st
+from loguru import logger
 from PIL import Image
 from snowflake.connector import ProgrammingError
 from snowflake.connector.connection import SnowflakeConnection
 from snowflake.snowpark import Session
 
+from semantic_model_generator.data_processing.compiled_model import (
+    compile_semantic_model,
+    compiled_model_file_name,
+    load_semantic_model,
+)
 from semantic_model_generator.data_processing.proto_utils import (
     proto_to_yaml,
     yaml_to_semantic_model,
@@ -29,6 +35,10 @@ from semantic_model_generator.protos.semantic_model_pb2 import Dimension, Table
 from semantic_model_generator.snowflake_utils.env_vars import (  # noqa: E402
     assert_required_env_vars,
 )
+from semantic_model_generator.snowflake_utils.prompt_context import (
+    get_prompt_context_store,
+    prompt_sql,
+)
 from semantic_model_generator.snowflake_utils.snowflake_connector import (
     SnowflakeConnector,
     fetch_databases,
@@ -39,6 +49,7 @@ from semantic_model_generator.snowflake_utils.snowflake_connector import (
     fetch_warehouses,
     fetch_yaml_names_in_stage,
 )
+from semantic_model_generator.validate.catalog import CatalogSnapshot
 
 SNOWFLAKE_ACCOUNT = os.environ.get("SNOWFLAKE_ACCOUNT_LOCATOR", "")
 
@@ -46,6 +57,9 @@ SNOWFLAKE_ACCOUNT = os.environ.get("SNOWFLAKE_ACCOUNT_LOCATOR", "")
 USE_QWEN_FOR_CHINA = os.environ.get("USE_QWEN_FOR_CHINA", "false").lower() == "true"
 QWEN_MODEL = os.environ.get("QWEN_MODEL", "qwen-turbo")
 
+# Optional path to a catalog snapshot json, used to validate semantic models offline.
+CATALOG_SNAPSHOT_PATH = os.environ.get("CATALOG_SNAPSHOT_PATH", "")
+
 # Default configurable paths
 DEFAULT_QWEN_UDF_PATH = "SNOWFLAKE_PROD_USER1.CORTEX_ANALYST.QWEN_COMPLETE"
 
@@ -605,6 +619,12 @@ def init_session_states() -> None:
     if "multiturn" not in st.session_state:
         st.session_state.multiturn = False
 
+    # Validation settings. The catalog snapshot used by offline validation can be preloaded from a file.
+    if "offline_validation" not in st.session_state:
+        st.session_state.offline_validation = bool(CATALOG_SNAPSHOT_PATH)
+    if "catalog_snapshot" not in st.session_state and CATALOG_SNAPSHOT_PATH:
+        st.session_state.catalog_snapshot = CatalogSnapshot.load(CATALOG_SNAPSHOT_PATH)
+
     # initialize session states for the chat page.
     if "messages" not in st.session_state:
         # messages store all chat histories
@@ -1228,6 +1248,24 @@ def upload_yaml(file_name: str) -> None:
             overwrite=True,
         )
 
+        # Write the compiled sidecar next to the yaml, so that loaders can skip parsing it.
+        # The yaml stays the source of truth, so failing to compile must not fail the upload.
+        try:
+            compiled = compile_semantic_model(yaml, st.session_state.semantic_model)
+            compiled_file_path = os.path.join(
+                temp_dir, compiled_model_file_name(f"{file_name}.yaml")
+            )
+            with open(compiled_file_path, "wb") as compiled_file:
+                compiled_file.write(compiled.to_bytes())
+            st.session_state.session.file.put(
+                compiled_file_path,
+                f"@{st.session_state.snowflake_stage.stage_name}",
+                auto_compress=False,
+                overwrite=True,
+            )
+        except Exception as e:
+            logger.warning(f"Unable to upload compiled semantic model: {e}")
+
 
 def validate_and_upload_tmp_yaml(conn: SnowflakeConnection) -> None:
     """
@@ -1283,6 +1321,26 @@ def download_yaml(file_name: str, stage_name: str) -> str:
             return yaml_str
 
 
+def download_semantic_model(
+    file_name: str, stage_name: str
+) -> tuple[str, semantic_model_pb2.SemanticModel]:
+    """
+    util to download a semantic YAML from a stage, together with its parsed model.
+    The model is read from the compiled sidecar when it matches the YAML, and parsed from the YAML otherwise.
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # GET treats the path as a prefix, so this one round trip also downloads the sidecar if there is one.
+        st.session_state.session.file.get(f"@{stage_name}/{file_name}", temp_dir)
+        with open(os.path.join(temp_dir, file_name), "r", encoding="utf-8") as f:
+            yaml_str = f.read()
+        compiled_bytes = None
+        compiled_path = os.path.join(temp_dir, compiled_model_file_name(file_name))
+        if os.path.exists(compiled_path):
+            with open(compiled_path, "rb") as compiled_file:
+                compiled_bytes = compiled_file.read()
+    return yaml_str, load_semantic_model(yaml_str, compiled_bytes)
+
+
 def get_sit_query_tag(
     vendor: Optional[str] = None, action: Optional[str] = None
 ) -> str:
@@ -1384,8 +1442,14 @@ def run_cortex_complete(
     prompt_args: Optional[dict[str, Any]] = None,
 ) -> str | None:
 
+    contexts: tuple[str, ...] = ()
     if prompt_args:
-        prompt = prompt.format(**prompt_args).replace("'", "\\'")
+        prompt = prompt.format(**prompt_args)
+        # Large arguments, like a semantic model, are passed by reference instead of being inlined.
+        contexts = tuple(v for v in prompt_args.values() if isinstance(v, str))
+    prompt_expr = prompt_sql(
+        prompt, contexts, get_prompt_context_store(conn) if contexts else None
+    )
     
     # Check if China region (use session state or detect)
     is_china = st.session_state.get("is_china_region", USE_QWEN_FOR_CHINA)
@@ -1399,9 +1463,9 @@ def run_cortex_complete(
         elif model in ["llama3-8b", "llama3-70b"]:
             qwen_model = "qwen-turbo"
         udf_path = get_qwen_udf_path()
-        complete_sql = f"SELECT {udf_path}('{qwen_model}', '{prompt}')"
+        complete_sql = f"SELECT {udf_path}('{qwen_model}', {prompt_expr})"
     else:
-        complete_sql = f"SELECT snowflake.cortex.complete('{model}', '{prompt}')"
+        complete_sql = f"SELECT snowflake.cortex.complete('{model}', {prompt_expr})"
     
     response = conn.cursor().execute(complete_sql)
 
@@ -0,0 +1,279 @@
+"""
+Benchmarks for the semantic model data processing hot paths, on synthetic models of 10, 100 and 1,000 tables plus
+wide-table variants. Everything runs offline, no Snowflake connection is needed.
+
+Usage:
+    python -m benchmarks.data_processing                  # run and compare against benchmarks/baseline.json
+    python -m benchmarks.data_processing --save-baseline  # run and overwrite the baseline
+    python -m benchmarks.data_processing --models tables_10 wide_10
+
+Exits with a non-zero status if any benchmark is slower than its baseline by more than --tolerance.
+Timings are machine dependent, so regenerate the baseline when moving to a different machine.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Tuple
+
+from loguru import logger
+
+from semantic_model_generator.data_processing.cte_utils import (
+    context_to_column_format,
+    expand_all_logical_tables_as_ctes,
+    generate_select,
+    logical_table_name,
+    remove_ltable_cte,
+)
+from semantic_model_generator.data_processing.proto_utils import (
+    proto_to_yaml,
+    yaml_to_semantic_model,
+)
+from semantic_model_generator.protos import semantic_model_pb2
+from semantic_model_generator.validate.context_length import validate_context_length
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+# name -> (number of tables, number of columns per table)
+MODEL_SIZES: Dict[str, Tuple[int, int]] = {
+    "tables_10": (10, 12),
+    "tables_100": (100, 12),
+    "tables_1000": (1000, 12),
+    "wide_10": (10, 200),
+    "wide_100": (100, 200),
+}
+
+_MIN_ROUNDS = 3
+_MAX_ROUNDS = 50
+_MIN_TOTAL_SEC = 1.0
+# Slow benchmarks on the large models stop early once this much time was spent, even below _MIN_ROUNDS.
+_MAX_TOTAL_SEC = 10.0
+
+
+def synthetic_semantic_model(
+    num_tables: int, num_columns: int
+) -> semantic_model_pb2.SemanticModel:
+    """
+    Returns a semantic model with num_tables tables that each have num_columns columns, split between dimensions,
+    time dimensions and measures, joined in a chain by relationships, plus a few verified queries.
+    """
+    model = semantic_model_pb2.SemanticModel(
+        name=f"benchmark_{num_tables}x{num_columns}",
+        description="Synthetic semantic model for benchmarks.",
+    )
+    for t in range(num_tables):
+        table = model.tables.add(
+            name=f"table_{t}",
+            description=f"Synthetic table number {t}.",
+            base_table=semantic_model_pb2.FullyQualifiedTable(
+                database="BENCH_DB", schema="BENCH_SCHEMA", table=f"TABLE_{t}"
+            ),
+        )
+        table.time_dimensions.add(
+            name="created_at",
+            expr="created_at",
+            data_type="TIMESTAMP_NTZ",
+            description="Creation time.",
+        )
+        for c in range(num_columns - 1):
+            if c % 3 == 0:
+                table.measures.add(
+                    name=f"measure_{c}",
+                    expr=f"m_{c}",
+                    data_type="NUMBER",
+                    description=f"Measure {c}.",
+                    synonyms=[f"amount {c}"],
+                    default_aggregation=semantic_model_pb2.AggregationType.sum,
+                )
+            else:
+                table.dimensions.add(
+                    name=f"dimension_{c}",
+                    expr=f"d_{c}",
+                    data_type="VARCHAR",
+                    description=f"Dimension {c}.",
+                    synonyms=[f"attribute {c}"],
+                    sample_values=[f"value_{c}_{v}" for v in range(5)],
+                )
+        if t > 0:
+            relationship = model.relationships.add(
+                name=f"table_{t - 1}_to_table_{t}",
+                left_table=f"table_{t - 1}",
+                right_table=f"table_{t}",
+                join_type=semantic_model_pb2.JoinType.inner,
+                relationship_type=semantic_model_pb2.RelationshipType.many_to_one,
+            )
+            relationship.relationship_columns.add(
+                left_column="dimension_1", right_column="dimension_1"
+            )
+    for q in range(min(num_tables, 10)):
+        model.verified_queries.add(
+            name=f"query_{q}",
+            question=f"What is the total of measure 0 per dimension 1 in table {q}?",
+            sql=_sample_sql(model.tables[q]),
+            verified_at=1700000000,
+            verified_by="benchmark",
+        )
+    return model
+
+
+def _sample_sql(table: semantic_model_pb2.Table) -> str:
+    return (
+        f"SELECT dimension_1, SUM(measure_0) AS total FROM {logical_table_name(table)} "
+        "GROUP BY dimension_1 ORDER BY total DESC LIMIT 10"
+    )
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    rounds: int
+    min_sec: float
+    median_sec: float
+
+
+def _time(name: str, func: Callable[[], Any]) -> BenchmarkResult:
+    """
+    Runs func at least _MIN_ROUNDS times and until _MIN_TOTAL_SEC elapsed, capped at _MAX_ROUNDS rounds and at
+    _MAX_TOTAL_SEC after the first round.
+    """
+    timings: List[float] = []
+    start = time.perf_counter()
+    while len(timings) < _MAX_ROUNDS:
+        elapsed = time.perf_counter() - start
+        if timings and elapsed >= _MAX_TOTAL_SEC:
+            break
+        if len(timings) >= _MIN_ROUNDS and elapsed >= _MIN_TOTAL_SEC:
+            break
+        round_start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - round_start)
+    return BenchmarkResult(
+        name=name,
+        rounds=len(timings),
+        min_sec=min(timings),
+        median_sec=statistics.median(timings),
+    )
+
+
+def run_model_benchmarks(
+    model_name: str, num_tables: int, num_columns: int
+) -> List[BenchmarkResult]:
+    model = synthetic_semantic_model(num_tables, num_columns)
+    yaml_str = proto_to_yaml(model)
+    ctx = context_to_column_format(model)
+    sql = _sample_sql(model.tables[0])
+    expanded_sql = expand_all_logical_tables_as_ctes(sql, ctx)
+    table_names = [t.name for t in model.tables]
+
+    benchmarks: List[Tuple[str, Callable[[], Any]]] = [
+        ("proto_to_yaml", lambda: proto_to_yaml(model)),
+        ("yaml_to_semantic_model", lambda: yaml_to_semantic_model(yaml_str)),
+        ("validate_context_length", lambda: validate_context_length(model)),
+        ("context_to_column_format", lambda: context_to_column_format(model)),
+        (
+            "generate_select",
+            lambda: [generate_select(table, 100) for table in ctx.tables],
+        ),
+        (
+            "expand_all_logical_tables_as_ctes",
+            lambda: expand_all_logical_tables_as_ctes(sql, ctx),
+        ),
+        ("remove_ltable_cte", lambda: remove_ltable_cte(expanded_sql, table_names)),
+    ]
+    return [_time(f"{model_name}/{name}", func) for name, func in benchmarks]
+
+
+def compare_to_baseline(
+    results: List[BenchmarkResult], baseline: Dict[str, Any], tolerance: float
+) -> List[str]:
+    """Returns a message for every benchmark whose median is slower than its baseline by more than tolerance."""
+    regressions = []
+    for result in results:
+        expected = baseline.get("results", {}).get(result.name)
+        if expected is None:
+            continue
+        limit = expected["median_sec"] * (1 + tolerance)
+        if result.median_sec > limit:
+            regressions.append(
+                f"{result.name}: {result.median_sec * 1000:.2f}ms, "
+                f"baseline {expected['median_sec'] * 1000:.2f}ms"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--models",
+        nargs="+",
+        choices=list(MODEL_SIZES),
+        default=list(MODEL_SIZES),
+        help="Synthetic models to benchmark.",
+    )
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Overwrite the baseline with the results of this run.",
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.3,
+        help="Allowed slowdown relative to the baseline, e.g. 0.3 for 30%%.",
+    )
+    args = parser.parse_args()
+
+    # validate_context_length warns for the large models, which is expected here.
+    logger.disable("semantic_model_generator")
+
+    results: List[BenchmarkResult] = []
+    for model_name in args.models:
+        num_tables, num_columns = MODEL_SIZES[model_name]
+        for result in run_model_benchmarks(model_name, num_tables, num_columns):
+            print(
+                f"{result.name:<55} median {result.median_sec * 1000:>10.2f}ms  "
+                f"min {result.min_sec * 1000:>10.2f}ms  rounds {result.rounds}"
+            )
+            results.append(result)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        baseline["machine"] = f"{platform.system()} {platform.machine()}"
+        baseline["python"] = platform.python_version()
+        baseline.setdefault("results", {}).update(
+            {
+                r.name: {
+                    "median_sec": round(r.median_sec, 6),
+                    "min_sec": round(r.min_sec, 6),
+                }
+                for r in results
+            }
+        )
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline found at {args.baseline}, run with --save-baseline first.")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare_to_baseline(results, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions:\n" + "\n".join(regressions))
+        sys.exit(1)
+    print("No regressions.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Runs an evaluation of a semantic model against an evaluation table (ID, QUERY, GOLD_SQL) without the app, and reports
+the accuracy and the p50/p95 latency of each stage (LLM, analyst SQL, gold SQL and judge). Connects to Snowflake with
+the SNOWFLAKE_* environment variables, like the app does without a Streamlit connection.
+
+Usage:
+    python -m benchmarks.evaluation --model model.yaml --eval-table DB.SCHEMA.EVAL
+    python -m benchmarks.evaluation --model model.yaml --eval-table DB.SCHEMA.EVAL \\
+        --backend "SPCS (本地)" --llm-model qwen-plus --output report.json --fail-under 80
+
+Pass --results-table to store the results like the evaluation mode of the app does (the table is created, or migrated
+from the legacy layout, before the run), and --incremental to reuse the stored results of questions already evaluated
+with the same semantic model. Exits with a non-zero status if the accuracy is below --fail-under, or if a quick
+evaluation is below the last accepted run.
+
+With --quick, a stratified sample of the questions (by the tables of their gold SQL, or with --stratify failing by
+their outcome in the last stored run) is evaluated batch by batch, and the run stops once the accuracy interval is
+narrower than --target-half-width or lies below the accuracy of the last full run in --results-table (or --baseline):
+    python -m benchmarks.evaluation --model model.yaml --eval-table DB.SCHEMA.EVAL \\
+        --results-table DB.SCHEMA.EVAL_RESULTS --quick --stratify failing
+"""
+
+import argparse
+import hashlib
+import json
+import sys
+import time
+from typing import Any, Dict, Optional
+
+import pandas as pd
+import streamlit as st
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+
+from app_utils.chat import get_response_cache, send_message, send_message_cached
+from app_utils.eval_runner import (
+    EvaluationConfig,
+    EvaluationReport,
+    EvaluationRunner,
+    last_full_run_accuracy,
+    last_results,
+    prepare_results_table,
+    reusable_results,
+    store_results,
+)
+from semantic_model_generator.data_processing.query_result_cache import QueryResultCache
+from semantic_model_generator.data_processing.quick_eval import (
+    STRATIFY_BY_OUTCOME,
+    STRATIFY_BY_TABLE,
+    STRATIFY_OPTIONS,
+    STOP_BELOW_BASELINE,
+    QuickEvalConfig,
+    outcome_strata,
+    table_strata,
+)
+from semantic_model_generator.snowflake_utils.env_vars import (
+    SNOWFLAKE_ACCOUNT_LOCATOR,
+    SNOWFLAKE_HOST,
+    assert_required_env_vars,
+)
+from semantic_model_generator.snowflake_utils.snowflake_connector import (
+    SnowflakeConnector,
+    fetch_table,
+)
+
+
+def _settings(args: argparse.Namespace) -> Dict[str, Any]:
+    """Returns the chat settings that send_message reads from st.session_state, which works without a running app."""
+    settings: Dict[str, Any] = {
+        "sis": False,
+        "host_name": SNOWFLAKE_HOST,
+        "use_response_cache": args.response_cache,
+        # Streams are only read in the chat UI.
+        "stream_responses": False,
+    }
+    if args.backend:
+        settings["model_backend"] = args.backend
+    if args.llm_model:
+        settings["selected_model"] = args.llm_model
+    if args.sql_generation_mode:
+        settings["sql_generation_mode"] = args.sql_generation_mode
+    return settings
+
+
+def _run_quick(
+    runner: EvaluationRunner,
+    conn: SnowflakeConnection,
+    eval_frame: pd.DataFrame,
+    previous: Optional[pd.DataFrame],
+    args: argparse.Namespace,
+) -> EvaluationReport:
+    quick = QuickEvalConfig(
+        batch_size=args.batch_size,
+        max_questions=args.max_questions,
+        target_half_width=args.target_half_width,
+        stratify=args.stratify,
+    )
+    baseline = args.baseline
+    if baseline is None and args.results_table:
+        try:
+            baseline = last_full_run_accuracy(
+                conn, args.results_table, args.eval_table, len(eval_frame)
+            )
+        except Exception as e:
+            logger.warning(f"Unable to read the accuracy of the last full run: {e}")
+    if args.stratify == STRATIFY_BY_OUTCOME:
+        last_outcomes = None
+        if args.results_table:
+            try:
+                last_outcomes = last_results(conn, args.results_table, args.eval_table)
+            except Exception as e:
+                logger.warning(f"Unable to read the last evaluation results: {e}")
+        strata = outcome_strata(eval_frame, last_outcomes)
+    else:
+        strata = table_strata(eval_frame, conn.database, conn.schema)
+    logger.info(
+        f"Quick evaluation in {strata.nunique()} strata, baseline accuracy: {baseline}"
+    )
+    return runner.run_quick(eval_frame, strata, quick, baseline, previous)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--model", required=True, help="Semantic model yaml file.")
+    parser.add_argument(
+        "--eval-table", required=True, help="Fully qualified evaluation table."
+    )
+    parser.add_argument(
+        "--results-table",
+        help="Fully qualified results table to store the results in, created if it does not exist.",
+    )
+    parser.add_argument("--run-name", default="", help="EVAL_RUN_NAME of the results.")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--query-timeout", type=int, default=300)
+    parser.add_argument("--backend", help="Qwen backend, as in the chat settings.")
+    parser.add_argument("--llm-model", help="Qwen model generating the SQL.")
+    parser.add_argument(
+        "--sql-generation-mode", choices=["structured", "two_call"], default=None
+    )
+    parser.add_argument("--judge-model", default="")
+    parser.add_argument(
+        "--no-llm-judge",
+        action="store_true",
+        help="Count results that do not match exactly as wrong instead of asking the LLM judge.",
+    )
+    parser.add_argument(
+        "--response-cache",
+        action="store_true",
+        help="Reuse cached responses and verdicts. Off by default, so that latencies are those of the backend.",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Reuse the results in --results-table of questions already evaluated with this semantic model.",
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Evaluate a stratified sample of the questions, stopping early.",
+    )
+    parser.add_argument(
+        "--stratify", choices=list(STRATIFY_OPTIONS), default=STRATIFY_BY_TABLE
+    )
+    parser.add_argument("--batch-size", type=int, default=QuickEvalConfig.batch_size)
+    parser.add_argument(
+        "--max-questions",
+        type=int,
+        default=QuickEvalConfig.max_questions,
+        help="Largest sample of a quick evaluation, no limit if 0.",
+    )
+    parser.add_argument(
+        "--target-half-width",
+        type=float,
+        default=QuickEvalConfig.target_half_width,
+        help="Stop a quick evaluation once the accuracy is known within this many percentage points.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=float,
+        help="Accuracy (in %%) of the accepted run, the last full run in --results-table by default.",
+    )
+    parser.add_argument("--output", help="Write the report as json to this file.")
+    parser.add_argument(
+        "--fail-under",
+        type=float,
+        help="Exit with a non-zero status if the accuracy (in %%) is below this.",
+    )
+    args = parser.parse_args()
+    if args.incremental and not args.results_table:
+        parser.error("--incremental needs --results-table")
+
+    missing_env_vars = assert_required_env_vars()
+    if missing_env_vars:
+        sys.exit(f"Missing environment variables: {', '.join(missing_env_vars)}")
+    with open(args.model, encoding="utf-8") as f:
+        semantic_model = f.read()
+    for key, value in _settings(args).items():
+        st.session_state[key] = value
+
+    conn = SnowflakeConnector(account_name=SNOWFLAKE_ACCOUNT_LOCATOR).open_connection(
+        db_name=""
+    )
+    if args.results_table:
+        # Before the run, so that a results table that cannot be used does not waste it.
+        try:
+            prepare_results_table(conn, args.results_table)
+        except Exception as e:
+            sys.exit(f"Unable to prepare the results table {args.results_table}: {e}")
+    eval_frame = fetch_table(conn, args.eval_table).set_index("ID")
+    logger.info(f"Evaluating {len(eval_frame)} questions of {args.eval_table}")
+
+    runner = EvaluationRunner(
+        conn=conn,
+        semantic_model=semantic_model,
+        send_message=send_message_cached if args.response_cache else send_message,
+        config=EvaluationConfig(
+            concurrency=args.concurrency,
+            query_timeout_sec=args.query_timeout,
+            use_llm_judge=not args.no_llm_judge,
+            judge_model=args.judge_model,
+        ),
+        judge_cache=get_response_cache(conn) if args.response_cache else None,
+        # As in incremental runs of the app, gold queries whose tables have not changed run once.
+        gold_cache=QueryResultCache(),
+        on_progress=lambda stage, done, total: logger.info(f"{stage}: {done}/{total}"),
+    )
+    previous = None
+    if args.incremental:
+        try:
+            previous = reusable_results(
+                conn, args.results_table, eval_frame, semantic_model
+            )
+            logger.info(f"Reusing the stored results of {len(previous)} questions")
+        except Exception as e:
+            logger.warning(f"Unable to read previous evaluation results: {e}")
+    if args.quick:
+        report = _run_quick(runner, conn, eval_frame, previous, args)
+    else:
+        report = runner.run(eval_frame, previous)
+    print(report.format())
+
+    if args.results_table:
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        store_results(
+            conn=conn,
+            frame=report.results,
+            results_table=args.results_table,
+            semantic_model=semantic_model,
+            run=dict(
+                TIMESTAMP=timestamp,
+                # The md5 of the run timestamp, as in the app.
+                EVAL_HASH=hashlib.md5(timestamp.encode()).hexdigest(),
+                EVAL_RUN_NAME=args.run_name,
+                EVAL_TABLE=args.eval_table,
+            ),
+        )
+        print(f"Stored the results in {args.results_table}")
+
+    if args.output:
+        summary = report.to_dict()
+        summary.update(
+            model=args.model,
+            eval_table=args.eval_table,
+            backend=args.backend,
+            llm_model=args.llm_model,
+        )
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        print(f"Saved the report to {args.output}")
+
+    if report.stop_reason == STOP_BELOW_BASELINE:
+        print("Accuracy is below the last accepted run")
+        sys.exit(1)
+    if args.fail_under is not None and report.accuracy < args.fail_under:
+        print(f"Accuracy {report.accuracy:.2f}% is below {args.fail_under:.2f}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
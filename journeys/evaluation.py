@@ -1,17 +1,15 @@
 import hashlib
 import os
-import re
+import threading
 import time
-from textwrap import dedent
-from typing import Any
+from typing import Any, Callable, Optional
 
 import pandas as pd
-import snowflake.snowpark._internal.utils as snowpark_utils
 import sqlglot
 import streamlit as st
 import yaml
 from loguru import logger
-from snowflake.connector.pandas_tools import write_pandas
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 
 # 兼容性处理：旧版本 streamlit 不支持 experimental_dialog
@@ -30,26 +28,29 @@ def _compat_dialog(title="Dialog", width="small"):
             return wrapper
         return decorator
 
-# Default Qwen model for LLM Judge
-QWEN_JUDGE_MODEL = os.environ.get("QWEN_JUDGE_MODEL", "qwen-max")
-
-
-def _is_china_region_eval() -> bool:
-    """Check if running in China region using cached session state."""
-    # Check cache first
-    if "is_china_region" in st.session_state:
-        return st.session_state["is_china_region"]
-    
-    # Check environment variable
-    if os.environ.get("USE_QWEN_FOR_CHINA", "").lower() == "true":
-        return True
-    
-    # Will be set by chat.py when connection is established
-    return False
-
-from app_utils.chat import send_message
+# Default number of analyst requests in flight at once during an evaluation run
+EVAL_CONCURRENCY = int(os.environ.get("EVAL_CONCURRENCY", "8"))
+
+# Analyst and gold queries still running after this many seconds are cancelled
+EVAL_QUERY_TIMEOUT_SEC = float(os.environ.get("EVAL_QUERY_TIMEOUT_SEC", "300"))
+
+
+from app_utils.chat import get_response_cache, send_message
+from app_utils.eval_runner import (
+    LEGACY_RESULTS_TABLE_SCHEMA,
+    RESULTS_TABLE_SCHEMA,
+    STAGE_JUDGE,
+    STAGE_LLM,
+    EvaluationConfig,
+    EvaluationReport,
+    EvaluationRunner,
+    last_full_run_accuracy,
+    last_results,
+    prepare_results_table,
+    reusable_results,
+    store_results,
+)
 from app_utils.shared_utils import (
-    get_qwen_udf_path,
     get_snowflake_connection,
     schema_selector_container,
     set_sit_query_tag,
@@ -59,9 +60,18 @@ from app_utils.shared_utils import (
     validate_table_schema,
 )
 from semantic_model_generator.data_processing.proto_utils import proto_to_yaml
+from semantic_model_generator.data_processing.query_result_cache import QueryResultCache
+from semantic_model_generator.data_processing.quick_eval import (
+    STOP_BELOW_BASELINE,
+    STRATIFY_BY_OUTCOME,
+    STRATIFY_BY_TABLE,
+    STRATIFY_OPTIONS,
+    QuickEvalConfig,
+    outcome_strata,
+    table_strata,
+)
 from semantic_model_generator.snowflake_utils.snowflake_connector import (
     create_table_in_schema,
-    execute_query,
     fetch_table,
     get_table_hash,
 )
@@ -72,45 +82,6 @@ EVALUATION_TABLE_SCHEMA = {
     "QUERY": "VARCHAR",
     "GOLD_SQL": "VARCHAR",
 }
-RESULTS_TABLE_SCHEMA = {
-    "TIMESTAMP": "TIMESTAMP_NTZ",
-    "ID": "VARCHAR",
-    "QUERY": "VARCHAR",
-    "ANALYST_TEXT": "VARCHAR",
-    "ANALYST_SQL": "VARCHAR",
-    "ANALYST_RESULT": "VARCHAR",
-    "GOLD_SQL": "VARCHAR",
-    "GOLD_RESULT": "VARCHAR",
-    "CORRECT": "BOOLEAN",
-    "EXPLANATION": "VARCHAR",
-    "MODEL_HASH": "VARCHAR",
-    "SEMANTIC_MODEL_STRING": "VARCHAR",
-    "EVAL_TABLE": "VARCHAR",
-    "EVAL_HASH": "VARCHAR",
-    "EVAL_RUN_NAME": "VARCHAR",
-}
-
-LLM_JUDGE_PROMPT_TEMPLATE = """\
-[INST] Your task is to determine whether the two given dataframes are
-equivalent semantically in the context of a question. You should attempt to
-answer the given question by using the data in each dataframe. If the two
-answers are equivalent, those two dataframes are considered equivalent.
-Otherwise, they are not equivalent. Please also provide your reasoning.
-If they are equivalent, output "REASON: <reason>. ANSWER: true". If they are
-not equivalent, output "REASON: <reason>. ANSWER: false".
-
-### QUESTION: {input_question}
-
-* DATAFRAME 1:
-{frame1_str}
-
-* DATAFRAME 2:
-{frame2_str}
-
-Are the two dataframes equivalent?
-OUTPUT:
-[/INST] """
-
 
 def visualize_eval_results(frame: pd.DataFrame) -> None:
     n_questions = len(frame)
@@ -169,320 +140,99 @@ def visualize_eval_results(frame: pd.DataFrame) -> None:
                 st.write(f"**Explanation**: {row['EXPLANATION']}")
 
 
-def _llm_judge(frame: pd.DataFrame, max_frame_size=200) -> pd.DataFrame:
-
-    if frame.empty:
-        return pd.DataFrame({"EXPLANATION": [], "CORRECT": []})
-
-    # create prompt frame series
-    col_name = "LLM_JUDGE_PROMPT"
-
-    prompt_frame = frame.apply(
-        axis=1,
-        func=lambda x: LLM_JUDGE_PROMPT_TEMPLATE.format(
-            input_question=x["QUERY"],
-            frame1_str=x["ANALYST_RESULT"][:max_frame_size].to_string(index=False),
-            frame2_str=x["GOLD_RESULT"][:max_frame_size].to_string(index=False),
-        ),
-    ).to_frame(name=col_name)
-    session = st.session_state["session"]
-    table_name = snowpark_utils.random_name_for_temp_object(
-        snowpark_utils.TempObjectType.TABLE
-    )
+def _evaluation_runner(
+    on_progress: Optional[Callable[[str, int, int], None]] = None
+) -> EvaluationRunner:
+    """Returns the EvaluationRunner of the evaluation settings of the session, reporting progress to on_progress."""
     conn = get_snowflake_connection()
-    snowpark_df = session.create_dataframe(prompt_frame)
-    snowpark_df.write.mode("overwrite").save_as_table(
-        table_name, table_type="temporary"
-    )
-
-    # Use Qwen for China region, otherwise use Cortex
-    if _is_china_region_eval():
-        udf_path = get_qwen_udf_path()
-        query = f"""
-        SELECT {udf_path}('{QWEN_JUDGE_MODEL}', {col_name}) AS LLM_JUDGE
-        FROM {conn.database}.{conn.schema}.{table_name}
-        """
-    else:
-        query = f"""
-        SELECT SNOWFLAKE.CORTEX.COMPLETE('mistral-large2', {col_name}) AS LLM_JUDGE
-        FROM {conn.database}.{conn.schema}.{table_name}
-        """
-    
-    cursor = conn.cursor()
-    cursor.execute(query)
-    llm_judge_frame = cursor.fetch_pandas_all()
-    llm_judge_frame.index = frame.index
-
-    reason_filter = re.compile(r"REASON\:([\S\s]*?)ANSWER\:")
-    answer_filter = re.compile(r"ANSWER\:([\S\s]*?)$")
-
-    def _safe_re_search(x, filter):  # type: ignore[no-untyped-def]
-        try:
-            return re.search(filter, x).group(1).strip()  # type: ignore[union-attr]
-        except Exception as e:
-            return f"Could Not Parse LLM Judge Response: {x} with error: {e}"
-
-    llm_judge_frame["EXPLANATION"] = llm_judge_frame["LLM_JUDGE"].apply(
-        _safe_re_search, args=(reason_filter,)
-    )
-    llm_judge_frame["CORRECT"] = (
-        llm_judge_frame["LLM_JUDGE"]
-        .apply(_safe_re_search, args=(answer_filter,))
-        .str.lower()
-        .eq("true")
+    # Worker threads need the script run context for session state (settings) and st.cache_data.
+    script_run_ctx = get_script_run_ctx()
+    return EvaluationRunner(
+        conn=conn,
+        # The model is the same for every request, so serialize it once.
+        semantic_model=proto_to_yaml(st.session_state.semantic_model),
+        send_message=send_message,  # type: ignore[arg-type]
+        config=EvaluationConfig(
+            concurrency=st.session_state.get("eval_concurrency", EVAL_CONCURRENCY),
+            query_timeout_sec=st.session_state.get(
+                "eval_query_timeout", EVAL_QUERY_TIMEOUT_SEC
+            ),
+        ),
+        judge_cache=(
+            get_response_cache(conn)
+            if st.session_state.get("use_response_cache", True)
+            else None
+        ),
+        # In incremental runs, gold queries whose tables have not changed since they last ran are not run again.
+        gold_cache=(
+            get_gold_result_cache()
+            if st.session_state.get("eval_incremental", True)
+            else None
+        ),
+        on_progress=on_progress,
+        thread_initializer=lambda: add_script_run_ctx(
+            threading.current_thread(), script_run_ctx
+        ),
     )
-    return llm_judge_frame
-
-
-def _results_contain_gold_data(
-    analyst_frame: pd.DataFrame,
-    gold_frame: pd.DataFrame,
-) -> bool:
-    """Determine if result frame contains all the same values as a gold frame.
 
-    Args:
-        analyst_frame: the data generated from the LLM constructed user query
-        gold_frame: the data generated from a gold sql query
-
-    Returns:
-        a boolean indicating if the results contain the gold data
-    """
-    if analyst_frame.shape[0] != gold_frame.shape[0]:
-        return False
-
-    unmatched_result_cols = analyst_frame.columns
-    for gold_col in gold_frame:
-        matching_col = _match_series(
-            analyst_frame=analyst_frame[unmatched_result_cols],
-            gold_series=gold_frame[gold_col],
-        )
-        if matching_col is None:
-            return False
-        else:
-            unmatched_result_cols = unmatched_result_cols.drop(matching_col)
-
-    return True
 
+_PROGRESS_MESSAGES = {
+    STAGE_LLM: "Received {done}/{total} responses from Analyst...",
+    "queries": "Ran {done}/{total} analyst and gold queries...",
+    STAGE_JUDGE: "Judged {done}/{total} results with the LLM Judge...",
+    "quick": "Evaluated {done}/{total} questions of the quick evaluation...",
+}
 
-def result_comparisons() -> None:
-    eval_table_frame: pd.DataFrame = st.session_state["eval_table_frame"]
-    analyst_results_frame = st.session_state["analyst_results_frame"]
-    query_results_frame = st.session_state["query_results_frame"]
 
-    frame = pd.concat(
-        [eval_table_frame, analyst_results_frame, query_results_frame], axis=1
-    )
-    start_time = time.time()
+def _show_progress() -> Callable[[str, int, int], None]:
+    """Returns the on_progress of an EvaluationRunner that shows the progress of each stage of a run."""
+    # Quick evaluations show the questions evaluated so far above the progress of the current batch.
+    quick_text = st.empty()
+    progress_bar = st.progress(0)
     status_text = st.empty()
 
-    matches = pd.Series(False, index=frame.index)
-    explanations = pd.Series("", index=frame.index)
-    use_llm_judge = "<use llm judge>"
-
-    status_text.text("Checking for exact matches...")
-    for row_id, row in frame.iterrows():
-        analyst_is_frame = isinstance(row["ANALYST_RESULT"], pd.DataFrame)
-        gold_is_frame = isinstance(row["GOLD_RESULT"], pd.DataFrame)
-        if (not analyst_is_frame) and (not gold_is_frame):
-            matches[row_id] = False
-            explanations[row_id] = dedent(
-                f"""
-                analyst sql had an error: {row["ANALYST_RESULT"]}
-                gold sql had an error: {row["GOLD_RESULT"]}
-                """
-            )
-        elif (not analyst_is_frame) and gold_is_frame:
-            matches[row_id] = False
-            explanations[row_id] = dedent(
-                f"""
-                analyst sql had an error: {row["ANALYST_RESULT"]}
-                """
-            )
-        elif analyst_is_frame and (not gold_is_frame):
-            matches[row_id] = False
-            explanations[row_id] = dedent(
-                f"""
-                gold sql had an error: {row["GOLD_RESULT"]}
-                """
-            )
-        else:
-            exact_match = _results_contain_gold_data(
-                analyst_frame=row["ANALYST_RESULT"],
-                gold_frame=row["GOLD_RESULT"],
-            )
-            matches[row_id] = exact_match
-            explanations[row_id] = (
-                "Data matches exactly" if exact_match else use_llm_judge
-            )
-
-    frame["CORRECT"] = matches
-    frame["EXPLANATION"] = explanations
-
-    filtered_frame = frame[explanations == use_llm_judge]
+    def _on_progress(stage: str, done: int, total: int) -> None:
+        message = _PROGRESS_MESSAGES[stage].format(done=done, total=total)
+        if stage == "quick":
+            quick_text.text(message)
+            return
+        status_text.text(message)
+        progress_bar.progress(done / total if total else 1.0)
 
-    status_text.text("Calling LLM Judge...")
-    llm_judge_frame = _llm_judge(frame=filtered_frame)
+    return _on_progress
 
-    for col in ("CORRECT", "EXPLANATION"):
-        frame[col] = llm_judge_frame[col].combine_first(frame[col])
 
-    elapsed_time = time.time() - start_time
-    status_text.text(
-        f"Analyst and Gold Results Compared ✅ (Time taken: {elapsed_time:.2f} seconds)"
+def _upload_result_files(local_glob: str, stage: str) -> None:
+    # Uploads go through Snowpark, which also works in Streamlit in Snowflake.
+    st.session_state.session.file.put(
+        local_glob, f"@{stage}", auto_compress=False, overwrite=False, parallel=8
     )
-    # compute accuracy
-    st.session_state["eval_accuracy"] = (frame["CORRECT"].sum() / len(frame)) * 100
-    st.session_state["total_eval_frame"] = frame
 
 
 def write_eval_results(frame: pd.DataFrame) -> None:
-    frame_to_write = frame.copy()
-    frame_to_write["TIMESTAMP"] = st.session_state["eval_timestamp"]
-    frame_to_write["EVAL_HASH"] = st.session_state["eval_hash"]
-    frame_to_write["EVAL_RUN_NAME"] = st.session_state["eval_run_name"]
-    frame_to_write["EVAL_TABLE"] = st.session_state["eval_table"]
-    frame_to_write["EVAL_TABLE_HASH"] = st.session_state["eval_table_hash"]
-    frame_to_write["MODEL_HASH"] = st.session_state["semantic_model_hash"]
-
-    # Save results to frame as string
-    frame_to_write["ANALYST_RESULT"] = frame["ANALYST_RESULT"].apply(
-        lambda x: x.to_json(orient="records") if isinstance(x, pd.DataFrame) else x
-    )
-    frame_to_write["GOLD_RESULT"] = frame["GOLD_RESULT"].apply(
-        lambda x: x.to_json(orient="records") if isinstance(x, pd.DataFrame) else x
-    )
-    frame_to_write["SEMANTIC_MODEL_STRING"] = st.session_state["working_yml"]
-
-    frame_to_write = frame_to_write.reset_index()[list(RESULTS_TABLE_SCHEMA)]
-    write_pandas(
+    store_results(
         conn=get_snowflake_connection(),
-        df=frame_to_write,
-        table_name=st.session_state["results_eval_table"],
-        overwrite=False,
-        quote_identifiers=False,
-        auto_create_table=False,
+        frame=frame,
+        results_table=st.session_state["results_eval_table"],
+        semantic_model=st.session_state["working_yml"],
+        run=dict(
+            TIMESTAMP=st.session_state["eval_timestamp"],
+            EVAL_HASH=st.session_state["eval_hash"],
+            EVAL_RUN_NAME=st.session_state["eval_run_name"],
+            EVAL_TABLE=st.session_state["eval_table"],
+        ),
+        upload=_upload_result_files,
     )
     st.write("Evaluation results stored in the database ✅")
 
 
-def _match_series(analyst_frame: pd.DataFrame, gold_series: pd.Series) -> str | None:
-    """Determine which result frame column name matches the gold series.
-
-    Args:
-        analyst_frame: the data generated from the LLM constructed user query
-        gold_series: a column from the data generated from the gold sql
-
-    Returns:
-        if there is a match, the results column name, if not, None
+@st.cache_resource(show_spinner=False)
+def get_gold_result_cache() -> QueryResultCache:
     """
-    for analyst_col in analyst_frame:
-        assert isinstance(analyst_col, str)
-        try:
-            pd.testing.assert_series_equal(
-                left=analyst_frame[analyst_col],
-                right=gold_series,
-                check_names=False,
-            )
-            return analyst_col
-        except AssertionError:
-            pass
-
-    return None
-
-
-def run_sql_queries() -> None:
-    eval_table_frame: pd.DataFrame = st.session_state["eval_table_frame"]
-    analyst_results_frame = st.session_state["analyst_results_frame"]
-
-    total_requests = len(eval_table_frame)
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    start_time = time.time()
-
-    analyst_results = []
-    gold_results = []
-
-    for i, (row_id, row) in enumerate(eval_table_frame.iterrows(), start=1):
-        status_text.text(f"Evaluating Analyst query {i}/{total_requests}...")
-
-        analyst_query = analyst_results_frame.loc[row_id, "ANALYST_SQL"]
-        analyst_result = execute_query(
-            conn=get_snowflake_connection(), query=analyst_query
-        )
-        analyst_results.append(analyst_result)
-
-        gold_query = eval_table_frame.loc[row_id, "GOLD_SQL"]
-        gold_result = execute_query(conn=get_snowflake_connection(), query=gold_query)
-        gold_results.append(gold_result)
-
-        progress_bar.progress(i / total_requests)
-        time.sleep(0.1)
-
-    st.session_state["query_results_frame"] = pd.DataFrame(
-        data=dict(ANALYST_RESULT=analyst_results, GOLD_RESULT=gold_results),
-        index=eval_table_frame.index,
-    )
-
-    elapsed_time = time.time() - start_time
-    status_text.text(
-        f"All analyst and gold queries run ✅ (Time taken: {elapsed_time:.2f} seconds)"
-    )
-
-
-def send_analyst_requests() -> None:
-    def _get_content(
-        x: dict, item_type: str, key: str, default: str = ""  # type: ignore[type-arg]
-    ) -> str:
-        result = next(
-            (
-                item[key]
-                for item in x["message"]["content"]
-                if item["type"] == item_type
-            ),
-            default,
-        )
-        return result
-
-    eval_table_frame: pd.DataFrame = st.session_state["eval_table_frame"]
-
-    total_requests = len(eval_table_frame)
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-    start_time = time.time()
-    analyst_results = []
-
-    for i, (row_id, row) in enumerate(eval_table_frame.iterrows(), start=1):
-        status_text.text(f"Sending request {i}/{total_requests} to Analyst...")
-        messages = [
-            {"role": "user", "content": [{"type": "text", "text": row["QUERY"]}]}
-        ]
-        semantic_model = proto_to_yaml(st.session_state.semantic_model)
-        try:
-            response = send_message(
-                _conn=get_snowflake_connection(),
-                semantic_model=semantic_model,
-                messages=messages,  # type: ignore[arg-type]
-            )
-            response_text = _get_content(response, item_type="text", key="text")
-            response_sql = _get_content(response, item_type="sql", key="statement")
-            analyst_results.append(
-                dict(ID=row_id, ANALYST_TEXT=response_text, ANALYST_SQL=response_sql)
-            )
-        except Exception as e:
-            import traceback
-
-            st.error(f"Problem with {row_id}: {e} \n{traceback.format_exc()}")
-
-        progress_bar.progress(i / total_requests)
-        time.sleep(0.1)
-
-    elapsed_time = time.time() - start_time
-    status_text.text(
-        f"All analyst requests received ✅ (Time taken: {elapsed_time:.2f} seconds)"
-    )
-
-    analyst_results_frame = pd.DataFrame(analyst_results).set_index("ID")
-    st.session_state["analyst_results_frame"] = analyst_results_frame
+    Returns the cache of gold query results shared by all sessions of this app instance.
+    Marked with st.cache_resource in order to reuse the cache across the app.
+    """
+    return QueryResultCache()
 
 
 @_compat_dialog("Evaluation Tables", width="large")
@@ -576,6 +326,9 @@ def evaluation_data_dialog() -> None:
             if not validate_table_schema(
                 table=st.session_state["selected_results_eval_old_table"],
                 schema=RESULTS_TABLE_SCHEMA,
+            ) and not validate_table_schema(
+                table=st.session_state["selected_results_eval_old_table"],
+                schema=LEGACY_RESULTS_TABLE_SCHEMA,
             ):
                 st.error(
                     f"Evaluation result table must have schema {RESULTS_TABLE_SCHEMA}."
@@ -608,6 +361,18 @@ def evaluation_data_dialog() -> None:
                     )
                     return
 
+        # Also migrates results tables that store full results and semantic models on every row.
+        with st.spinner("Preparing the results table..."):
+            try:
+                prepare_results_table(
+                    get_snowflake_connection(),
+                    st.session_state["selected_results_eval_table"],
+                    upload=_upload_result_files,
+                )
+            except Exception as e:
+                st.error(f"Failed to prepare the results table: {e}")
+                return
+
         st.session_state["eval_table_hash"] = get_table_hash(
             conn=get_snowflake_connection(),
             table_fqn=st.session_state["selected_eval_table"],
@@ -648,11 +413,10 @@ def clear_evaluation_data() -> None:
     session_states = (
         "total_eval_frame",
         "eval_accuracy",
-        "analyst_results_frame",
-        "query_results_frame",
         "eval_run_name",
         "eval_timestamp",
         "eval_hash",
+        "eval_quick_summary",
     )
     for feature in session_states:
         if feature in st.session_state:
@@ -688,6 +452,55 @@ def evaluation_mode_show() -> None:
     )
     st.markdown("#### Evaluation Data Summary")
     st.dataframe(summary_stats, hide_index=True)
+    st.number_input(
+        "Concurrent requests",
+        min_value=1,
+        max_value=64,
+        value=EVAL_CONCURRENCY,
+        key="eval_concurrency",
+        help="Number of questions sent to Analyst at once. Lower it if requests are rate limited.",
+    )
+    st.number_input(
+        "Query timeout (seconds)",
+        min_value=10.0,
+        value=EVAL_QUERY_TIMEOUT_SEC,
+        step=30.0,
+        key="eval_query_timeout",
+        help="Analyst and gold queries still running after this long are cancelled and count as failed.",
+    )
+    st.checkbox(
+        "Incremental run",
+        value=True,
+        key="eval_incremental",
+        help="Reuse the stored results of questions already evaluated with this semantic model, and the results of "
+        "gold queries whose tables have not changed since they last ran. Only new or changed rows are run.",
+    )
+    st.checkbox(
+        "Quick evaluation",
+        value=False,
+        key="eval_quick",
+        help="Evaluate a stratified sample of the questions batch by batch, and stop as soon as the accuracy is "
+        "known within the target precision, or is clearly below the last full run. Uncheck it for a full run.",
+    )
+    if st.session_state.get("eval_quick", False):
+        st.selectbox(
+            "Stratify the sample by",
+            options=STRATIFY_OPTIONS,
+            format_func=lambda option: {
+                STRATIFY_BY_TABLE: "Tables of the gold SQL",
+                STRATIFY_BY_OUTCOME: "Outcome in the last run",
+            }[option],
+            key="eval_quick_stratify",
+        )
+        st.number_input(
+            "Target precision (± accuracy points)",
+            min_value=1.0,
+            max_value=50.0,
+            value=QuickEvalConfig.target_half_width,
+            step=1.0,
+            key="eval_quick_half_width",
+            help="The run stops once the 95% confidence interval of the accuracy is this narrow.",
+        )
     if st.button("Run Evaluation"):
         run_evaluation()
 
@@ -706,6 +519,21 @@ def evaluation_mode_show() -> None:
             ],
             columns=["Summary Statistic", "Value"],
         )
+        quick_summary = st.session_state.get("eval_quick_summary")
+        if quick_summary:
+            low, high = quick_summary["interval"]
+            evolution_run_summary.loc[len(evolution_run_summary)] = [
+                "Quick Evaluation",
+                f"{quick_summary['evaluated']}/{quick_summary['population']} questions, "
+                f"accuracy {low:.2f}% to {high:.2f}%",
+            ]
+            if quick_summary["baseline"] is not None:
+                evolution_run_summary.loc[len(evolution_run_summary)] = [
+                    "Last Full Run Accuracy",
+                    f"{quick_summary['baseline']:.2f}%",
+                ]
+            if quick_summary["stop_reason"] == STOP_BELOW_BASELINE:
+                st.warning("Accuracy is clearly below the last full run.")
         if model_changed_test:
             st.warning("Model has changed since last evaluation run.")
             st.markdown("#### Previous Evaluation Run Summary")
@@ -716,6 +544,60 @@ def evaluation_mode_show() -> None:
         visualize_eval_results(st.session_state["total_eval_frame"])
 
 
+def _quick_eval_strata(eval_table_frame: pd.DataFrame, stratify: str) -> pd.Series:
+    conn = get_snowflake_connection()
+    if stratify == STRATIFY_BY_OUTCOME:
+        previous = None
+        try:
+            previous = last_results(
+                conn,
+                st.session_state["results_eval_table"],
+                st.session_state["eval_table"],
+            )
+        except Exception as e:
+            logger.warning(f"Unable to read the last evaluation results: {e}")
+        return outcome_strata(eval_table_frame, previous)
+    return table_strata(eval_table_frame, conn.database, conn.schema)
+
+
+def _run_quick_evaluation(
+    runner: EvaluationRunner,
+    eval_table_frame: pd.DataFrame,
+    previous_results: Optional[pd.DataFrame],
+) -> EvaluationReport:
+    quick = QuickEvalConfig(
+        target_half_width=st.session_state.get(
+            "eval_quick_half_width", QuickEvalConfig.target_half_width
+        ),
+        stratify=st.session_state.get("eval_quick_stratify", STRATIFY_BY_TABLE),
+    )
+    baseline = None
+    try:
+        baseline = last_full_run_accuracy(
+            get_snowflake_connection(),
+            st.session_state["results_eval_table"],
+            st.session_state["eval_table"],
+            len(eval_table_frame),
+        )
+    except Exception as e:
+        logger.warning(f"Unable to read the accuracy of the last full run: {e}")
+    report = runner.run_quick(
+        eval_table_frame,
+        _quick_eval_strata(eval_table_frame, quick.stratify),
+        quick,
+        baseline,
+        previous_results,
+    )
+    st.session_state["eval_quick_summary"] = dict(
+        population=report.population,
+        evaluated=len(report.results),
+        interval=report.interval,
+        baseline=baseline,
+        stop_reason=report.stop_reason,
+    )
+    return report
+
+
 def run_evaluation() -> None:
     set_sit_query_tag(
         get_snowflake_connection(),
@@ -728,7 +610,12 @@ def run_evaluation() -> None:
     )
     placeholder = st.empty()
 
-    if not model_changed_test and "total_eval_frame" in st.session_state:
+    # A quick run can always be followed by another run, e.g. a full one.
+    if (
+        not model_changed_test
+        and "total_eval_frame" in st.session_state
+        and not st.session_state.get("eval_quick_summary")
+    ):
         placeholder.write("Model has not changed since last evaluation run.")
         return
 
@@ -759,9 +646,43 @@ def run_evaluation() -> None:
         results_placeholder.empty()
     st.session_state["eval_timestamp"] = time.strftime("%Y-%m-%d %H:%M:%S")
     st.session_state["eval_hash"] = generate_hash(st.session_state["eval_timestamp"])
-    send_analyst_requests()
-    run_sql_queries()
-    result_comparisons()
+    eval_table_frame: pd.DataFrame = st.session_state["eval_table_frame"]
+    previous_results = None
+    if st.session_state.get("eval_incremental", True):
+        try:
+            previous_results = reusable_results(
+                get_snowflake_connection(),
+                st.session_state["results_eval_table"],
+                eval_table_frame,
+                st.session_state["working_yml"],
+            )
+        except Exception as e:
+            logger.warning(f"Unable to read previous evaluation results: {e}")
+    start_time = time.time()
+    runner = _evaluation_runner(_show_progress())
+    if st.session_state.get("eval_quick", False):
+        report = _run_quick_evaluation(runner, eval_table_frame, previous_results)
+        st.write(
+            f"Quick evaluation of {len(report.results)}/{report.population} questions "
+            f"stopped as {report.stop_reason} ✅"
+        )
+    else:
+        if previous_results is not None and not previous_results.empty:
+            st.write(
+                f"Reusing the results of {len(previous_results)} rows already "
+                f"evaluated with this semantic model, running "
+                f"{len(eval_table_frame) - len(previous_results)} rows ..."
+            )
+        report = runner.run(eval_table_frame, previous_results)
+    failed = report.results["ANALYST_TEXT"].str.startswith("Analyst request failed:")
+    for row_id, text in report.results.loc[failed, "ANALYST_TEXT"].items():
+        st.error(f"Problem with {row_id}: {text}")
+    st.write(
+        f"Evaluated in {time.time() - start_time:.2f} seconds, "
+        f"{runner.cached_gold_results} cached gold results reused ✅"
+    )
+    st.session_state["eval_accuracy"] = report.accuracy
+    st.session_state["total_eval_frame"] = report.results
     write_eval_results(st.session_state["total_eval_frame"])
     st.write("Evaluation complete ✅")
 
@@ -5,6 +5,7 @@ from typing import Any, Dict, List, Optional
 import pandas as pd
 import sqlglot
 import streamlit as st
+import yaml
 from snowflake.connector import ProgrammingError, SnowflakeConnection
 
 
@@ -28,12 +29,23 @@ from streamlit.delta_generator import DeltaGenerator
 from streamlit_extras.row import row
 from streamlit_extras.stylable_container import stylable_container
 
-from app_utils.chat import send_message
+from app_utils.chat import (
+    DEFAULT_SQL_GENERATION_MODE,
+    SQL_GENERATION_MODE_STRUCTURED,
+    SQL_GENERATION_MODE_TWO_CALL,
+    _is_china_region_chat,
+    cache_response,
+    explain_sql_concurrently,
+    get_response_cache,
+    send_message_cached,
+    stream_explanation,
+    streaming_available,
+)
 from app_utils.shared_utils import (
     GeneratorAppScreen,
     SnowflakeStage,
     changed_from_last_validated_model,
-    download_yaml,
+    download_semantic_model,
     get_snowflake_connection,
     get_yamls_from_stage,
     init_session_states,
@@ -44,6 +56,7 @@ from app_utils.shared_utils import (
 )
 from journeys.evaluation import evaluation_mode_show
 from journeys.joins import joins_dialog
+from semantic_model_generator.data_processing.compiled_model import model_content_hash
 from semantic_model_generator.data_processing.cte_utils import (
     context_to_column_format,
     expand_all_logical_tables_as_ctes,
@@ -55,6 +68,13 @@ from semantic_model_generator.data_processing.proto_utils import (
     yaml_to_semantic_model,
 )
 from semantic_model_generator.protos import semantic_model_pb2
+from semantic_model_generator.validate.catalog import fetch_catalog_snapshot
+from semantic_model_generator.validate.incremental import IncrementalValidator
+from semantic_model_generator.validate.verified_queries import (
+    CHECK_MODE_EXPLAIN,
+    CHECK_MODE_RUN,
+    check_verified_queries,
+)
 from semantic_model_generator.validate_model import validate
 
 # Set minCachedMessageSize to 500 MB to disable forward message cache:
@@ -95,16 +115,53 @@ def process_message(_conn: SnowflakeConnection, prompt: str) -> None:
                 if st.session_state.multiturn
                 else [user_message]
             )
+            semantic_model = proto_to_yaml(st.session_state.semantic_model)
             try:
-                response = send_message(
+                response = send_message_cached(
                     _conn=_conn,
-                    semantic_model=proto_to_yaml(st.session_state.semantic_model),
+                    semantic_model=semantic_model,
                     messages=request_messages,
                 )
                 content = response["message"]["content"]
                 # Grab the request ID from the response and stash it in the chat message object.
                 request_id = response["request_id"]
+                explanation = None
+                stream = False
+                if response["message"].get("explanation_pending"):
+                    sql = next(c["statement"] for c in content if c["type"] == "sql")
+                    stream = streaming_available()
+                    if not stream:
+                        # Generate the explanation while display_content executes the SQL.
+                        explanation = explain_sql_concurrently(_conn, sql)
                 display_content(conn=_conn, content=content, request_id=request_id)
+                explanation_text = None
+                if stream:
+                    # Show the explanation token by token below the results.
+                    explanation_text = st.write_stream(stream_explanation(_conn, sql))
+                elif explanation is not None:
+                    explanation_text = explanation.result()
+                    st.markdown(explanation_text)
+                if explanation_text is not None:
+                    content = [
+                        (
+                            {**c, "text": f"{c['text']}\n\n{explanation_text}"}
+                            if c["type"] == "text"
+                            else c
+                        )
+                        for c in content
+                    ]
+                    # Cache the response once its explanation is filled in.
+                    message = {
+                        k: v
+                        for k, v in response["message"].items()
+                        if k != "explanation_pending"
+                    }
+                    cache_response(
+                        _conn,
+                        semantic_model,
+                        request_messages,
+                        {**response, "message": {**message, "content": content}},
+                    )
                 st.session_state.messages.append(
                     {"role": "analyst", "content": content, "request_id": request_id}
                 )
@@ -390,6 +447,51 @@ def chat_and_edit_vqr(_conn: SnowflakeConnection) -> None:
         st.session_state.active_suggestion = None
 
 
+def verified_queries_check_show() -> None:
+    """Checks all verified queries of the semantic model concurrently and reports the broken ones."""
+    verified_queries = st.session_state.semantic_model.verified_queries
+    st.write(
+        f"Check all {len(verified_queries)} verified queries against the current semantic model, e.g. after a schema change. Queries are compiled concurrently, so a full check takes about as long as the slowest query."
+    )
+    mode = st.radio(
+        "Check mode",
+        options=[CHECK_MODE_EXPLAIN, CHECK_MODE_RUN],
+        format_func=lambda m: (
+            "Compile only (EXPLAIN)" if m == CHECK_MODE_EXPLAIN else "Run with LIMIT 1"
+        ),
+        horizontal=True,
+    )
+    if not st.button("Check Verified Queries", disabled=len(verified_queries) == 0):
+        return
+
+    start_time = time.time()
+    with st.spinner("Checking verified queries..."):
+        results = check_verified_queries(
+            get_snowflake_connection(), st.session_state.semantic_model, mode=mode
+        )
+    elapsed_time = time.time() - start_time
+
+    n_failed = sum(not r.success for r in results)
+    summary = f"{len(results) - n_failed} of {len(results)} verified queries passed (Time taken: {elapsed_time:.2f} seconds)"
+    if n_failed:
+        st.error(summary)
+    else:
+        st.success(summary)
+    st.dataframe(
+        pd.DataFrame(
+            {
+                "Status": ["✅" if r.success else "❌" for r in results],
+                "Name": [r.name for r in results],
+                "Question": [r.question for r in results],
+                "Time (s)": [round(r.elapsed_sec, 2) for r in results],
+                "Error": [r.error or "" for r in results],
+            }
+        ).sort_values("Status", ascending=False),
+        hide_index=True,
+        use_container_width=True,
+    )
+
+
 @_compat_dialog("Upload", width="small")
 def upload_dialog(content: str) -> None:
     def upload_handler(file_name: str) -> None:
@@ -399,6 +501,17 @@ def upload_dialog(content: str) -> None:
             ):
                 validate_and_upload_tmp_yaml(conn=get_snowflake_connection())
 
+        # Offline validation only checks against the cached catalog snapshot, so run the full
+        # online validation once before publishing to the stage.
+        if st.session_state.get("validated_offline", False):
+            with st.spinner("Running online validation before uploading..."):
+                try:
+                    validate(content, conn=get_snowflake_connection())
+                except Exception as e:
+                    st.error(f"Online validation failed: {e}")
+                    return
+            st.session_state["validated_offline"] = False
+
         st.session_state.semantic_model = yaml_to_semantic_model(content)
         with st.spinner(
             f"Uploading @{st.session_state.snowflake_stage.stage_name}/{file_name}.yaml..."
@@ -481,6 +594,64 @@ def exception_as_dialog(e: Exception) -> None:
     st.error(f"An error occurred: {e}")
 
 
+def _base_table_fqns(yaml_str: str) -> List[str]:
+    """Returns the fully qualified base tables referenced in the yaml, skipping malformed entries."""
+    try:
+        data = yaml.safe_load(yaml_str) or {}
+    except yaml.YAMLError:
+        return []
+    fqns = []
+    for table in data.get("tables") or []:
+        base_table = table.get("base_table") if isinstance(table, dict) else None
+        if isinstance(base_table, dict) and all(
+            base_table.get(k) for k in ("database", "schema", "table")
+        ):
+            fqns.append(
+                f"{base_table['database']}.{base_table['schema']}.{base_table['table']}"
+            )
+    return fqns
+
+
+def validate_working_yaml(content: str) -> semantic_model_pb2.SemanticModel:
+    """
+    Validates the editor content and returns the parsed semantic model. Results are cached per table,
+    relationship and verified query across calls, so only the entries edited since the last validation are
+    re-validated. When offline validation is enabled, the content is checked against the cached catalog snapshot,
+    and only base tables missing from the snapshot are fetched from Snowflake.
+    """
+    conn = get_snowflake_connection()
+    validator = st.session_state.get("incremental_validator")
+    if validator is None:
+        validator = IncrementalValidator()
+        st.session_state["incremental_validator"] = validator
+
+    if not st.session_state.get("offline_validation", False):
+        validator.catalog = None
+        validator.conn = conn
+        model = validator.validate(content)
+        # Outside of China the model is also validated by Cortex Analyst, unless this exact content already passed it.
+        # Model level edits (e.g. the description) leave no validator changes, so the whole content is compared.
+        content_hash = model_content_hash(content)
+        if not _is_china_region_chat(conn) and content_hash != st.session_state.get(
+            "analyst_validated_hash"
+        ):
+            validate(content, conn=conn)
+            st.session_state["analyst_validated_hash"] = content_hash
+        st.session_state["validated_offline"] = False
+        return model
+
+    st.session_state["catalog_snapshot"] = fetch_catalog_snapshot(
+        conn,
+        _base_table_fqns(content),
+        snapshot=st.session_state.get("catalog_snapshot"),
+    )
+    validator.catalog = st.session_state["catalog_snapshot"]
+    validator.conn = None
+    model = validator.validate(content)
+    st.session_state["validated_offline"] = True
+    return model
+
+
 # TODO: how to properly mark fragment back?
 # @st.experimental_fragment
 def yaml_editor(yaml_str: str) -> None:
@@ -515,13 +686,10 @@ def yaml_editor(yaml_str: str) -> None:
     def validate_and_update_session_state() -> None:
         # Validate new content
         try:
-            validate(
-                content,
-                conn=get_snowflake_connection(),
-            )
+            model = validate_working_yaml(content)
             st.session_state["validated"] = True
             update_container(status_container, "success", prefix=status_container_title)
-            st.session_state.semantic_model = yaml_to_semantic_model(content)
+            st.session_state.semantic_model = model
             st.session_state.last_saved_yaml = content
         except Exception as e:
             st.session_state["validated"] = False
@@ -664,9 +832,77 @@ def chat_settings_dialog() -> None:
         help="Enable multiturn mode to allow the chat to remember context. Note that your account must have the correct parameters enabled to use this feature.",
     )
 
+    offline_validation = st.toggle(
+        "Offline validation",
+        value=st.session_state.offline_validation,
+        help="Validate edits against a cached snapshot of the base table columns instead of querying Snowflake. The full online validation still runs before uploading to a stage.",
+    )
+
+    use_response_cache = st.toggle(
+        "Response cache",
+        value=st.session_state.get("use_response_cache", True),
+        help="Reuse the generated SQL of questions that were already answered for the same semantic model and LLM.",
+    )
+
+    schema_linking = st.toggle(
+        "Schema linking",
+        value=st.session_state.get("schema_linking", True),
+        help="Only include the tables and columns relevant to the question, and the joins between them, in the SQL generation prompt.",
+    )
+
+    use_verified_queries = st.toggle(
+        "Verified queries",
+        value=st.session_state.get("use_verified_queries", True),
+        help="Answer questions that match a verified query with its SQL without calling the LLM, and give the most similar verified queries to the LLM as examples otherwise.",
+    )
+
+    sql_guard = st.toggle(
+        "Check SQL before running",
+        value=st.session_state.get("sql_guard", True),
+        help="Reject generated SQL that is not a read-only query or uses tables and columns missing from the semantic model (and the catalog snapshot), asking the LLM once to fix it, and add or clamp its LIMIT.",
+    )
+
+    sql_generation_modes = {
+        SQL_GENERATION_MODE_TWO_CALL: "Separate SQL and explanation calls",
+        SQL_GENERATION_MODE_STRUCTURED: "Single call for SQL and explanation",
+    }
+    sql_generation_mode = st.selectbox(
+        "SQL generation",
+        options=list(sql_generation_modes),
+        format_func=sql_generation_modes.get,
+        index=list(sql_generation_modes).index(
+            st.session_state.get("sql_generation_mode", DEFAULT_SQL_GENERATION_MODE)
+        ),
+        help="A single call returns the SQL and its explanation as JSON, saving one LLM round trip. It falls back to separate calls if the JSON cannot be parsed.",
+    )
+
+    explain_concurrently = st.toggle(
+        "Explain while running SQL",
+        value=st.session_state.get("explain_concurrently", False),
+        help="With separate calls, generate the explanation while the SQL executes instead of before it.",
+    )
+
+    stream_responses = st.toggle(
+        "Stream responses",
+        value=st.session_state.get("stream_responses", True),
+        help="Show the explanation token by token as it is generated. Needs QWEN_API_KEY for the external API or SPCS_ENDPOINT_URL for SPCS, and uses the blocking UDF otherwise.",
+    )
+
+    if st.button("Clear response cache"):
+        get_response_cache(get_snowflake_connection()).clear()
+        st.toast("Response cache cleared.")
+
     if st.button("Save"):
         st.session_state.chat_debug = debug
         st.session_state.multiturn = multiturn
+        st.session_state.offline_validation = offline_validation
+        st.session_state.use_response_cache = use_response_cache
+        st.session_state.schema_linking = schema_linking
+        st.session_state.use_verified_queries = use_verified_queries
+        st.session_state.sql_guard = sql_guard
+        st.session_state.sql_generation_mode = sql_generation_mode
+        st.session_state.explain_concurrently = explain_concurrently
+        st.session_state.stream_responses = stream_responses
         st.rerun()
 
 
@@ -702,15 +938,15 @@ def show() -> None:
             st.session_state["app_mode"] = st.selectbox(
                 label="App Mode",
                 label_visibility="collapsed",
-                options=["Chat", "Evaluation", "Preview YAML"],
+                options=["Chat", "Evaluation", "Verified Queries", "Preview YAML"],
             )
         if "yaml" not in st.session_state:
             # Only proceed to download the YAML from stage if we don't have one from the builder flow.
-            yaml = download_yaml(
+            yaml, semantic_model = download_semantic_model(
                 st.session_state.file_name, st.session_state.snowflake_stage.stage_name
             )
             st.session_state["yaml"] = yaml
-            st.session_state["semantic_model"] = yaml_to_semantic_model(yaml)
+            st.session_state["semantic_model"] = semantic_model
             if "last_saved_yaml" not in st.session_state:
                 st.session_state["last_saved_yaml"] = yaml
 
@@ -737,6 +973,8 @@ def show() -> None:
                 )
             elif app_mode == "Evaluation":
                 evaluation_mode_show()
+            elif app_mode == "Verified Queries":
+                verified_queries_check_show()
             elif app_mode == "Chat":
                 if st.button("Settings"):
                     chat_settings_dialog()
@@ -0,0 +1,112 @@
+# A compiled semantic model is a binary sidecar stored next to a semantic model yaml on the stage, e.g. model.yaml and
+# model.yaml.compiled. It holds the parsed protobuf, so that loading a model skips parsing the yaml, together with the
+# hash of the yaml it was compiled from. A sidecar is only used when its hash matches the yaml, so a stale sidecar is
+# harmless.
+#
+# Only the protobuf is compiled. Expression metadata, logical table CTEs and per-table token counts are cheap to derive
+# from the protobuf once it is loaded, no loader read them from the sidecar, and the agent app, which parses the yaml
+# itself, cannot use a protobuf artifact. Add them to the manifest, with a new _COMPILED_MODEL_VERSION, together with
+# the consumer that reads them.
+
+import hashlib
+import io
+import json
+import zipfile
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+
+from semantic_model_generator.data_processing.proto_utils import yaml_to_semantic_model
+from semantic_model_generator.protos import semantic_model_pb2
+
+COMPILED_MODEL_SUFFIX = ".compiled"
+
+_COMPILED_MODEL_VERSION = 1
+_MANIFEST_FILE = "manifest.json"
+_MODEL_FILE = "model.pb"
+
+
+def compiled_model_file_name(yaml_file_name: str) -> str:
+    """Returns the name of the sidecar for a yaml file, e.g. model.yaml -> model.yaml.compiled"""
+    return yaml_file_name + COMPILED_MODEL_SUFFIX
+
+
+def model_content_hash(yaml_str: str) -> str:
+    return hashlib.sha256(yaml_str.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CompiledSemanticModel:
+    content_hash: str
+    model: semantic_model_pb2.SemanticModel
+
+    def to_bytes(self) -> bytes:
+        manifest = {
+            "version": _COMPILED_MODEL_VERSION,
+            "content_hash": self.content_hash,
+        }
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(_MANIFEST_FILE, json.dumps(manifest, ensure_ascii=False))
+            zf.writestr(_MODEL_FILE, self.model.SerializeToString())
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CompiledSemanticModel":
+        with zipfile.ZipFile(io.BytesIO(data)) as zf:
+            manifest = json.loads(zf.read(_MANIFEST_FILE))
+            if manifest.get("version") != _COMPILED_MODEL_VERSION:
+                raise ValueError(
+                    f"Unsupported compiled model version: {manifest.get('version')}"
+                )
+            model = semantic_model_pb2.SemanticModel()
+            model.ParseFromString(zf.read(_MODEL_FILE))
+        return cls(content_hash=manifest["content_hash"], model=model)
+
+
+def compile_semantic_model(
+    yaml_str: str, model: Optional[semantic_model_pb2.SemanticModel] = None
+) -> CompiledSemanticModel:
+    """
+    Compiles a semantic model yaml into its sidecar artifact.
+
+    Args:
+        yaml_str: the yaml content, used for the content hash.
+        model: the already parsed model, if available. Parsed from yaml_str otherwise.
+
+    Returns: the compiled semantic model.
+    """
+    model = model or yaml_to_semantic_model(yaml_str)
+    return CompiledSemanticModel(content_hash=model_content_hash(yaml_str), model=model)
+
+
+def load_compiled_model(
+    yaml_str: str, compiled_bytes: Optional[bytes]
+) -> Optional[CompiledSemanticModel]:
+    """
+    Returns the compiled model from the sidecar bytes if it was compiled from yaml_str, None otherwise.
+    """
+    if not compiled_bytes:
+        return None
+    try:
+        compiled = CompiledSemanticModel.from_bytes(compiled_bytes)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable compiled semantic model: {e}")
+        return None
+    if compiled.content_hash != model_content_hash(yaml_str):
+        logger.info("Ignoring stale compiled semantic model.")
+        return None
+    return compiled
+
+
+def load_semantic_model(
+    yaml_str: str, compiled_bytes: Optional[bytes] = None
+) -> semantic_model_pb2.SemanticModel:
+    """
+    Returns the semantic model from the sidecar if it matches the yaml, falling back to parsing the yaml.
+    """
+    compiled = load_compiled_model(yaml_str, compiled_bytes)
+    if compiled is not None:
+        return compiled.model
+    return yaml_to_semantic_model(yaml_str)
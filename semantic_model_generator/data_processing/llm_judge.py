@@ -0,0 +1,265 @@
+# Prompts for the LLM judge of the evaluation journey, which decides whether the result of a generated query answers
+# the question as well as the result of the gold query, when their data does not match exactly.
+#
+# - Frames are encoded compactly: column stats plus the rows as CSV, sorted so that row order does not matter,
+#   truncated to a token budget instead of a fixed number of rows.
+# - Verdicts can be cached by judge_key, a content hash of the question and both frames (independent of row order),
+#   so unchanged comparisons are not judged again on re-runs.
+# - Small comparisons are packed into one prompt, answered with one numbered verdict each.
+
+import hashlib
+import json
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+from semantic_model_generator.data_processing.result_matching import rows_digest
+from semantic_model_generator.snowflake_utils.qwen_llm import estimate_tokens
+
+# Token budget of each encoded frame, and of the comparisons packed into one prompt.
+DEFAULT_FRAME_MAX_TOKENS = 1500
+DEFAULT_PACK_MAX_TOKENS = 6000
+DEFAULT_PACK_MAX_COMPARISONS = 8
+
+LLM_JUDGE_PROMPT_TEMPLATE = """\
+[INST] Your task is to determine whether the two given dataframes are
+equivalent semantically in the context of a question. You should attempt to
+answer the given question by using the data in each dataframe. If the two
+answers are equivalent, those two dataframes are considered equivalent.
+Otherwise, they are not equivalent. Please also provide your reasoning.
+If they are equivalent, output "REASON: <reason>. ANSWER: true". If they are
+not equivalent, output "REASON: <reason>. ANSWER: false".
+
+### QUESTION: {input_question}
+
+* DATAFRAME 1:
+{frame1_str}
+
+* DATAFRAME 2:
+{frame2_str}
+
+Are the two dataframes equivalent?
+OUTPUT:
+[/INST] """
+
+LLM_JUDGE_PACKED_PROMPT_TEMPLATE = """\
+[INST] Your task is to determine, for each numbered comparison below, whether
+its two dataframes are equivalent semantically in the context of its question.
+You should attempt to answer the question by using the data in each dataframe.
+If the two answers are equivalent, those two dataframes are considered
+equivalent. Otherwise, they are not equivalent. Each dataframe is given as
+column stats followed by its rows as CSV, in sorted order.
+Output exactly one line per comparison, in the form
+"[<number>] REASON: <reason>. ANSWER: true" if they are equivalent, or
+"[<number>] REASON: <reason>. ANSWER: false" if they are not.
+
+{comparisons}
+OUTPUT:
+[/INST] """
+
+LLM_JUDGE_COMPARISON_TEMPLATE = """\
+### COMPARISON [{number}]
+QUESTION: {input_question}
+
+* DATAFRAME 1:
+{frame1_str}
+
+* DATAFRAME 2:
+{frame2_str}
+
+"""
+
+_REASON = re.compile(r"REASON\:([\S\s]*?)ANSWER\:")
+_ANSWER = re.compile(r"ANSWER\:([\S\s]*?)$")
+_PACKED_VERDICT = re.compile(
+    r"\[(\d+)\]\s*REASON\:([\S\s]*?)ANSWER\:\s*(true|false)", re.IGNORECASE
+)
+
+
+@dataclass
+class Comparison:
+    key: str
+    question: str
+    frame1: str
+    frame2: str
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.question + self.frame1 + self.frame2)
+
+
+@dataclass
+class Verdict:
+    correct: bool
+    explanation: str
+    # False if the answer of the judge could not be parsed, in which case the verdict should not be cached.
+    parsed: bool = True
+
+
+def frame_digest(frame: pd.DataFrame) -> str:
+    """Content hash of a frame that does not depend on the order of its rows, see rows_digest."""
+    parts = [
+        [str(column) for column in frame.columns],
+        [str(dtype) for dtype in frame.dtypes],
+        len(frame),
+        rows_digest(frame),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()
+
+
+def judge_key(
+    question: str, frame1: pd.DataFrame, frame2: pd.DataFrame, model: str
+) -> str:
+    return hashlib.sha256(
+        json.dumps(
+            [question, frame_digest(frame1), frame_digest(frame2), model],
+            ensure_ascii=False,
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def _sorted_rows(frame: pd.DataFrame) -> pd.DataFrame:
+    if frame.empty or frame.shape[1] == 0:
+        return frame
+    try:
+        return frame.sort_values(list(frame.columns), na_position="last")
+    except TypeError:
+        # Columns with mixed types cannot be sorted, sort by their text instead.
+        return frame.loc[frame.astype(str).sort_values(list(frame.columns)).index]
+
+
+def _number(value: object) -> str:
+    try:
+        return f"{value:.10g}"
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def encode_frame(
+    frame: pd.DataFrame, max_tokens: int = DEFAULT_FRAME_MAX_TOKENS
+) -> str:
+    """
+    Returns column stats (type, nulls, and min, max and sum of numeric columns or the number of distinct values of
+    others) followed by the rows as sorted CSV, with as many rows as fit into max_tokens.
+    """
+    lines = [f"{len(frame)} rows x {frame.shape[1]} columns"]
+    for column in frame.columns:
+        series = frame[column]
+        stats = [f"{column} ({series.dtype})", f"nulls={int(series.isna().sum())}"]
+        numeric = pd.api.types.is_numeric_dtype(series)
+        if numeric and not pd.api.types.is_bool_dtype(series):
+            stats += [
+                f"min={_number(series.min())}",
+                f"max={_number(series.max())}",
+                f"sum={_number(series.sum())}",
+            ]
+        else:
+            try:
+                stats.append(f"distinct={series.nunique()}")
+            except TypeError:
+                pass
+        lines.append("- " + ", ".join(stats))
+    text = "\n".join(lines)
+
+    rows = _sorted_rows(frame).to_csv(index=False, float_format="%.10g").splitlines()
+    budget = max_tokens - estimate_tokens(text)
+    kept = []
+    for row in rows:
+        budget -= estimate_tokens(row)
+        if budget < 0:
+            break
+        kept.append(row)
+    text += "\n" + "\n".join(kept)
+    if len(kept) < len(rows):
+        # The first CSV line is the header.
+        text += f"\n... {len(rows) - max(len(kept), 1)} more rows"
+    return text
+
+
+def parse_verdict(text: str) -> Verdict:
+    """Parses the answer of the judge to LLM_JUDGE_PROMPT_TEMPLATE."""
+    reason = _REASON.search(text)
+    answer = _ANSWER.search(text)
+    if reason is None or answer is None:
+        return Verdict(False, f"Could Not Parse LLM Judge Response: {text}", False)
+    return Verdict(
+        answer.group(1).strip().lower() == "true", reason.group(1).strip()
+    )
+
+
+def single_prompt(comparison: Comparison) -> str:
+    return LLM_JUDGE_PROMPT_TEMPLATE.format(
+        input_question=comparison.question,
+        frame1_str=comparison.frame1,
+        frame2_str=comparison.frame2,
+    )
+
+
+def pack_comparisons(
+    comparisons: List[Comparison],
+    max_tokens: int = DEFAULT_PACK_MAX_TOKENS,
+    max_comparisons: int = DEFAULT_PACK_MAX_COMPARISONS,
+) -> List[List[Comparison]]:
+    """Groups comparisons into packs that fit into max_tokens, in order. Large comparisons get their own pack."""
+    packs: List[List[Comparison]] = []
+    current: List[Comparison] = []
+    current_tokens = 0
+    for comparison in comparisons:
+        tokens = comparison.tokens
+        if current and (
+            current_tokens + tokens > max_tokens or len(current) >= max_comparisons
+        ):
+            packs.append(current)
+            current, current_tokens = [], 0
+        current.append(comparison)
+        current_tokens += tokens
+    if current:
+        packs.append(current)
+    return packs
+
+
+def pack_prompt(pack: List[Comparison]) -> str:
+    """Returns the prompt for a pack, a single comparison prompt if the pack only has one comparison."""
+    if len(pack) == 1:
+        return single_prompt(pack[0])
+    return LLM_JUDGE_PACKED_PROMPT_TEMPLATE.format(
+        comparisons="".join(
+            LLM_JUDGE_COMPARISON_TEMPLATE.format(
+                number=number,
+                input_question=comparison.question,
+                frame1_str=comparison.frame1,
+                frame2_str=comparison.frame2,
+            )
+            for number, comparison in enumerate(pack, start=1)
+        )
+    )
+
+
+def parse_pack(pack: List[Comparison], text: str) -> Dict[str, Verdict]:
+    """
+    Returns the verdicts of the judge's answer to pack_prompt, by comparison key. Comparisons without a verdict in
+    the answer are left out, so that they can be judged again on their own.
+    """
+    if len(pack) == 1:
+        return {pack[0].key: parse_verdict(text)}
+    verdicts: Dict[str, Verdict] = {}
+    for number, reason, answer in _PACKED_VERDICT.findall(text):
+        index = int(number) - 1
+        if 0 <= index < len(pack):
+            verdicts[pack[index].key] = Verdict(
+                answer.lower() == "true", reason.strip().rstrip(".").strip()
+            )
+    return verdicts
+
+
+def verdict_to_json(verdict: Verdict) -> Dict[str, object]:
+    return {"correct": verdict.correct, "explanation": verdict.explanation}
+
+
+def verdict_from_json(data: Optional[Dict[str, object]]) -> Optional[Verdict]:
+    if not data or "correct" not in data:
+        return None
+    return Verdict(bool(data["correct"]), str(data.get("explanation", "")))
+
@@ -0,0 +1,160 @@
+# Cache of query results keyed by the SQL text plus a fingerprint of every table the query reads, used by the
+# evaluation journey so that gold queries are not run again while the tables under them are unchanged.
+#
+# A table's fingerprint comes from its metadata (see snowflake_connector.fetch_table_fingerprints), which changes with
+# every DML or DDL on the table. Queries whose result can change without their tables changing are not cacheable:
+# queries over views (whose data lives in other tables), queries with table functions, and queries that call
+# non-deterministic functions such as CURRENT_DATE() or RANDOM().
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple, Union
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+DEFAULT_MAX_ENTRIES = 500
+# Results with more rows than this are not kept, so that a few large results cannot take up the memory of the app.
+DEFAULT_MAX_ROWS = 100_000
+
+_NON_DETERMINISTIC_EXPRESSIONS = (
+    exp.CurrentDate,
+    exp.CurrentDatetime,
+    exp.CurrentTime,
+    exp.CurrentTimestamp,
+    exp.CurrentUser,
+    exp.Rand,
+    exp.Randn,
+)
+_NON_DETERMINISTIC_FUNCTIONS = {
+    "GETDATE",
+    "LOCALTIME",
+    "LOCALTIMESTAMP",
+    "NORMAL",
+    "RANDOM",
+    "RANDSTR",
+    "SEQ1",
+    "SEQ2",
+    "SEQ4",
+    "SEQ8",
+    "SYSDATE",
+    "SYSTIMESTAMP",
+    "UNIFORM",
+    "UUID_STRING",
+    "ZIPF",
+}
+
+
+def _identifier(part: exp.Expression) -> str:
+    # Unquoted identifiers resolve case-insensitively in Snowflake, as their upper case spelling.
+    if isinstance(part, exp.Identifier) and part.quoted:
+        return part.name
+    return part.name.upper()
+
+
+def query_tables(
+    sql: str, database: Optional[str], schema: Optional[str]
+) -> Optional[List[str]]:
+    """
+    Returns the sorted DB.SCHEMA.TABLE names of the tables the query reads, with partially qualified names completed
+    with the given current database and schema. Returns None if the result of the query cannot be cached.
+    """
+    try:
+        statements = [
+            s for s in sqlglot.parse(sql, read="snowflake") if s is not None
+        ]
+    except SqlglotError:
+        return None
+    if len(statements) != 1 or not isinstance(statements[0], exp.Query):
+        return None
+    query = statements[0]
+    if query.find(*_NON_DETERMINISTIC_EXPRESSIONS):
+        return None
+    if any(
+        f.name.upper() in _NON_DETERMINISTIC_FUNCTIONS
+        for f in query.find_all(exp.Anonymous)
+    ):
+        return None
+
+    ctes = {cte.alias_or_name.upper() for cte in query.find_all(exp.CTE)}
+    tables = set()
+    for table in query.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            return None  # Table functions such as TABLE(GENERATOR(...)).
+        if not table.args.get("db") and table.name.upper() in ctes:
+            continue
+        parts = [
+            _identifier(p)
+            for p in (table.args.get("catalog"), table.args.get("db"), table.this)
+            if p is not None
+        ]
+        if len(parts) < 3:
+            defaults = [(database or "").upper(), (schema or "").upper()]
+            parts = defaults[: 3 - len(parts)] + parts
+        if not all(parts):
+            return None
+        tables.add(".".join(parts))
+    return sorted(tables)
+
+
+def result_key(sql: str, fingerprints: Dict[str, str]) -> str:
+    return hashlib.sha256(
+        json.dumps([sql.strip(), sorted(fingerprints.items())]).encode("utf-8")
+    ).hexdigest()
+
+
+class QueryResultCache:
+    """
+    Thread safe in-memory cache of query results by result_key, evicting the least recently used entries first.
+    Only data frames are cached, query errors are always retried.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_rows: int = DEFAULT_MAX_ROWS,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, pd.DataFrame]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[pd.DataFrame]:
+        with self._lock:
+            frame = self._entries.get(key)
+            if frame is not None:
+                self._entries.move_to_end(key)
+            return frame
+
+    def put(self, key: str, result: Union[pd.DataFrame, str]) -> None:
+        if not isinstance(result, pd.DataFrame) or len(result) > self.max_rows:
+            return
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cacheable_queries(
+    queries: List[str], database: Optional[str], schema: Optional[str]
+) -> Tuple[Dict[int, List[str]], List[str]]:
+    """
+    Returns the tables of each cacheable query by its index in queries, and all of their tables, for fetching their
+    fingerprints at once.
+    """
+    tables_by_query: Dict[int, List[str]] = {}
+    all_tables = set()
+    for i, sql in enumerate(queries):
+        tables = query_tables(sql, database, schema) if sql else None
+        if tables:
+            tables_by_query[i] = tables
+            all_tables.update(tables)
+    return tables_by_query, sorted(all_tables)
@@ -0,0 +1,147 @@
+# Quick evaluation: instead of every question of the evaluation table, a stratified sample of them is evaluated in
+# batches, and the run stops as soon as the accuracy is known well enough.
+#
+# Questions are stratified by the tables their gold SQL reads, or by their outcome in the last run (failed, passed or
+# never run), and ordered so that every prefix of the order is a proportional stratified sample: each stratum is
+# shuffled and its questions are spread evenly over the order. Evaluating the order batch by batch therefore keeps the
+# estimate unbiased at any point where the run stops, and a fixed seed gives the same order, and the same reusable
+# results, from one quick run to the next.
+#
+# After every batch, the Wilson interval of the accuracy (with the finite population correction, as the sample is
+# drawn without replacement) decides whether to stop: when it is narrower than the target, or when it lies entirely
+# below the accuracy of the last accepted run.
+
+import math
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from semantic_model_generator.data_processing.query_result_cache import query_tables
+
+STRATIFY_BY_TABLE = "table"
+STRATIFY_BY_OUTCOME = "failing"
+STRATIFY_OPTIONS = (STRATIFY_BY_TABLE, STRATIFY_BY_OUTCOME)
+
+# Stratum of the questions whose gold SQL query_tables gives no tables for (unparsable or non-deterministic SQL).
+UNKNOWN_TABLES = "<unknown>"
+FAILED, PASSED, NOT_RUN = "failed", "passed", "not run"
+
+STOP_PRECISE = "accuracy interval is narrow enough"
+STOP_BELOW_BASELINE = "accuracy is below the last accepted run"
+STOP_MAX_QUESTIONS = "sample size reached"
+STOP_EXHAUSTED = "all questions evaluated"
+
+
+@dataclass
+class QuickEvalConfig:
+    # Questions evaluated between two checks of the stopping rules.
+    batch_size: int = 20
+    # No stopping rule applies before this many questions were evaluated.
+    min_questions: int = 30
+    # Largest number of questions evaluated, all of them if 0.
+    max_questions: int = 0
+    # Stop once the half width of the accuracy interval is at most this many percentage points.
+    target_half_width: float = 5.0
+    confidence: float = 0.95
+    stratify: str = STRATIFY_BY_TABLE
+    seed: int = 0
+
+
+def table_strata(
+    eval_frame: pd.DataFrame, database: Optional[str], schema: Optional[str]
+) -> pd.Series:
+    """Returns the stratum of every question of eval_frame: the tables its gold SQL reads."""
+
+    def _stratum(sql: str) -> str:
+        tables = query_tables(sql, database, schema)
+        return ",".join(tables) if tables else UNKNOWN_TABLES
+
+    return eval_frame["GOLD_SQL"].map(_stratum)
+
+
+def outcome_strata(
+    eval_frame: pd.DataFrame, last_results: Optional[pd.DataFrame]
+) -> pd.Series:
+    """
+    Returns the stratum of every question of eval_frame: whether it failed or passed in last_results (with QUERY,
+    GOLD_SQL and CORRECT), or was not run.
+    """
+    outcomes: Dict[Tuple[str, str], str] = {}
+    if last_results is not None:
+        outcomes = {
+            (query, gold_sql): PASSED if correct else FAILED
+            for query, gold_sql, correct in zip(
+                last_results["QUERY"],
+                last_results["GOLD_SQL"],
+                last_results["CORRECT"],
+            )
+        }
+    return pd.Series(
+        [
+            outcomes.get((query, gold_sql), NOT_RUN)
+            for query, gold_sql in zip(eval_frame["QUERY"], eval_frame["GOLD_SQL"])
+        ],
+        index=eval_frame.index,
+    )
+
+
+def stratified_order(strata: pd.Series, seed: int = 0) -> pd.Index:
+    """
+    Returns the index of strata in an order whose every prefix is a proportional stratified sample: the i-th of the
+    n shuffled questions of a stratum is placed at (i + offset) / n, with a random offset per stratum.
+    """
+    rng = np.random.default_rng(seed)
+    positions = pd.Series(0.0, index=strata.index)
+    for _, members in strata.groupby(strata, sort=True):
+        shuffled = members.index[rng.permutation(len(members))]
+        positions[shuffled] = (np.arange(len(members)) + rng.random()) / len(members)
+    return positions.sort_values(kind="stable").index
+
+
+def accuracy_interval(
+    correct: int, total: int, population: int, confidence: float = 0.95
+) -> Tuple[float, float]:
+    """
+    Returns the Wilson interval, in percent, of the accuracy of the population given correct answers out of a sample
+    of total of its questions, drawn without replacement.
+    """
+    if total <= 0:
+        return 0.0, 100.0
+    # The finite population correction shrinks the interval to nothing once the whole population was evaluated.
+    fpc = (population - total) / (population - 1) if population > 1 else 0.0
+    z = NormalDist().inv_cdf(0.5 + confidence / 2) * math.sqrt(max(fpc, 0.0))
+    p = correct / total
+    denominator = 1 + z**2 / total
+    center = (p + z**2 / (2 * total)) / denominator
+    half_width = (
+        z * math.sqrt(p * (1 - p) / total + z**2 / (4 * total**2)) / denominator
+    )
+    return max(center - half_width, 0.0) * 100, min(center + half_width, 1.0) * 100
+
+
+def stop_reason(
+    correct: int,
+    total: int,
+    population: int,
+    config: QuickEvalConfig,
+    baseline: Optional[float] = None,
+) -> Optional[str]:
+    """
+    Returns why a quick evaluation that has correct answers out of total questions of the population should stop, or
+    None if it should go on. baseline is the accuracy, in percent, of the last accepted run.
+    """
+    if total >= population:
+        return STOP_EXHAUSTED
+    if config.max_questions and total >= config.max_questions:
+        return STOP_MAX_QUESTIONS
+    if total < config.min_questions:
+        return None
+    low, high = accuracy_interval(correct, total, population, config.confidence)
+    if baseline is not None and high < baseline:
+        return STOP_BELOW_BASELINE
+    if (high - low) / 2 <= config.target_half_width:
+        return STOP_PRECISE
+    return None
@@ -0,0 +1,233 @@
+# Compares the result of a generated query with the result of a gold query, as done by the evaluation journey.
+# A result matches if, for every gold column, there is a distinct result column with the same values, and the rows of
+# the matched columns are the same up to their order. Column names and extra result columns do not matter.
+#
+# Columns are normalized so that harmless differences do not count: numbers (ints, floats, Decimals, nullable ints,
+# booleans) are compared as floats rounded to a number of decimals, dates and timestamps as UTC nanoseconds, and
+# everything else as strings. Every normalized column is then hashed row-wise with pandas, and columns are matched
+# through dict lookups of their fingerprints instead of comparing every pair of columns. When several result columns
+# have the values of a gold column, the assignment whose rows line up is found by backtracking.
+
+import hashlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DECIMALS = 6
+# Bounds the search for the result columns of the gold columns, see _assign_columns.
+_MAX_ASSIGNMENT_STEPS = 10_000
+
+_NUMERIC_INFERRED_TYPES = {
+    "integer",
+    "floating",
+    "decimal",
+    "mixed-integer-float",
+    "boolean",
+}
+_DATETIME_INFERRED_TYPES = {"datetime", "datetime64", "date"}
+
+
+@dataclass
+class ColumnFingerprint:
+    # Hash of every row of the normalized column.
+    row_hashes: np.ndarray
+    # Hash of the rows in order, and of the sorted rows (the multiset of values).
+    ordered: str
+    multiset: str
+
+
+@dataclass
+class ResultMatch:
+    matched: bool
+    # Whether the rows are also in the same order, only meaningful if matched.
+    same_order: bool = False
+    # Maps gold columns to the result columns they matched.
+    column_mapping: Dict[str, str] = field(default_factory=dict)
+    reason: str = ""
+
+
+def _normalize(series: pd.Series, decimals: int) -> pd.Series:
+    """Returns the column as floats, int nanoseconds or strings, with missing values as None or NaN."""
+    series = series.reset_index(drop=True)
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        values = pd.to_numeric(series, errors="coerce").astype("float64")
+        # Adding 0.0 turns -0.0 into 0.0, which would hash differently.
+        return values.round(decimals) + 0.0
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return _datetime_nanos(series)
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred in _NUMERIC_INFERRED_TYPES:
+        values = pd.to_numeric(series.astype("object"), errors="coerce")
+        return values.astype("float64").round(decimals) + 0.0
+    if inferred in _DATETIME_INFERRED_TYPES:
+        try:
+            return _datetime_nanos(pd.to_datetime(series, utc=True))
+        except (TypeError, ValueError):
+            pass
+    return series.map(lambda v: None if _is_missing(v) else str(v)).astype("object")
+
+
+def _is_missing(value: object) -> bool:
+    try:
+        return bool(pd.isna(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _datetime_nanos(series: pd.Series) -> pd.Series:
+    if getattr(series.dt, "tz", None) is not None:
+        series = series.dt.tz_convert("UTC").dt.tz_localize(None)
+    nanos = series.astype("datetime64[ns]").astype("int64").astype("object")
+    nanos[series.isna()] = None
+    return nanos
+
+
+def _digest(row_hashes: np.ndarray) -> str:
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def column_fingerprint(
+    series: pd.Series, decimals: int = DEFAULT_DECIMALS
+) -> ColumnFingerprint:
+    row_hashes = pd.util.hash_pandas_object(
+        _normalize(series, decimals), index=False
+    ).to_numpy()
+    return ColumnFingerprint(
+        row_hashes=row_hashes,
+        ordered=_digest(row_hashes),
+        multiset=_digest(np.sort(row_hashes)),
+    )
+
+
+def _combine_rows(columns: List[np.ndarray]) -> np.ndarray:
+    """Hashes the rows of several columns, given the row hashes of each column."""
+    if not columns:
+        return np.zeros(0, dtype=np.uint64)
+    return pd.util.hash_pandas_object(
+        pd.DataFrame({i: c for i, c in enumerate(columns)}), index=False
+    ).to_numpy()
+
+
+def rows_digest(frame: pd.DataFrame, decimals: int = DEFAULT_DECIMALS) -> str:
+    """
+    Hash of the multiset of the normalized rows of a frame: it does not depend on the order of the rows, but does on
+    which values share a row.
+    """
+    row_hashes = _combine_rows(
+        [
+            column_fingerprint(frame.iloc[:, i], decimals).row_hashes
+            for i in range(frame.shape[1])
+        ]
+    )
+    return _digest(np.sort(row_hashes))
+
+
+def match_results(
+    result_frame: pd.DataFrame,
+    gold_frame: pd.DataFrame,
+    decimals: int = DEFAULT_DECIMALS,
+) -> ResultMatch:
+    """
+    Checks whether the result frame contains all the data of the gold frame, regardless of column names, extra
+    result columns, row order and harmless differences in types. See the module comment for details.
+    """
+    (n_rows, n_columns), (n_gold_rows, n_gold_columns) = (
+        result_frame.shape,
+        gold_frame.shape,
+    )
+    if n_rows != n_gold_rows:
+        return ResultMatch(
+            False, reason=f"row counts differ: {n_rows} vs {n_gold_rows}"
+        )
+    if n_columns < n_gold_columns:
+        return ResultMatch(
+            False,
+            reason=f"result has fewer columns: {n_columns} vs {n_gold_columns}",
+        )
+
+    result_prints = [
+        column_fingerprint(result_frame.iloc[:, i], decimals) for i in range(n_columns)
+    ]
+    gold_prints = [
+        column_fingerprint(gold_frame.iloc[:, g], decimals)
+        for g in range(n_gold_columns)
+    ]
+    by_multiset: Dict[str, List[int]] = {}
+    for i, fingerprint in enumerate(result_prints):
+        by_multiset.setdefault(fingerprint.multiset, []).append(i)
+
+    candidates: List[List[int]] = []
+    for g, gold_print in enumerate(gold_prints):
+        same_values = by_multiset.get(gold_print.multiset, [])
+        if not same_values:
+            return ResultMatch(
+                False,
+                reason=f"no result column has the values of {gold_frame.columns[g]}",
+            )
+        # Among columns with the same values, try those with the values in the same order first.
+        in_order = [
+            i for i in same_values if result_prints[i].ordered == gold_print.ordered
+        ]
+        candidates.append(in_order + [i for i in same_values if i not in in_order])
+
+    gold_rows = [np.zeros(n_gold_rows, dtype=np.uint64)]
+    for gold_print in gold_prints:
+        gold_rows.append(_combine_rows([gold_rows[-1], gold_print.row_hashes]))
+    found = _assign_columns(gold_rows, result_prints, candidates)
+    if found is None:
+        return ResultMatch(
+            False,
+            reason="no result columns with the same values have them in the same rows",
+        )
+    assignment, result_rows = found
+    return ResultMatch(
+        True,
+        same_order=bool(np.array_equal(gold_rows[-1], result_rows)),
+        column_mapping={
+            str(gold_frame.columns[g]): str(result_frame.columns[i])
+            for g, i in enumerate(assignment)
+        },
+    )
+
+
+def _assign_columns(
+    gold_rows: List[np.ndarray],
+    result_prints: List[ColumnFingerprint],
+    candidates: List[List[int]],
+) -> Optional[Tuple[List[int], np.ndarray]]:
+    """
+    Picks a distinct result column among the candidates of every gold column so that the values line up in the same
+    rows, where gold_rows[g] are the combined row hashes of the first g gold columns. Several result columns can have
+    the values of a gold column in different rows, so this backtracks, extending an assignment of the first gold
+    columns only while the multiset of its rows is that of the gold rows. Returns the result column of every gold
+    column and the combined result rows, or None if there is no such assignment within _MAX_ASSIGNMENT_STEPS.
+    """
+    assignment: List[int] = []
+    result_rows = [gold_rows[0]]
+    steps = 0
+
+    def extend() -> bool:
+        nonlocal steps
+        g = len(assignment)
+        if g == len(candidates):
+            return True
+        for i in candidates[g]:
+            if i in assignment:
+                continue
+            steps += 1
+            if steps > _MAX_ASSIGNMENT_STEPS:
+                return False
+            rows = _combine_rows([result_rows[-1], result_prints[i].row_hashes])
+            if not np.array_equal(np.sort(rows), np.sort(gold_rows[g + 1])):
+                continue
+            assignment.append(i)
+            result_rows.append(rows)
+            if extend():
+                return True
+            assignment.pop()
+            result_rows.pop()
+        return False
+
+    return (assignment, result_rows[-1]) if extend() else None
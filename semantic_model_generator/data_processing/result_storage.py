@@ -0,0 +1,99 @@
+# Compact storage of the query results of evaluation runs. Instead of the full result frames, the results table keeps
+# a digest and a small preview of each result, and the full frames are written as zstd compressed Parquet files to a
+# stage, one file per distinct result named after its digest. Results that are the same across rows, runs or semantic
+# models (most gold results) are therefore stored once.
+#
+# Failed queries have no digest, their preview is the error message.
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional, Union
+
+import pandas as pd
+
+PREVIEW_ROWS = 10
+PREVIEW_MAX_CHARS = 200
+PARQUET_COMPRESSION = "zstd"
+
+
+def result_digest(result: Union[pd.DataFrame, str]) -> Optional[str]:
+    """
+    Returns the content hash of a result frame, which depends on its column names and types and on its values in
+    order, or None if the result is an error.
+    """
+    if not isinstance(result, pd.DataFrame):
+        return None
+    try:
+        row_hashes = pd.util.hash_pandas_object(result, index=False)
+    except TypeError:
+        # Columns of unhashable values (e.g. lists), hash their text instead.
+        row_hashes = pd.util.hash_pandas_object(result.astype(str), index=False)
+    digest = hashlib.sha256(
+        json.dumps(
+            [[str(c) for c in result.columns], [str(t) for t in result.dtypes]]
+        ).encode("utf-8")
+    )
+    digest.update(row_hashes.to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _truncate(value: Any) -> Any:
+    if isinstance(value, str) and len(value) > PREVIEW_MAX_CHARS:
+        return value[:PREVIEW_MAX_CHARS] + "..."
+    return value
+
+
+def result_preview(result: Union[pd.DataFrame, str]) -> str:
+    """
+    Returns the JSON preview of a result frame: its number of rows, its column names and its first PREVIEW_ROWS rows
+    with long strings truncated. Returns the error message if the result is an error.
+    """
+    if not isinstance(result, pd.DataFrame):
+        return str(result)
+    head = result.head(PREVIEW_ROWS).map(_truncate)
+    preview = json.loads(
+        head.to_json(
+            orient="split", index=False, date_format="iso", default_handler=str
+        )
+    )
+    return json.dumps(
+        {"num_rows": len(result), **preview}, ensure_ascii=False, default=str
+    )
+
+
+def read_preview(preview: Optional[str]) -> Union[pd.DataFrame, str]:
+    """Reads a preview written by result_preview back, as a frame of the preview rows or as the error message."""
+    if preview is None:
+        return ""
+    try:
+        data = json.loads(preview)
+    except (TypeError, ValueError):
+        return str(preview)
+    if not isinstance(data, dict) or "columns" not in data:
+        return str(preview)
+    return pd.DataFrame(data.get("data") or [], columns=data["columns"])
+
+
+def result_file_name(digest: str) -> str:
+    return f"{digest}.parquet"
+
+
+def write_result_files(results: Dict[str, pd.DataFrame], directory: str) -> int:
+    """Writes the result frames by digest as Parquet files into the directory, returning the number of files."""
+    for digest, frame in results.items():
+        path = os.path.join(directory, result_file_name(digest))
+        # Parquet needs distinct string column names, which query results do not always have.
+        names = [str(c) for c in frame.columns]
+        frame = frame.set_axis(
+            [f"{c}_{i}" if names.count(c) > 1 else c for i, c in enumerate(names)],
+            axis=1,
+        )
+        try:
+            frame.to_parquet(path, compression=PARQUET_COMPRESSION, index=False)
+        except (TypeError, ValueError):
+            # Columns of mixed types cannot be written as Parquet, store their text instead.
+            frame.astype(str).to_parquet(
+                path, compression=PARQUET_COMPRESSION, index=False
+            )
+    return len(results)
@@ -0,0 +1,378 @@
+# Schema linking picks the parts of a semantic model that are relevant to a question, so that SQL generation prompts
+# only include those instead of the full model. Tables and columns are indexed by their names, synonyms, descriptions
+# and sample values with BM25 over word tokens, character trigrams and, for Chinese, character unigrams and bigrams
+# (Chinese is not whitespace separated). The top tables are then connected through the relationships of the model, so
+# the pruned model keeps the join paths between them.
+#
+# The index works on the semantic model as loaded from yaml (a dict), since prompts are rendered from yaml anyway and
+# this avoids a round trip through the protobuf. Tables that are kept whole are rendered with the same text in every
+# pruned model (see SchemaIndex.table_yaml), so that prompts can pass them by reference (see prompt_context).
+
+import math
+import re
+import unicodedata
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import yaml
+
+_COLUMN_SECTIONS = (
+    "columns",
+    "dimensions",
+    "time_dimensions",
+    "measures",
+    "facts",
+    "metrics",
+)
+_WORD = re.compile(r"[a-z0-9]+")
+_CJK = re.compile("[\u3400-\u4dbf\u4e00-\u9fff]+")
+_LOGICAL_TABLE_PREFIX = "__"
+
+try:
+    _Loader: Any = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+DEFAULT_MAX_TABLES = 5
+DEFAULT_MAX_COLUMNS_PER_TABLE = 30
+DEFAULT_MAX_VERIFIED_QUERIES = 3
+
+
+def _dump(data: Any) -> str:
+    return yaml.safe_dump(  # type: ignore[no-any-return]
+        data, allow_unicode=True, sort_keys=False
+    )
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into words (with "_" as a separator) plus character trigrams of longer words, which also match
+    plurals and other inflections, and into character unigrams and bigrams for Chinese.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    tokens: List[str] = []
+    for word in _WORD.findall(text):
+        tokens.append(word)
+        if len(word) > 4:
+            tokens.extend(f"#{word[i:i + 3]}" for i in range(len(word) - 2))
+    for run in _CJK.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i : i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class _BM25:
+    def __init__(self, docs: List[List[str]], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_freqs = [Counter(doc) for doc in docs]
+        self.doc_lens = [len(doc) for doc in docs]
+        self.avg_doc_len = (sum(self.doc_lens) / len(docs)) if docs else 0.0
+        doc_freqs: Counter[str] = Counter()
+        for term_freq in self.term_freqs:
+            doc_freqs.update(term_freq.keys())
+        self.idf = {
+            term: math.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+    def scores(self, query: List[str]) -> List[float]:
+        terms = [t for t in set(query) if t in self.idf]
+        scores = []
+        for term_freq, doc_len in zip(self.term_freqs, self.doc_lens):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * doc_len / (self.avg_doc_len or 1))
+            for term in terms:
+                tf = term_freq.get(term, 0)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        return scores
+
+
+def _text(entry: Dict[str, Any], keys: Tuple[str, ...]) -> str:
+    parts = []
+    for key in keys:
+        value = entry.get(key)
+        if isinstance(value, list):
+            parts.extend(str(v) for v in value)
+        elif value is not None:
+            parts.append(str(value))
+    return " ".join(parts)
+
+
+# A column is identified by (table index, column section, index in section).
+_ColumnRef = Tuple[int, str, int]
+
+
+@dataclass
+class SchemaIndex:
+    """Index over the tables and columns of a semantic model dict, see link() for usage."""
+
+    model: Dict[str, Any]
+    _table_bm25: _BM25
+    _column_bm25: _BM25
+    _columns: List[_ColumnRef]
+    _table_yamls: Dict[int, str] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, model: Dict[str, Any]) -> "SchemaIndex":
+        tables = model.get("tables") or []
+        table_docs = [
+            tokenize(_text(t, ("name", "synonyms", "description"))) for t in tables
+        ]
+        columns: List[_ColumnRef] = []
+        column_docs = []
+        for i, table in enumerate(tables):
+            for section in _COLUMN_SECTIONS:
+                for j, column in enumerate(table.get(section) or []):
+                    columns.append((i, section, j))
+                    column_docs.append(
+                        tokenize(
+                            _text(
+                                column,
+                                (
+                                    "name",
+                                    "synonyms",
+                                    "description",
+                                    "expr",
+                                    "sample_values",
+                                ),
+                            )
+                        )
+                    )
+        return cls(model, _BM25(table_docs), _BM25(column_docs), columns)
+
+    @classmethod
+    def from_yaml(cls, yaml_str: str) -> "SchemaIndex":
+        return cls.from_dict(yaml.load(yaml_str, Loader=_Loader) or {})
+
+    def table_yaml(self, index: int) -> str:
+        """Returns the yaml of a whole table as an item of the tables list, as render renders it."""
+        if index not in self._table_yamls:
+            self._table_yamls[index] = _dump([self.model["tables"][index]])
+        return self._table_yamls[index]
+
+    def table_yamls(self) -> List[str]:
+        return [self.table_yaml(i) for i in range(len(self.model.get("tables") or []))]
+
+    def render(self, pruned: Dict[str, Any]) -> str:
+        """
+        Renders a model returned by link as yaml. Tables that link kept whole are rendered as table_yaml, so that
+        their text does not depend on the question.
+        """
+        tables = self.model.get("tables") or []
+        header = {
+            k: v
+            for k, v in pruned.items()
+            if k not in ("tables", "relationships", "verified_queries")
+        }
+        parts = [_dump(header)] if header else []
+        parts.append("tables:\n")
+        for table in pruned.get("tables") or []:
+            index = next((i for i, t in enumerate(tables) if t is table), None)
+            parts.append(_dump([table]) if index is None else self.table_yaml(index))
+        for key in ("relationships", "verified_queries"):
+            if pruned.get(key):
+                parts.append(_dump({key: pruned[key]}))
+        return "".join(parts)
+
+    def _join_graph(self) -> Dict[str, List[Tuple[str, int]]]:
+        graph: Dict[str, List[Tuple[str, int]]] = {}
+        for i, rel in enumerate(self.model.get("relationships") or []):
+            left, right = rel.get("left_table"), rel.get("right_table")
+            graph.setdefault(left, []).append((right, i))
+            graph.setdefault(right, []).append((left, i))
+        return graph
+
+    def _join_path(
+        self,
+        graph: Dict[str, List[Tuple[str, int]]],
+        connected: Set[str],
+        target: str,
+    ) -> Optional[Tuple[List[str], List[int]]]:
+        """Returns the tables and relationships of the shortest path from the connected tables to target."""
+        parents: Dict[str, Optional[Tuple[str, int]]] = {t: None for t in connected}
+        queue = deque(connected)
+        while queue:
+            table = queue.popleft()
+            if table == target:
+                tables, relationships = [], []
+                step = parents[table]
+                while step is not None:
+                    tables.append(table)
+                    relationships.append(step[1])
+                    table = step[0]
+                    step = parents[table]
+                return tables, relationships
+            for neighbor, rel in graph.get(table, []):
+                if neighbor not in parents:
+                    parents[neighbor] = (table, rel)
+                    queue.append(neighbor)
+        return None
+
+    def link(
+        self,
+        question: str,
+        max_tables: int = DEFAULT_MAX_TABLES,
+        max_columns_per_table: int = DEFAULT_MAX_COLUMNS_PER_TABLE,
+        max_verified_queries: int = DEFAULT_MAX_VERIFIED_QUERIES,
+    ) -> Dict[str, Any]:
+        """
+        Returns a copy of the semantic model with only the tables and columns relevant to the question, the tables
+        and relationships needed to join them, and the verified queries over those tables.
+        Returns the full model if nothing in it matches the question.
+        """
+        tables = self.model.get("tables") or []
+        query = tokenize(question)
+        column_scores: Dict[_ColumnRef, float] = {
+            ref: score
+            for ref, score in zip(self._columns, self._column_bm25.scores(query))
+            if score > 0
+        }
+        # A table scores by its own text plus its best matching columns.
+        table_scores = self._table_bm25.scores(query)
+        best_columns: Dict[int, List[float]] = {}
+        for (i, _, _), score in column_scores.items():
+            best_columns.setdefault(i, []).append(score)
+        for i, scores in best_columns.items():
+            table_scores[i] += sum(sorted(scores, reverse=True)[:3])
+        ranked = sorted(
+            (i for i, score in enumerate(table_scores) if score > 0),
+            key=lambda i: -table_scores[i],
+        )[:max_tables]
+        if not ranked:
+            return self.model
+
+        # Connect the ranked tables, most relevant first, through the shortest join paths.
+        names = [t.get("name") for t in tables]
+        graph = self._join_graph()
+        selected = [names[ranked[0]]]
+        relationship_ids: Set[int] = set()
+        for i in ranked[1:]:
+            if names[i] in selected:
+                continue
+            path = self._join_path(graph, set(selected), names[i])
+            if path is None:
+                selected.append(names[i])
+                continue
+            path_tables, path_relationships = path
+            selected.extend(t for t in reversed(path_tables) if t not in selected)
+            relationship_ids.update(path_relationships)
+        relationships = [
+            rel
+            for i, rel in enumerate(self.model.get("relationships") or [])
+            if i in relationship_ids
+        ]
+        join_columns: Dict[str, Set[str]] = {}
+        for rel in relationships:
+            for key in rel.get("relationship_columns") or []:
+                join_columns.setdefault(rel.get("left_table"), set()).add(
+                    key.get("left_column")
+                )
+                join_columns.setdefault(rel.get("right_table"), set()).add(
+                    key.get("right_column")
+                )
+
+        pruned_tables = []
+        for name in selected:
+            i = names.index(name)
+            pruned_tables.append(
+                self._prune_table(
+                    i,
+                    column_scores,
+                    join_columns.get(name, set()),
+                    max_columns_per_table,
+                )
+            )
+
+        pruned = {
+            k: v
+            for k, v in self.model.items()
+            if k not in ("tables", "relationships", "verified_queries")
+        }
+        pruned["tables"] = pruned_tables
+        if relationships:
+            pruned["relationships"] = relationships
+        verified_queries = self._verified_queries(
+            set(selected), query, max_verified_queries
+        )
+        if verified_queries:
+            pruned["verified_queries"] = verified_queries
+        return pruned
+
+    def _prune_table(
+        self,
+        index: int,
+        column_scores: Dict[_ColumnRef, float],
+        join_columns: Set[str],
+        max_columns: int,
+    ) -> Dict[str, Any]:
+        table = self.model["tables"][index]
+        total = sum(len(table.get(s) or []) for s in _COLUMN_SECTIONS)
+        if total <= max_columns:
+            return table  # type: ignore[no-any-return]
+
+        # Keep the best matching columns, plus the join and primary key columns needed to use the table.
+        required = set(join_columns)
+        required.update((table.get("primary_key") or {}).get("columns") or [])
+        ranked = sorted(
+            (
+                (score, ref)
+                for ref, score in column_scores.items()
+                if ref[0] == index
+            ),
+            reverse=True,
+        )
+        keep = {ref for _, ref in ranked[:max_columns]}
+        pruned = {k: v for k, v in table.items() if k not in _COLUMN_SECTIONS}
+        for section in _COLUMN_SECTIONS:
+            columns = [
+                c
+                for j, c in enumerate(table.get(section) or [])
+                if (index, section, j) in keep or c.get("name") in required
+            ]
+            if columns:
+                pruned[section] = columns
+        return pruned
+
+    def _verified_queries(
+        self, selected: Set[str], query: List[str], limit: int
+    ) -> List[Dict[str, Any]]:
+        candidates = []
+        all_tables = {t.get("name") for t in self.model.get("tables") or []}
+        query_terms = set(query)
+        for vq in self.model.get("verified_queries") or []:
+            sql = str(vq.get("sql", "")).lower()
+            used = {
+                name
+                for name in all_tables
+                if f"{_LOGICAL_TABLE_PREFIX}{name}".lower() in sql
+            }
+            if used and used <= selected:
+                overlap = len(query_terms & set(tokenize(str(vq.get("question", "")))))
+                candidates.append((overlap, vq))
+        candidates.sort(key=lambda c: -c[0])
+        return [vq for _, vq in candidates[:limit]]
+
+
+def link_schema_yaml(
+    yaml_str: str,
+    question: str,
+    index: Optional[SchemaIndex] = None,
+    max_tables: int = DEFAULT_MAX_TABLES,
+    max_columns_per_table: int = DEFAULT_MAX_COLUMNS_PER_TABLE,
+    max_verified_queries: int = DEFAULT_MAX_VERIFIED_QUERIES,
+) -> str:
+    """
+    Returns the semantic model yaml pruned to the parts relevant to the question. Pass in an index built once for
+    the model to avoid re-indexing it for every question.
+    """
+    index = index or SchemaIndex.from_yaml(yaml_str)
+    pruned = index.link(
+        question, max_tables, max_columns_per_table, max_verified_queries
+    )
+    if pruned is index.model:
+        return yaml_str
+    return index.render(pruned)
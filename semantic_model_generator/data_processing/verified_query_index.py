@@ -0,0 +1,174 @@
+# Index over the verified queries of a semantic model, to reuse them when generating SQL with an LLM. A question that
+# (nearly) exactly matches a verified question can be answered with the verified SQL without calling the LLM, and the
+# most similar verified queries make good few-shot examples otherwise.
+#
+# Questions are compared by TF-IDF weighted cosine similarity of their content tokens: the words of the normalized text,
+# without stop words and plural endings, and the character bigrams of Chinese text (which has no word boundaries)
+# without its particles, so "各地区的总销售额" and "各地区总销售额" have the same tokens. A match also needs every
+# content token of either question in the other, since a single extra qualifier ("by product line" instead of "by
+# product") changes the SQL. Numbers must match exactly for the same reason, "2023年销售额" and "2024年销售额" differ by
+# a single character but need different SQL.
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+import yaml
+
+try:
+    _Loader: Any = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+DEFAULT_MATCH_THRESHOLD = 0.9
+DEFAULT_NUM_EXAMPLES = 3
+DEFAULT_MIN_EXAMPLE_SCORE = 0.2
+
+_NUMBER = re.compile(r"\d+(?:\.\d+)?")
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff"
+_SPACE_NEXT_TO_CJK = re.compile(f"(?<=[{_CJK}]) | (?=[{_CJK}])")
+_CJK_CHAR = re.compile(f"[{_CJK}]")
+_TOKEN = re.compile(f"[{_CJK}]+|[^\\s{_CJK}]+")
+_STOP_WORDS = frozenset(
+    "a an and are at be by can could did do does for from give i in is list me my of on our please show tell "
+    "that the there to us was we were what which who with would".split()
+)
+# Structural particles and sentence final particles, which do not change what a Chinese question asks for.
+_CJK_PARTICLES = str.maketrans("", "", "的了吗呢吧啊呀")
+
+
+def normalize_question(question: str) -> str:
+    """Lower cases the question and removes punctuation and the spaces that do not separate words."""
+    question = unicodedata.normalize("NFKC", question).lower()
+    question = "".join(
+        " " if unicodedata.category(c).startswith(("P", "S")) else c
+        for c in question
+    )
+    question = " ".join(question.split())
+    return _SPACE_NEXT_TO_CJK.sub("", question)
+
+
+def _numbers(question: str) -> List[str]:
+    return _NUMBER.findall(unicodedata.normalize("NFKC", question))
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def _tokens(question: str) -> "Counter[str]":
+    """Returns the content tokens of a question: its words, and the character bigrams of its Chinese text."""
+    tokens: Counter[str] = Counter()
+    for token in _TOKEN.findall(normalize_question(question)):
+        if _CJK_CHAR.match(token):
+            run = token.translate(_CJK_PARTICLES)
+            tokens.update(run[i : i + 2] for i in range(len(run) - 1))
+            if len(run) == 1:
+                tokens[run] += 1
+        elif token not in _STOP_WORDS:
+            tokens[_stem(token)] += 1
+    return tokens
+
+
+@dataclass
+class VerifiedQueryMatch:
+    question: str
+    sql: str
+    name: str
+    score: float
+
+
+@dataclass
+class VerifiedQueryIndex:
+    """Index over the verified queries of a semantic model, see search() and match()."""
+
+    verified_queries: List[Dict[str, Any]]
+    _vectors: List[Dict[str, float]]
+    _numbers: List[List[str]]
+    _idf: Dict[str, float]
+    _token_sets: List[FrozenSet[str]] = field(default_factory=list)
+
+    @classmethod
+    def from_dict(cls, model: Dict[str, Any]) -> "VerifiedQueryIndex":
+        verified_queries = [
+            vq
+            for vq in model.get("verified_queries") or []
+            if vq.get("question") and vq.get("sql")
+        ]
+        tokens = [_tokens(str(vq["question"])) for vq in verified_queries]
+        doc_freqs: Counter[str] = Counter()
+        for t in tokens:
+            doc_freqs.update(t.keys())
+        idf = {
+            token: math.log(1 + len(tokens) / df) for token, df in doc_freqs.items()
+        }
+        numbers = [_numbers(str(vq["question"])) for vq in verified_queries]
+        index = cls(verified_queries, [], numbers, idf, [frozenset(t) for t in tokens])
+        index._vectors = [index._vector(t) for t in tokens]
+        return index
+
+    @classmethod
+    def from_yaml(cls, yaml_str: str) -> "VerifiedQueryIndex":
+        return cls.from_dict(yaml.load(yaml_str, Loader=_Loader) or {})
+
+    def _vector(self, tokens: "Counter[str]") -> Dict[str, float]:
+        # Tokens that no verified question has get the highest weight, since they make the question different.
+        max_idf = math.log(1 + len(self.verified_queries))
+        vector = {
+            token: count * self._idf.get(token, max_idf)
+            for token, count in tokens.items()
+        }
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {token: w / norm for token, w in vector.items()}
+
+    def _scored(
+        self, tokens: "Counter[str]", min_score: float
+    ) -> List[Tuple[float, int]]:
+        query = self._vector(tokens)
+        scored = []
+        for i, vector in enumerate(self._vectors):
+            score = sum(w * vector.get(token, 0.0) for token, w in query.items())
+            if score >= min_score:
+                scored.append((score, i))
+        scored.sort(key=lambda s: -s[0])
+        return scored
+
+    def _match(self, score: float, i: int) -> VerifiedQueryMatch:
+        vq = self.verified_queries[i]
+        return VerifiedQueryMatch(
+            question=str(vq["question"]),
+            sql=str(vq["sql"]),
+            name=str(vq.get("name", "")),
+            score=score,
+        )
+
+    def search(
+        self,
+        question: str,
+        k: int = DEFAULT_NUM_EXAMPLES,
+        min_score: float = DEFAULT_MIN_EXAMPLE_SCORE,
+    ) -> List[VerifiedQueryMatch]:
+        """Returns up to k verified queries whose questions are most similar to the question, best first."""
+        scored = self._scored(_tokens(question), min_score)
+        return [self._match(*s) for s in scored[:k]]
+
+    def match(
+        self, question: str, threshold: float = DEFAULT_MATCH_THRESHOLD
+    ) -> Optional[VerifiedQueryMatch]:
+        """
+        Returns the verified query that answers the question, if its question is at least threshold similar, has the
+        same content tokens and mentions the same numbers.
+        """
+        tokens = _tokens(question)
+        numbers = _numbers(question)
+        for score, i in self._scored(tokens, threshold):
+            if self._token_sets[i] == tokens.keys() and self._numbers[i] == numbers:
+                return self._match(score, i)
+        return None
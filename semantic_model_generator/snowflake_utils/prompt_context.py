@@ -0,0 +1,161 @@
+# Prompt-by-reference for LLM calls that run as SQL. Large prompt contexts that repeat across calls, like the semantic
+# model yaml or the yaml of its tables, are registered once per content hash in a small Snowflake table, and the
+# prompt is then assembled inside Snowflake with scalar subqueries on that table. The statement of every call only
+# carries the rest of the prompt (instructions, the question and anything that changes per question), instead of the
+# full context as a string literal that Snowflake has to compile, keep in query history and receive over the wire on
+# every turn.
+#
+# Registered contexts are never deleted by the app, since running processes remember which hashes they registered.
+
+import hashlib
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+
+# Fully qualified name of the table to register prompt contexts in. Prompts are inlined if it is not set.
+PROMPT_CONTEXT_TABLE = os.environ.get("PROMPT_CONTEXT_TABLE", "")
+
+# Shorter contexts are inlined, since registering them costs more than sending them. Contexts are registered once per
+# content hash, so even a table of a few columns is worth it.
+DEFAULT_MIN_REFERENCE_CHARS = 1000
+
+
+def sql_string_literal(text: str) -> str:
+    """Returns text as a single quoted Snowflake string literal."""
+    return "'" + text.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def context_hash(content: str) -> str:
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class PromptContextStore:
+    """
+    Table of prompt contexts by content hash. The table is created if it does not exist.
+    """
+
+    def __init__(
+        self,
+        conn: SnowflakeConnection,
+        table_fqn: str,
+        min_reference_chars: int = DEFAULT_MIN_REFERENCE_CHARS,
+    ) -> None:
+        self.conn = conn
+        self.table_fqn = table_fqn
+        self.min_reference_chars = min_reference_chars
+        self._registered: Set[str] = set()
+        self._lock = threading.Lock()
+        self._execute(
+            f"""CREATE TABLE IF NOT EXISTS {table_fqn} (
+                CONTEXT_HASH STRING PRIMARY KEY,
+                CONTENT STRING,
+                REGISTERED_AT TIMESTAMP_NTZ
+            )"""
+        )
+
+    def _execute(
+        self, query: str, params: Optional[Tuple[str, ...]] = None
+    ) -> None:
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params)
+        finally:
+            cursor.close()
+
+    def register(self, content: str) -> str:
+        """Registers the content, unless this process already did, and returns its hash."""
+        content_hash = context_hash(content)
+        with self._lock:
+            if content_hash in self._registered:
+                return content_hash
+            self._execute(
+                f"""MERGE INTO {self.table_fqn} t
+                USING (SELECT %s AS CONTEXT_HASH, %s AS CONTENT) s
+                ON t.CONTEXT_HASH = s.CONTEXT_HASH
+                WHEN NOT MATCHED THEN INSERT (CONTEXT_HASH, CONTENT, REGISTERED_AT)
+                VALUES (s.CONTEXT_HASH, s.CONTENT, CURRENT_TIMESTAMP())""",
+                (content_hash, content),
+            )
+            self._registered.add(content_hash)
+        return content_hash
+
+    def reference(self, content: str) -> str:
+        """Registers the content and returns a SQL expression that evaluates to it."""
+        content_hash = self.register(content)
+        return (
+            f"(SELECT CONTENT FROM {self.table_fqn} "
+            f"WHERE CONTEXT_HASH = '{content_hash}')"
+        )
+
+
+_stores: Dict[Tuple[int, str], Optional[PromptContextStore]] = {}
+_stores_lock = threading.Lock()
+
+
+def get_prompt_context_store(
+    conn: SnowflakeConnection, table_fqn: str = PROMPT_CONTEXT_TABLE
+) -> Optional[PromptContextStore]:
+    """
+    Returns the store of the connection for table_fqn, or None if table_fqn is not set or the table cannot be used,
+    in which case prompts are inlined.
+    """
+    if not table_fqn:
+        return None
+    key = (id(conn), table_fqn)
+    with _stores_lock:
+        if key not in _stores:
+            try:
+                _stores[key] = PromptContextStore(conn, table_fqn)
+            except Exception as e:
+                logger.warning(
+                    f"Unable to use prompt context table {table_fqn}, inlining prompts: {e}"
+                )
+                _stores[key] = None
+        return _stores[key]
+
+
+def prompt_sql(
+    prompt: str,
+    contexts: Iterable[str] = (),
+    store: Optional[PromptContextStore] = None,
+) -> str:
+    """
+    Returns a SQL expression that evaluates to the prompt, for use as the prompt argument of an LLM function or UDF.
+    Occurrences of the contexts in the prompt are replaced by references to the store, if one is given and they are
+    long enough to be worth it. Everything else, or the whole prompt if registering fails, is inlined as a literal.
+    """
+    if store is None:
+        return sql_string_literal(prompt)
+    # Each segment is either a literal (False, text) or a registered context (True, content).
+    segments: List[Tuple[bool, str]] = [(False, prompt)]
+    for context in sorted(
+        {c for c in contexts if len(c) >= store.min_reference_chars},
+        key=len,
+        reverse=True,
+    ):
+        split: List[Tuple[bool, str]] = []
+        for is_reference, text in segments:
+            if is_reference or context not in text:
+                split.append((is_reference, text))
+                continue
+            for i, part in enumerate(text.split(context)):
+                if i:
+                    split.append((True, context))
+                split.append((False, part))
+        segments = split
+    if len(segments) == 1:
+        return sql_string_literal(prompt)
+
+    try:
+        parts = [
+            store.reference(text) if is_reference else sql_string_literal(text)
+            for is_reference, text in segments
+            if is_reference or text
+        ]
+    except Exception as e:
+        logger.warning(f"Unable to register prompt context, inlining the prompt: {e}")
+        return sql_string_literal(prompt)
+    return f"CONCAT({', '.join(parts)})" if len(parts) > 1 else parts[0]
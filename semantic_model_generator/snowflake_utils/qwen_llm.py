@@ -2,12 +2,24 @@
 Qwen (通义千问) LLM API Integration for Snowflake China Region
 This module provides LLM capabilities using Alibaba Cloud's Qwen API
 as a replacement for Snowflake Cortex LLM functions in China region.
+
+Calls go through a QwenClient, which reuses pooled connections, retries rate limited and failed requests with
+jittered exponential backoff, limits requests and tokens per minute on the client side and enforces a deadline per
+call. The module level functions use a shared default client, see get_qwen_client().
 """
 
+import asyncio
+import concurrent.futures
 import os
 import json
+import random
+import re
+import threading
+import time
 import requests
-from typing import Optional
+from dataclasses import dataclass
+from requests.adapters import HTTPAdapter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence
 from loguru import logger
 
 # Qwen API Configuration
@@ -17,6 +29,21 @@ QWEN_DEFAULT_MODEL = "qwen-turbo"  # 可选: qwen-turbo, qwen-plus, qwen-max
 # Get API key from environment variable
 QWEN_API_KEY = os.environ.get("QWEN_API_KEY", "")
 
+# Client side rate limits of the default client, matching the quota of the API key. 0 disables the limit.
+QWEN_REQUESTS_PER_MINUTE = float(os.environ.get("QWEN_REQUESTS_PER_MINUTE", "0"))
+QWEN_TOKENS_PER_MINUTE = float(os.environ.get("QWEN_TOKENS_PER_MINUTE", "0"))
+
+# OpenAI compatible endpoint of the SPCS model service, ending in /v1. Either the service DNS name of the proxy when
+# running inside SPCS (e.g. http://qwen-model-service.<hash>.svc.spcs.internal:8001/v1), or a public ingress URL
+# together with a Snowflake session token to authenticate. Streaming from SPCS is only available when it is set.
+SPCS_ENDPOINT_URL = os.environ.get("SPCS_ENDPOINT_URL", "")
+SPCS_AUTH_TOKEN = os.environ.get("SPCS_AUTH_TOKEN", "")
+
+RETRYABLE_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+_CJK = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\u3000-\u303f\uff00-\uffef]")
+_CHARS_PER_TOKEN = 4
+
 
 def set_qwen_api_key(api_key: str) -> None:
     """Set the Qwen API key programmatically."""
@@ -25,11 +52,308 @@ def set_qwen_api_key(api_key: str) -> None:
     os.environ["QWEN_API_KEY"] = api_key
 
 
+def estimate_tokens(text: str) -> int:
+    """Rough token count of text: one token per Chinese character, and one per four other characters."""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk) // _CHARS_PER_TOKEN + 1
+
+
+def _estimated_tokens(payload: Dict[str, Any]) -> int:
+    """Estimated prompt plus completion tokens of a chat completion request, for the token rate limit."""
+    prompt = "".join(m.get("content", "") for m in payload.get("messages", []))
+    return estimate_tokens(prompt) + int(payload.get("max_tokens", 0))
+
+
+class QwenAPIError(Exception):
+    """A completion failed, after retrying if the failure was retryable, or ran past its deadline."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket that refills at rate_per_minute up to capacity, which defaults to one minute's worth.
+    """
+
+    def __init__(
+        self, rate_per_minute: float, capacity: Optional[float] = None
+    ) -> None:
+        self.rate_per_sec = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate_per_sec
+        )
+        self._updated_at = now
+
+    def acquire(self, amount: float = 1, deadline: Optional[float] = None) -> bool:
+        """
+        Blocks until amount tokens are available and takes them. Amounts above the capacity take the full bucket.
+        Returns False without taking any tokens if they would only be available after the deadline (a
+        time.monotonic() timestamp).
+        """
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return True
+                wait = (amount - self._tokens) / self.rate_per_sec
+            if deadline is not None and now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+    def adjust(self, amount: float) -> None:
+        """Returns tokens that were over-estimated (positive amount) or takes under-estimated ones (negative)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RateLimiter:
+    """Limits requests and tokens per minute. A limit of 0 disables it."""
+
+    def __init__(
+        self, requests_per_minute: float = 0, tokens_per_minute: float = 0
+    ) -> None:
+        self.requests = (
+            TokenBucket(requests_per_minute) if requests_per_minute else None
+        )
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens: int, deadline: Optional[float] = None) -> bool:
+        if self.requests is not None and not self.requests.acquire(1, deadline):
+            return False
+        if self.tokens is not None and not self.tokens.acquire(tokens, deadline):
+            if self.requests is not None:
+                self.requests.adjust(1)
+            return False
+        return True
+
+    def settle(self, estimated_tokens: int, used_tokens: int) -> None:
+        """Corrects the token bucket with the usage reported by the API."""
+        if self.tokens is not None:
+            self.tokens.adjust(estimated_tokens - used_tokens)
+
+
+class QwenClient:
+    """
+    Client for OpenAI compatible chat completion endpoints, DashScope compatible-mode by default.
+
+    Args:
+        api_key: The API key, defaults to QWEN_API_KEY at the time of each call
+        base_url: Base URL of the endpoint
+        requests_per_minute: Client side limit of requests per minute, 0 for no limit
+        tokens_per_minute: Client side limit of (estimated) prompt plus completion tokens per minute, 0 for no limit
+        max_retries: Retries of a call that failed with a retryable status or a connection error
+        backoff_base: Backoff before the first retry in seconds, doubled for every further retry and jittered
+        backoff_max: Upper bound of the backoff in seconds
+        deadline: Time in seconds a call may take in total, including rate limiting and retries
+        pool_size: Number of connections to keep open, which should be at least the number of concurrent calls
+    """
+
+    def __init__(
+        self,
+        api_key: str = "",
+        base_url: str = QWEN_API_BASE_URL,
+        requests_per_minute: float = 0,
+        tokens_per_minute: float = 0,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        deadline: float = 120.0,
+        pool_size: int = 16,
+    ) -> None:
+        self._api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.deadline = deadline
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    @property
+    def api_key(self) -> str:
+        return self._api_key or QWEN_API_KEY
+
+    def close(self) -> None:
+        self.session.close()
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response]) -> float:
+        """Full jitter exponential backoff, but at least as long as the Retry-After header asks for."""
+        backoff = random.uniform(
+            0, min(self.backoff_max, self.backoff_base * 2**attempt)
+        )
+        # Response is falsy for error statuses, so compare with None.
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after:
+            try:
+                backoff = max(backoff, float(retry_after))
+            except ValueError:
+                pass
+        return backoff
+
+    def _post(
+        self,
+        payload: Dict[str, Any],
+        base_url: str = "",
+        headers: Optional[Dict[str, str]] = None,
+        deadline: Optional[float] = None,
+        stream: bool = False,
+    ) -> requests.Response:
+        """
+        Posts a chat completion request, waiting for the rate limiter and retrying retryable failures until the
+        deadline (seconds from now, defaults to the client deadline). Raises QwenAPIError if the call fails.
+        """
+        if headers is None:
+            if not self.api_key:
+                raise QwenAPIError(
+                    "QWEN_API_KEY not set. Please set the environment variable or call set_qwen_api_key()"
+                )
+            headers = {"Authorization": f"Bearer {self.api_key}"}
+        headers = {**headers, "Content-Type": "application/json"}
+        if stream:
+            headers["Accept"] = "text/event-stream"
+        url = f"{(base_url or self.base_url).rstrip('/')}/chat/completions"
+        end = time.monotonic() + (deadline or self.deadline)
+        estimated_tokens = _estimated_tokens(payload)
+
+        for attempt in range(self.max_retries + 1):
+            if not self.limiter.acquire(estimated_tokens, end):
+                raise QwenAPIError("Rate limit wait exceeds the deadline of the call")
+            response = None
+            error = ""
+            try:
+                response = self.session.post(
+                    url,
+                    headers=headers,
+                    json=payload,
+                    timeout=max(end - time.monotonic(), 0.1),
+                    stream=stream,
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = f"HTTP {response.status_code}"
+                response.close()
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+            ) as e:
+                error = str(e)
+            except requests.exceptions.RequestException as e:
+                status_code = response.status_code if response is not None else None
+                raise QwenAPIError(f"Qwen API request failed: {e}", status_code) from e
+
+            if attempt == self.max_retries:
+                break
+            backoff = self._backoff(attempt, response)
+            if time.monotonic() + backoff >= end:
+                break
+            logger.warning(
+                f"Qwen API request failed ({error}), retrying in {backoff:.1f}s"
+            )
+            time.sleep(backoff)
+
+        raise QwenAPIError(
+            f"Qwen API request failed after {attempt + 1} attempts: {error}",
+            response.status_code if response is not None else None,
+        )
+
+    def complete(
+        self,
+        prompt: str,
+        model: str = QWEN_DEFAULT_MODEL,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        Returns the completion of the prompt. Raises QwenAPIError if the call fails or runs past the deadline
+        (seconds, defaults to the client deadline).
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+        }
+        try:
+            result = self._post(payload, deadline=deadline).json()
+        except json.JSONDecodeError as e:
+            raise QwenAPIError(f"Failed to parse Qwen API response: {e}") from e
+        usage = result.get("usage") or {}
+        if "total_tokens" in usage:
+            self.limiter.settle(_estimated_tokens(payload), usage["total_tokens"])
+        if "choices" in result and len(result["choices"]) > 0:
+            return result["choices"][0]["message"]["content"]  # type: ignore[no-any-return]
+        raise QwenAPIError(f"Unexpected Qwen API response format: {result}")
+
+    def complete_stream(
+        self,
+        prompt: str,
+        model: str = QWEN_DEFAULT_MODEL,
+        max_tokens: int = 1024,
+        temperature: float = 0.7,
+        base_url: str = "",
+        headers: Optional[Dict[str, str]] = None,
+        deadline: Optional[float] = None,
+    ) -> Iterator[str]:
+        """
+        Streams the completion of the prompt, see qwen_complete_stream. The deadline applies until the response
+        starts, and then bounds the wait for each further chunk.
+        """
+        payload = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": True,
+        }
+        if not model:
+            del payload["model"]
+        with self._post(payload, base_url, headers, deadline, stream=True) as response:
+            # Event streams are UTF-8, but requests defaults to ISO-8859-1 for text/* without a charset.
+            response.encoding = "utf-8"
+            yield from _sse_content(response.iter_lines(decode_unicode=True))
+
+
+_default_client: Optional[QwenClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_qwen_client() -> QwenClient:
+    """Returns the client shared by the module level functions, limited by QWEN_REQUESTS/TOKENS_PER_MINUTE."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = QwenClient(
+                requests_per_minute=QWEN_REQUESTS_PER_MINUTE,
+                tokens_per_minute=QWEN_TOKENS_PER_MINUTE,
+            )
+        return _default_client
+
+
 def qwen_complete(
     prompt: str,
     model: str = QWEN_DEFAULT_MODEL,
     max_tokens: int = 1024,
     temperature: float = 0.7,
+    deadline: Optional[float] = None,
 ) -> Optional[str]:
     """
     Call Qwen API to generate text completion.
@@ -39,6 +363,7 @@ def qwen_complete(
         model: The Qwen model to use (qwen-turbo, qwen-plus, qwen-max)
         max_tokens: Maximum tokens in the response
         temperature: Sampling temperature (0-1)
+        deadline: Time in seconds the call may take including retries, defaults to the client deadline
     
     Returns:
         The generated text response, or None if the call fails
@@ -46,45 +371,118 @@ def qwen_complete(
     if not QWEN_API_KEY:
         logger.warning("QWEN_API_KEY not set. Please set the environment variable or call set_qwen_api_key()")
         return None
-    
-    headers = {
-        "Authorization": f"Bearer {QWEN_API_KEY}",
-        "Content-Type": "application/json",
-    }
-    
-    payload = {
-        "model": model,
-        "messages": [
-            {"role": "user", "content": prompt}
-        ],
-        "max_tokens": max_tokens,
-        "temperature": temperature,
-    }
-    
+
     try:
-        response = requests.post(
-            f"{QWEN_API_BASE_URL}/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60,
+        return get_qwen_client().complete(
+            prompt, model, max_tokens, temperature, deadline
         )
-        response.raise_for_status()
-        
-        result = response.json()
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        else:
-            logger.warning(f"Unexpected Qwen API response format: {result}")
-            return None
-            
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Qwen API request failed: {e}")
-        return None
-    except json.JSONDecodeError as e:
-        logger.error(f"Failed to parse Qwen API response: {e}")
+    except QwenAPIError as e:
+        logger.error(str(e))
         return None
 
 
+@dataclass
+class CompletionResult:
+    """Outcome of one prompt of qwen_complete_many: the completion, or the error if it failed."""
+
+    text: Optional[str] = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def qwen_complete_many_async(
+    prompts: Sequence[str],
+    model: str = QWEN_DEFAULT_MODEL,
+    concurrency: int = 8,
+    max_tokens: int = 1024,
+    temperature: float = 0.7,
+    deadline: Optional[float] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    client: Optional[QwenClient] = None,
+) -> List[CompletionResult]:
+    """
+    Completes the prompts with up to concurrency calls in flight, see qwen_complete_many.
+    The calls run on a thread pool over the pooled connections of the client, so that they share its rate limiter
+    with all other calls of the process.
+    """
+    client = client or get_qwen_client()
+    total = len(prompts)
+    results: List[CompletionResult] = [CompletionResult() for _ in prompts]
+    if not total:
+        return results
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    done = 0
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def complete(i: int) -> None:
+            nonlocal done
+            async with semaphore:
+                try:
+                    results[i].text = await loop.run_in_executor(
+                        executor,
+                        client.complete,
+                        prompts[i],
+                        model,
+                        max_tokens,
+                        temperature,
+                        deadline,
+                    )
+                except Exception as e:
+                    results[i].error = str(e)
+            done += 1
+            if on_progress is not None:
+                on_progress(done, total)
+
+        await asyncio.gather(*(complete(i) for i in range(total)))
+    return results
+
+
+def qwen_complete_many(
+    prompts: Sequence[str],
+    model: str = QWEN_DEFAULT_MODEL,
+    concurrency: int = 8,
+    max_tokens: int = 1024,
+    temperature: float = 0.7,
+    deadline: Optional[float] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    client: Optional[QwenClient] = None,
+) -> List[CompletionResult]:
+    """
+    Completes many prompts concurrently.
+
+    Args:
+        prompts: The input prompts
+        model: The Qwen model to use
+        concurrency: Maximum number of calls in flight, the client rate limits still apply on top
+        max_tokens: Maximum tokens in each response
+        temperature: Sampling temperature (0-1)
+        deadline: Time in seconds each call may take including retries, defaults to the client deadline
+        on_progress: Called with (completed, total) after each prompt finishes, successfully or not
+        client: The client to use, defaults to the shared client of get_qwen_client()
+
+    Returns:
+        One CompletionResult per prompt, in the order of the prompts. A failed prompt does not fail the batch.
+        Use qwen_complete_many_async instead when an event loop is already running.
+    """
+    return asyncio.run(
+        qwen_complete_many_async(
+            prompts,
+            model,
+            concurrency,
+            max_tokens,
+            temperature,
+            deadline,
+            on_progress,
+            client,
+        )
+    )
+
+
 def qwen_complete_for_snowflake(
     prompt: str,
     model: str = QWEN_DEFAULT_MODEL,
@@ -104,8 +502,68 @@ def qwen_complete_for_snowflake(
     return result if result else ""
 
 
-# SQL UDF for Snowflake that calls external Qwen API
-QWEN_UDF_SQL = """
+def spcs_auth_headers(token: str = "") -> Dict[str, str]:
+    """Returns the headers to authenticate against an SPCS public endpoint with a Snowflake session token."""
+    token = token or SPCS_AUTH_TOKEN
+    return {"Authorization": f'Snowflake Token="{token}"'} if token else {}
+
+
+def _sse_content(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Yields the content deltas of an OpenAI compatible chat completion event stream, until the [DONE] event.
+    """
+    for line in lines:
+        if not line or not line.startswith("data:"):
+            continue
+        data = line[len("data:") :].strip()
+        if data == "[DONE]":
+            return
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            logger.warning(f"Skipping malformed stream event: {data[:200]}")
+            continue
+        choices = event.get("choices") or []
+        if choices:
+            content = (choices[0].get("delta") or {}).get("content")
+            if content:
+                yield content
+
+
+def qwen_complete_stream(
+    prompt: str,
+    model: str = QWEN_DEFAULT_MODEL,
+    max_tokens: int = 1024,
+    temperature: float = 0.7,
+    base_url: str = "",
+    headers: Optional[Dict[str, str]] = None,
+    timeout: float = 60,
+) -> Iterator[str]:
+    """
+    Streams a completion from an OpenAI compatible chat completions endpoint, yielding text chunks as they arrive.
+    Works with DashScope compatible-mode (the default) and with the SPCS model service.
+
+    Args:
+        prompt: The input prompt for the model
+        model: The model to use, leave empty to let the SPCS proxy use its deployed model
+        max_tokens: Maximum tokens in the response
+        temperature: Sampling temperature (0-1)
+        base_url: Base URL of the endpoint, defaults to QWEN_API_BASE_URL
+        headers: Authentication headers, default to the QWEN_API_KEY bearer token
+        timeout: Time in seconds until the response starts, including retries, and then for each further chunk
+
+    Raises:
+        QwenAPIError if no headers are given and QWEN_API_KEY is not set, or the request fails.
+        requests.exceptions.RequestException if the stream breaks off. Since chunks were already yielded by then,
+        callers should only fall back to a blocking call if nothing was received.
+    """
+    return get_qwen_client().complete_stream(
+        prompt, model, max_tokens, temperature, base_url, headers, timeout
+    )
+
+
+# SQL to set up external access to the Qwen API, as a str.format template with an {api_key} field.
+_QWEN_UDF_SETUP_SQL = """
 -- Create network rule for Qwen API access
 CREATE OR REPLACE NETWORK RULE qwen_api_rule
     MODE = EGRESS
@@ -122,131 +580,153 @@ CREATE OR REPLACE EXTERNAL ACCESS INTEGRATION qwen_api_integration
     ALLOWED_NETWORK_RULES = (qwen_api_rule)
     ALLOWED_AUTHENTICATION_SECRETS = (qwen_api_secret)
     ENABLED = TRUE;
+"""
+
+# Code shared by the scalar and the vectorized UDF handler. The session is created once per UDF process, so that
+# connections are reused across rows and batches, and retryable failures are retried with jittered backoff.
+_QWEN_UDF_COMMON_CODE = """
+import random
+import time
 
--- Create Python UDF that calls Qwen API
-CREATE OR REPLACE FUNCTION QWEN_COMPLETE(model VARCHAR, prompt VARCHAR)
-RETURNS VARCHAR
-LANGUAGE PYTHON
-RUNTIME_VERSION = '3.10'
-PACKAGES = ('requests')
-HANDLER = 'qwen_complete'
-EXTERNAL_ACCESS_INTEGRATIONS = (qwen_api_integration)
-SECRETS = ('api_key' = qwen_api_secret)
-AS $$
-import requests
-import json
 import _snowflake
+import requests
+from requests.adapters import HTTPAdapter
 
-def qwen_complete(model: str, prompt: str) -> str:
-    api_key = _snowflake.get_generic_secret_string('api_key')
-    
-    headers = {{
-        "Authorization": f"Bearer {{api_key}}",
+API_URL = "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions"
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_maxsize=MAX_CONCURRENCY))
+
+
+def _complete(api_key: str, model: str, prompt: str) -> str:
+    headers = {
+        "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json",
-    }}
+    }
     
-    payload = {{
+    payload = {
         "model": model,
-        "messages": [{{"role": "user", "content": prompt}}],
+        "messages": [{"role": "user", "content": prompt}],
         "max_tokens": 1024,
         "temperature": 0.7,
-    }}
+    }
     
-    try:
-        response = requests.post(
-            "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60,
-        )
-        response.raise_for_status()
-        result = response.json()
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        return ""
-    except Exception as e:
-        return f"Error: {{str(e)}}"
-$$;
+    error = ""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            response = _session.post(API_URL, headers=headers, json=payload, timeout=60)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                result = response.json()
+                if "choices" in result and len(result["choices"]) > 0:
+                    return result["choices"][0]["message"]["content"]
+                return ""
+            error = f"HTTP {response.status_code}"
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            error = str(e)
+        except Exception as e:
+            return f"Error: {str(e)}"
+        if attempt < MAX_RETRIES:
+            time.sleep(random.uniform(0, min(20, 0.5 * 2 ** attempt)))
+    return f"Error: {error}"
 """
 
+_QWEN_UDF_SCALAR_HANDLER = """
 
-def get_qwen_udf_sql(api_key: str, database: str = "CORTEX_ANALYST_SEMANTICS", schema: str = "SEMANTIC_MODEL_GENERATOR") -> str:
-    """
-    Generate SQL statements to create Qwen UDF in Snowflake.
-    
-    Args:
-        api_key: The Qwen API key
-        database: Target database name
-        schema: Target schema name
-    
-    Returns:
-        SQL statements as a string
-    """
-    sql = f"""
-USE DATABASE {database};
-USE SCHEMA {schema};
+def qwen_complete(model: str, prompt: str) -> str:
+    return _complete(_snowflake.get_generic_secret_string('api_key'), model, prompt)
+"""
 
--- Create network rule for Qwen API access
-CREATE OR REPLACE NETWORK RULE qwen_api_rule
-    MODE = EGRESS
-    TYPE = HOST_PORT
-    VALUE_LIST = ('dashscope.aliyuncs.com:443');
+# Snowflake passes the rows of a vectorized UDF in batches as a DataFrame with one column per argument.
+_QWEN_UDF_VECTORIZED_HANDLER = """
 
--- Create secret for Qwen API key
-CREATE OR REPLACE SECRET qwen_api_secret
-    TYPE = GENERIC_STRING
-    SECRET_STRING = '{api_key}';
+from concurrent.futures import ThreadPoolExecutor
 
--- Create external access integration
-CREATE OR REPLACE EXTERNAL ACCESS INTEGRATION qwen_api_integration
-    ALLOWED_NETWORK_RULES = (qwen_api_rule)
-    ALLOWED_AUTHENTICATION_SECRETS = (qwen_api_secret)
-    ENABLED = TRUE;
+import pandas
+from _snowflake import vectorized
 
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+
+
+@vectorized(input=pandas.DataFrame, max_batch_size=MAX_BATCH_SIZE)
+def qwen_complete(df: pandas.DataFrame) -> pandas.Series:
+    api_key = _snowflake.get_generic_secret_string('api_key')
+    return pandas.Series(
+        list(_executor.map(lambda row: _complete(api_key, *row), zip(df[0], df[1])))
+    )
+"""
+
+
+def _qwen_udf_function_sql(
+    vectorized: bool = False,
+    max_concurrency: int = 8,
+    max_batch_size: int = 100,
+    max_retries: int = 4,
+) -> str:
+    """Returns the CREATE FUNCTION statement of the QWEN_COMPLETE UDF."""
+    packages = "'requests', 'pandas'" if vectorized else "'requests'"
+    handler = _QWEN_UDF_VECTORIZED_HANDLER if vectorized else _QWEN_UDF_SCALAR_HANDLER
+    config = (
+        f"MAX_CONCURRENCY = {int(max_concurrency)}\n"
+        f"MAX_BATCH_SIZE = {int(max_batch_size)}\n"
+        f"MAX_RETRIES = {int(max_retries)}\n"
+    )
+    return f"""
 -- Create Python UDF that calls Qwen API
 CREATE OR REPLACE FUNCTION QWEN_COMPLETE(model VARCHAR, prompt VARCHAR)
 RETURNS VARCHAR
 LANGUAGE PYTHON
 RUNTIME_VERSION = '3.10'
-PACKAGES = ('requests')
+PACKAGES = ({packages})
 HANDLER = 'qwen_complete'
 EXTERNAL_ACCESS_INTEGRATIONS = (qwen_api_integration)
 SECRETS = ('api_key' = qwen_api_secret)
 AS $$
-import requests
-import json
-import _snowflake
+{config}{_QWEN_UDF_COMMON_CODE}{handler}$$;
+"""
 
-def qwen_complete(model: str, prompt: str) -> str:
-    api_key = _snowflake.get_generic_secret_string('api_key')
-    
-    headers = {{
-        "Authorization": f"Bearer {{api_key}}",
-        "Content-Type": "application/json",
-    }}
+
+# SQL UDF for Snowflake that calls external Qwen API, as a str.format template with an {api_key} field.
+QWEN_UDF_SQL = _QWEN_UDF_SETUP_SQL + _qwen_udf_function_sql().replace(
+    "{", "{{"
+).replace("}", "}}")
+
+
+def get_qwen_udf_sql(
+    api_key: str,
+    database: str = "CORTEX_ANALYST_SEMANTICS",
+    schema: str = "SEMANTIC_MODEL_GENERATOR",
+    vectorized: bool = False,
+    max_concurrency: int = 8,
+    max_batch_size: int = 100,
+    max_retries: int = 4,
+) -> str:
+    """
+    Generate SQL statements to create Qwen UDF in Snowflake.
     
-    payload = {{
-        "model": model,
-        "messages": [{{"role": "user", "content": prompt}}],
-        "max_tokens": 1024,
-        "temperature": 0.7,
-    }}
+    Args:
+        api_key: The Qwen API key
+        database: Target database name
+        schema: Target schema name
+        vectorized: Create a vectorized UDF, which receives rows in batches and calls the API for the rows of a
+            batch concurrently, instead of a scalar UDF that calls it one row at a time. Use it for set based
+            queries like SELECT QWEN_COMPLETE(model, prompt) FROM table.
+        max_concurrency: Maximum concurrent API calls per UDF process of the vectorized UDF. Snowflake runs several
+            processes per warehouse node, so keep the total below the rate limit of the API key.
+        max_batch_size: Maximum number of rows per batch of the vectorized UDF
+        max_retries: Retries of an API call that was rate limited or failed with a server or connection error
     
-    try:
-        response = requests.post(
-            "https://dashscope.aliyuncs.com/compatible-mode/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60,
-        )
-        response.raise_for_status()
-        result = response.json()
-        if "choices" in result and len(result["choices"]) > 0:
-            return result["choices"][0]["message"]["content"]
-        return ""
-    except Exception as e:
-        return f"Error: {{str(e)}}"
-$$;
+    Returns:
+        SQL statements as a string
+    """
+    return (
+        f"""
+USE DATABASE {database};
+USE SCHEMA {schema};
 """
-    return sql
-
+        + _QWEN_UDF_SETUP_SQL.format(api_key=api_key)
+        + _qwen_udf_function_sql(
+            vectorized, max_concurrency, max_batch_size, max_retries
+        )
+    )
@@ -1,8 +1,19 @@
 import concurrent.futures
 import os
+import time
 from collections import defaultdict
 from contextlib import contextmanager
-from typing import Any, Dict, Generator, List, Optional, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
 import pandas as pd
 from loguru import logger
@@ -533,12 +544,53 @@ def get_table_hash(conn: SnowflakeConnection, table_fqn: str) -> str:
     return query_result["TABLE_HASH"].item()  # type: ignore[no-any-return]
 
 
-def execute_query(conn: SnowflakeConnection, query: str) -> Union[pd.DataFrame, str]:
+def fetch_table_fingerprints(
+    conn: SnowflakeConnection, table_fqns: List[str]
+) -> Dict[str, str]:
+    """
+    Returns {DB.SCHEMA.TABLE: fingerprint} of the given base tables, a string of their last change time, row count
+    and size from the information schema, which changes with every DML or DDL on the table. This only reads metadata,
+    with one query per database, unlike get_table_hash which scans the table.
+    Views and tables that do not exist or cannot be read are left out, since their changes cannot be tracked.
+    """
+    by_database: Dict[str, List[str]] = defaultdict(list)
+    for fqn in table_fqns:
+        database, schema_and_table = fqn.split(".", 1)
+        by_database[database].append(schema_and_table)
+
+    fingerprints: Dict[str, str] = {}
+    for database, names in by_database.items():
+        quoted_database = '"' + database.replace('"', '""') + '"'
+        placeholders = ", ".join(["%s"] * len(names))
+        query = f"""SELECT TABLE_SCHEMA, TABLE_NAME, LAST_ALTERED, ROW_COUNT, BYTES
+FROM {quoted_database}.INFORMATION_SCHEMA.TABLES
+WHERE TABLE_TYPE = 'BASE TABLE' AND TABLE_SCHEMA || '.' || TABLE_NAME IN ({placeholders})"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, names)
+            rows = cursor.fetchall()
+        except Exception as e:
+            logger.info(f"Unable to fetch table fingerprints in {database}: {e}")
+            continue
+        for schema, table, last_altered, row_count, size in rows:
+            fingerprints[f"{database}.{schema}.{table}"] = (
+                f"{last_altered}|{row_count}|{size}"
+            )
+    return fingerprints
+
+
+def execute_query(
+    conn: SnowflakeConnection, query: str, timeout: Optional[int] = None
+) -> Union[pd.DataFrame, str]:
+    """
+    Runs the query and returns its result, or the error message if it fails. Queries still running after timeout
+    seconds, if given, are cancelled.
+    """
     try:
         if query == "":
             raise ValueError("Query string is empty")
         cursor = conn.cursor()
-        cursor.execute(query)
+        cursor.execute(query, timeout=timeout)
         query_result = cursor.fetch_pandas_all()
         return query_result
     except Exception as e:
@@ -546,6 +598,83 @@ def execute_query(conn: SnowflakeConnection, query: str) -> Union[pd.DataFrame,
         return str(e)
 
 
+def _cancel_query(conn: SnowflakeConnection, query_id: str) -> None:
+    try:
+        conn.cursor().execute(f"SELECT SYSTEM$CANCEL_QUERY('{query_id}')")
+    except Exception as e:
+        logger.warning(f"Unable to cancel query {query_id}: {e}")
+
+
+def execute_queries_async(
+    conn: SnowflakeConnection,
+    queries: List[str],
+    timeout: float = 300,
+    max_poll_interval: float = 2.0,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    on_result: Optional[Callable[[int, float], None]] = None,
+) -> List[Union[pd.DataFrame, str]]:
+    """
+    Runs the queries concurrently in the warehouse and returns their results like execute_query, in input order.
+
+    All queries are submitted up front with async execution, then polled until they finish, fetching each result
+    (as Arrow) as soon as its query completes. Queries still running timeout seconds after their submission are
+    cancelled and get an error instead. The polling interval backs off up to max_poll_interval.
+    on_progress(done, total) is called from the calling thread after each query finishes, and on_result(i, seconds)
+    with the seconds from the submission of each submitted query to its result (or error).
+    """
+    results: List[Union[pd.DataFrame, str, None]] = [None] * len(queries)
+    # Query ID to (index of the query, submission time).
+    pending: Dict[str, Tuple[int, float]] = {}
+    done = 0
+
+    def _finish(i: int, result: Union[pd.DataFrame, str]) -> None:
+        nonlocal done
+        results[i] = result
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(queries))
+
+    for i, query in enumerate(queries):
+        if query == "":
+            _finish(i, "Query string is empty")
+            continue
+        try:
+            cursor = conn.cursor()
+            cursor.execute_async(query)
+            pending[cursor.sfqid] = (i, time.monotonic())
+        except Exception as e:
+            logger.info(f"Query submission failed: {e}")
+            _finish(i, str(e))
+
+    poll_interval = 0.1
+    while pending:
+        for query_id, (i, submitted_at) in list(pending.items()):
+            try:
+                status = conn.get_query_status_throw_if_error(query_id)
+                if conn.is_still_running(status):
+                    if time.monotonic() - submitted_at < timeout:
+                        continue
+                    _cancel_query(conn, query_id)
+                    result: Union[pd.DataFrame, str] = (
+                        f"Query {query_id} was cancelled after {timeout:g} seconds"
+                    )
+                else:
+                    cursor = conn.cursor()
+                    cursor.get_results_from_sfqid(query_id)
+                    result = cursor.fetch_pandas_all()
+            except Exception as e:
+                logger.info(f"Query execution failed: {e}")
+                result = str(e)
+            del pending[query_id]
+            if on_result is not None:
+                on_result(i, time.monotonic() - submitted_at)
+            _finish(i, result)
+        if pending:
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+    return results  # type: ignore[return-value]
+
+
 class SnowflakeConnector:
     def __init__(
         self,
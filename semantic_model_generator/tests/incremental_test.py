@@ -0,0 +1,51 @@
+from semantic_model_generator.data_processing.proto_utils import yaml_to_semantic_model
+from semantic_model_generator.validate.incremental import IncrementalValidator
+
+_MODEL_YAML = """name: 销售模型
+description: yes
+tables:
+  - name: orders
+    base_table:
+      database: DB
+      schema: S
+      table: ORDERS
+    # Unquoted scalars that PyYAML would turn into booleans and numbers.
+    dimensions:
+      - name: flag
+        expr: FLAG
+        data_type: VARCHAR
+        sample_values: [yes, "no", 007, 1.50]
+      - name: code
+        expr: CODE
+        data_type: VARCHAR
+        sample_values:
+          - 01234
+          - on
+  - {name: items, base_table: {database: DB, schema: S, table: ITEMS}, dimensions: [{name: sku, expr: SKU, data_type: VARCHAR, sample_values: [0x1F, 1e3]}]}
+verified_queries:
+  - name: q
+    question: 007 orders?
+    sql: SELECT 1
+"""
+
+
+def test_validate_keeps_scalars_as_written() -> None:
+    model = IncrementalValidator().validate(_MODEL_YAML)
+
+    orders = model.tables[0]
+    assert list(orders.dimensions[0].sample_values) == ["yes", "no", "007", "1.50"]
+    assert list(orders.dimensions[1].sample_values) == ["01234", "on"]
+    assert list(model.tables[1].dimensions[0].sample_values) == ["0x1F", "1e3"]
+    assert model.description == "yes"
+    assert model == yaml_to_semantic_model(_MODEL_YAML)
+
+
+def test_validate_revalidates_scalar_edits() -> None:
+    validator = IncrementalValidator()
+    validator.validate(_MODEL_YAML)
+
+    model = validator.validate(_MODEL_YAML.replace("007, 1.50", "7, 1.50"))
+
+    assert validator.changes == ["table orders"]
+    flag = model.tables[0].dimensions[0]
+    assert list(flag.sample_values) == ["yes", "no", "7", "1.50"]
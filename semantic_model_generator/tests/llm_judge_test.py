@@ -0,0 +1,25 @@
+import pandas as pd
+
+from semantic_model_generator.data_processing.llm_judge import frame_digest, judge_key
+
+_QUESTION = "What are the sales by region?"
+
+
+def test_judge_key_ignores_row_order() -> None:
+    gold = pd.DataFrame({"REGION": ["east", "west"], "SALES": [100, 900]})
+    reordered = gold.iloc[::-1].reset_index(drop=True)
+
+    assert frame_digest(gold) == frame_digest(reordered)
+    assert judge_key(_QUESTION, gold, gold, "qwen-max") == judge_key(
+        _QUESTION, gold, reordered, "qwen-max"
+    )
+
+
+def test_judge_key_depends_on_row_pairing() -> None:
+    gold = pd.DataFrame({"REGION": ["east", "west"], "SALES": [100, 900]})
+    swapped = pd.DataFrame({"REGION": ["east", "west"], "SALES": [900, 100]})
+
+    assert frame_digest(gold) != frame_digest(swapped)
+    assert judge_key(_QUESTION, gold, gold, "qwen-max") != judge_key(
+        _QUESTION, gold, swapped, "qwen-max"
+    )
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from semantic_model_generator.data_processing.result_matching import match_results
+
+
+def test_match_results_tries_every_column_with_the_same_values() -> None:
+    gold = pd.DataFrame({"A": [1, 2, 3], "B": [2, 3, 1]})
+    result = pd.DataFrame({"X": [3, 2, 1], "Y": [2, 1, 3]})
+
+    match = match_results(result, gold)
+
+    assert match.matched
+    assert match.column_mapping == {"A": "Y", "B": "X"}
+    assert not match.same_order
+
+
+def test_match_results_needs_values_in_the_same_rows() -> None:
+    gold = pd.DataFrame({"A": [1, 2, 3], "B": [2, 3, 1]})
+    result = pd.DataFrame({"X": [1, 2, 3], "Y": [1, 3, 2]})
+
+    assert not match_results(result, gold).matched
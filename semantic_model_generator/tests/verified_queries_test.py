@@ -0,0 +1,35 @@
+from typing import List
+
+from semantic_model_generator.validate.verified_queries import (
+    CHECK_MODE_RUN,
+    _check_sql,
+)
+
+
+class _FakeCursor:
+    def __init__(self, executed: List[str]) -> None:
+        self._executed = executed
+
+    def execute(self, query: str) -> None:
+        self._executed.append(query)
+
+    def fetchall(self) -> list:
+        return []
+
+    def close(self) -> None:
+        pass
+
+
+class _FakeConnection:
+    def __init__(self) -> None:
+        self.executed: List[str] = []
+
+    def cursor(self) -> _FakeCursor:
+        return _FakeCursor(self.executed)
+
+
+def test_run_check_strips_trailing_semicolons() -> None:
+    conn = _FakeConnection()
+    _check_sql(conn, "SELECT 1 FROM t ; \n;\n", CHECK_MODE_RUN, 1)  # type: ignore[arg-type]
+
+    assert conn.executed == ["SELECT * FROM (SELECT 1 FROM t) LIMIT 1"]
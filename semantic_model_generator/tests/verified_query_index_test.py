@@ -0,0 +1,35 @@
+from semantic_model_generator.data_processing.verified_query_index import (
+    VerifiedQueryIndex,
+)
+
+_INDEX = VerifiedQueryIndex.from_dict(
+    {
+        "verified_queries": [
+            {
+                "name": "sales_by_product",
+                "question": "What are the total sales by product?",
+                "sql": "SELECT product, SUM(sales) FROM orders GROUP BY product",
+            },
+            {
+                "name": "sales_by_region",
+                "question": "各地区的总销售额是多少？",
+                "sql": "SELECT region, SUM(sales) FROM orders GROUP BY region",
+            },
+        ]
+    }
+)
+
+
+def test_match_requires_every_qualifier() -> None:
+    assert _INDEX.match("What are the total sales by product line?") is None
+    assert _INDEX.match("sales by product") is None
+
+    match = _INDEX.match("what is the total sales by products")
+    assert match is not None and match.name == "sales_by_product"
+
+
+def test_match_chinese_paraphrase() -> None:
+    match = _INDEX.match("各地区总销售额是多少")
+
+    assert match is not None and match.name == "sales_by_region"
+    assert _INDEX.match("各地区总销售额是多少 2024") is None
@@ -0,0 +1,105 @@
+# A catalog snapshot is a serialized copy of the table and column names/types that a semantic model refers to. It lets
+# us resolve and type-check the SQL in a semantic model with sqlglot without a live Snowflake connection. Snapshots are
+# keyed by the upper-cased fully qualified table name, e.g. MY_DB.MY_SCHEMA.MY_TABLE.
+
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional
+
+from snowflake.connector import SnowflakeConnection
+from sqlglot.schema import MappingSchema
+
+from semantic_model_generator.snowflake_utils.snowflake_connector import (
+    fetch_table_schema,
+)
+
+_SNAPSHOT_VERSION = 1
+
+
+def normalize_table_fqn(fqn: str) -> str:
+    """Returns the snapshot key for a fully qualified table name."""
+    return ".".join(part.strip().strip('"').upper() for part in fqn.split("."))
+
+
+@dataclass
+class CatalogSnapshot:
+    # Maps DB.SCHEMA.TABLE to an ordered {column name: snowflake data type} mapping.
+    tables: Dict[str, Dict[str, str]] = field(default_factory=dict)
+    created_at: int = field(default_factory=lambda: int(time.time()))
+
+    def has_table(self, fqn: str) -> bool:
+        return normalize_table_fqn(fqn) in self.tables
+
+    def columns(self, fqn: str) -> Dict[str, str]:
+        return self.tables.get(normalize_table_fqn(fqn), {})
+
+    def missing_tables(self, fqns: Iterable[str]) -> List[str]:
+        return sorted({normalize_table_fqn(f) for f in fqns if not self.has_table(f)})
+
+    def add_table(self, fqn: str, columns: Dict[str, str]) -> None:
+        self.tables[normalize_table_fqn(fqn)] = {
+            name.upper(): data_type for name, data_type in columns.items()
+        }
+
+    def to_sqlglot_schema(self) -> MappingSchema:
+        """Returns the snapshot as a nested db -> schema -> table -> columns sqlglot schema."""
+        nested: Dict[str, Dict[str, Dict[str, Dict[str, str]]]] = {}
+        for fqn, columns in self.tables.items():
+            database, schema, table = fqn.split(".")
+            nested.setdefault(database, {}).setdefault(schema, {})[table] = columns
+        return MappingSchema(nested, dialect="snowflake")
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {
+                "version": _SNAPSHOT_VERSION,
+                "created_at": self.created_at,
+                "tables": self.tables,
+            },
+            indent=2,
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_json(cls, json_str: str) -> "CatalogSnapshot":
+        data = json.loads(json_str)
+        if data.get("version") != _SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Unsupported catalog snapshot version: {data.get('version')}"
+            )
+        snapshot = cls(created_at=int(data.get("created_at", 0)))
+        for fqn, columns in data.get("tables", {}).items():
+            snapshot.add_table(fqn, columns)
+        return snapshot
+
+    def save(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+
+    @classmethod
+    def load(cls, path: str) -> "CatalogSnapshot":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_json(f.read())
+
+
+def fetch_catalog_snapshot(
+    conn: SnowflakeConnection,
+    table_fqns: Iterable[str],
+    snapshot: Optional[CatalogSnapshot] = None,
+) -> CatalogSnapshot:
+    """
+    Fetches the column names and types of the given tables into a catalog snapshot.
+    If an existing snapshot is passed in, only the tables missing from it are fetched.
+
+    Args:
+        conn: SnowflakeConnection to run the DESCRIBE queries.
+        table_fqns: fully qualified names of the tables to include.
+        snapshot: optional snapshot to extend in place.
+
+    Returns: the (extended) catalog snapshot.
+    """
+    snapshot = snapshot or CatalogSnapshot()
+    for fqn in snapshot.missing_tables(table_fqns):
+        snapshot.add_table(fqn, fetch_table_schema(conn, fqn))
+    return snapshot
@@ -53,6 +53,27 @@ def _count_search_services(model: ProtoMsg) -> int:
     return cnt
 
 
+def prompt_token_budget(num_search_services: int) -> int:
+    """Returns the number of tokens available for the semantic model in the prompt."""
+    literals_buffer = (
+        _TOKENS_PER_LITERAL * _NUM_LITERAL_RETRIEVALS * (1 + num_search_services)
+    )
+    approx_instruction_length = _BASE_INSTRUCTION_TOKEN_LENGTH + literals_buffer
+    return _TOTAL_PROMPT_TOKEN_LIMIT - approx_instruction_length
+
+
+def table_token_count(table_orig: semantic_model_pb2.Table) -> int:
+    """
+    Approximate number of prompt tokens a single table adds to the semantic model, counted the same way as
+    validate_context_length so that per-table counts can be summed and cached.
+    """
+    table = semantic_model_pb2.Table()
+    table.CopyFrom(table_orig)
+    for dim in table.dimensions:
+        del dim.sample_values[_MAX_SAMPLE_VALUES:]
+    return len(proto_to_yaml(table)) // _CHARS_PER_TOKEN
+
+
 def validate_context_length(
     model_orig: semantic_model_pb2.SemanticModel, throw_error: bool = False
 ) -> None:
@@ -75,11 +96,7 @@ def validate_context_length(
     yaml_str = proto_to_yaml(model)
     # Pass in the str version of the semantic context yaml.
     # This isn't exactly how many tokens the model will be, but should roughly be correct.
-    literals_buffer = (
-        _TOKENS_PER_LITERAL * _NUM_LITERAL_RETRIEVALS * (1 + num_search_services)
-    )
-    approx_instruction_length = _BASE_INSTRUCTION_TOKEN_LENGTH + literals_buffer
-    model_tokens_limit = _TOTAL_PROMPT_TOKEN_LIMIT - approx_instruction_length
+    model_tokens_limit = prompt_token_budget(num_search_services)
     model_tokens = len(yaml_str) // _CHARS_PER_TOKEN
     if model_tokens > model_tokens_limit:
         tokens_to_remove = model_tokens - model_tokens_limit
@@ -0,0 +1,365 @@
+# Incremental validation re-validates only the parts of a semantic model that changed since the last run. The model is
+# split into its tables, relationships and verified queries, and each entry is fingerprinted by its content plus the
+# content of everything it depends on (e.g. a relationship depends on its left and right tables, a verified query on
+# the logical tables it reads from). Results for unchanged fingerprints are reused from the previous run.
+#
+# Entries are parsed with strictyaml from their own slice of the original text, so that scalars get exactly the same
+# coercions as in yaml_to_semantic_model (e.g. sample values yes, 007 and 1.50 stay the strings "yes", "007" and
+# "1.50"), which a round trip through PyYAML would change.
+
+import hashlib
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+from google.protobuf import json_format
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+from sqlglot.schema import MappingSchema
+from strictyaml import dirty_load
+
+from semantic_model_generator.data_processing.cte_utils import (
+    context_to_column_format,
+    fully_qualified_table_name,
+    logical_table_name,
+)
+from semantic_model_generator.protos import semantic_model_pb2
+from semantic_model_generator.validate.catalog import CatalogSnapshot
+from semantic_model_generator.validate.context_length import (
+    _count_search_services,
+    prompt_token_budget,
+    table_token_count,
+)
+from semantic_model_generator.validate.schema import (
+    RELATIONSHIP_SCHEMA,
+    SCHEMA,
+    TABLE_SCHEMA,
+    VERIFIED_QUERY_SCHEMA,
+)
+from semantic_model_generator.validate_model import (
+    validate_model_dict,
+    validate_table_exists,
+    validate_table_against_catalog,
+    validate_verified_query_against_catalog,
+)
+
+try:
+    _Loader: Any = yaml.CSafeLoader
+except AttributeError:
+    _Loader = yaml.SafeLoader
+
+_SECTIONS = ("tables", "relationships", "verified_queries")
+
+
+def _fingerprint(data: Any) -> str:
+    return hashlib.sha1(
+        json.dumps(data, sort_keys=True, default=str, ensure_ascii=False).encode()
+    ).hexdigest()
+
+
+def _node_text(yaml_str: str, node: yaml.Node) -> str:
+    """Returns the text of a node of yaml_str as a yaml document of its own."""
+    text = yaml_str[node.start_mark.index : node.end_mark.index]
+    if not isinstance(node, yaml.CollectionNode) or node.flow_style:
+        return text
+    # The first line of a block entry starts after its indentation (e.g. after "  - "), and the following lines are
+    # indented by at least as much, except for comments.
+    indent = node.start_mark.column
+    lines = text.split("\n")
+    return "\n".join(
+        lines[:1]
+        + [
+            line[indent:] if not line[:indent].strip() else line.lstrip()
+            for line in lines[1:]
+        ]
+    )
+
+
+def _parse_entry(text: str, schema: Any, label: str, msg: Any) -> Any:
+    # Entries are parsed from the original text with strictyaml, so that they get the exact same checks and type
+    # coercions as the full model in yaml_to_semantic_model.
+    parsed = dirty_load(text, schema, label=label, allow_flow_style=True)
+    return json_format.ParseDict(parsed.data, msg)
+
+
+@dataclass
+class _TableResult:
+    table: Optional[semantic_model_pb2.Table]
+    errors: List[str]
+    tokens: int = 0
+
+
+@dataclass
+class _EntryResult:
+    message: Any
+    errors: List[str]
+
+
+@dataclass
+class IncrementalValidator:
+    """
+    Validates semantic model YAML while caching per-table, per-relationship and per-verified-query results between
+    calls, so that editing one entry of a large model only re-validates that entry and the entries depending on it.
+
+    Base tables are resolved against the catalog snapshot when one is set, and otherwise checked for existence with
+    the connection. If neither is set, only the structure of the model is validated.
+    """
+
+    catalog: Optional[CatalogSnapshot] = None
+    conn: Optional[SnowflakeConnection] = None
+    # Human readable descriptions of the entries re-validated by the last call to validate().
+    changes: List[str] = field(default_factory=list)
+    _tables: Dict[Tuple[str, str], _TableResult] = field(default_factory=dict)
+    _relationships: Dict[Tuple[str, ...], _EntryResult] = field(default_factory=dict)
+    _verified_queries: Dict[Tuple[str, ...], _EntryResult] = field(
+        default_factory=dict
+    )
+    _schema: Optional[MappingSchema] = None
+    _schema_key: Optional[str] = None
+
+    def reset(self) -> None:
+        self._tables.clear()
+        self._relationships.clear()
+        self._verified_queries.clear()
+
+    def _catalog_schema(self) -> MappingSchema:
+        assert self.catalog is not None
+        # The snapshot can be extended in place between calls, so key the sqlglot schema by its contents.
+        key = _fingerprint(self.catalog.tables)
+        if self._schema is None or self._schema_key != key:
+            self._schema = self.catalog.to_sqlglot_schema()
+            self._schema_key = key
+        return self._schema
+
+    def _resolution_key(self, data: Any) -> str:
+        """Returns the part of the environment that a table's validation result depends on."""
+        if self.catalog is not None:
+            base_table = data.get("base_table") or {}
+            fqn = ".".join(
+                str(base_table.get(k, "")) for k in ("database", "schema", "table")
+            )
+            return "catalog:" + _fingerprint(self.catalog.columns(fqn))
+        if self.conn is not None:
+            return "conn"
+        return ""
+
+    def _validate_table(self, text: str, index: int) -> _TableResult:
+        try:
+            table = _parse_entry(
+                text, TABLE_SCHEMA, f"tables[{index}]", semantic_model_pb2.Table()
+            )
+        except Exception as e:
+            return _TableResult(None, [str(e)])
+
+        errors: List[str] = []
+        if self.catalog is not None:
+            errors = validate_table_against_catalog(
+                table, self.catalog, self._catalog_schema()
+            )
+        elif self.conn is not None:
+            try:
+                validate_table_exists(
+                    fully_qualified_table_name(table.base_table), self.conn
+                )
+            except ValueError as e:
+                errors = [str(e)]
+        return _TableResult(table, errors, table_token_count(table))
+
+    @staticmethod
+    def _validate_relationship(
+        text: str, index: int, tables: Dict[str, semantic_model_pb2.Table]
+    ) -> _EntryResult:
+        try:
+            relationship = _parse_entry(
+                text,
+                RELATIONSHIP_SCHEMA,
+                f"relationships[{index}]",
+                semantic_model_pb2.Relationship(),
+            )
+        except Exception as e:
+            return _EntryResult(None, [str(e)])
+
+        errors = []
+        for side, table_name, columns in (
+            (
+                "left_table",
+                relationship.left_table,
+                [c.left_column for c in relationship.relationship_columns],
+            ),
+            (
+                "right_table",
+                relationship.right_table,
+                [c.right_column for c in relationship.relationship_columns],
+            ),
+        ):
+            table = tables.get(table_name)
+            if table is None:
+                errors.append(
+                    f"关系 '{relationship.name}' 的 {side} '{table_name}' 不存在"
+                )
+                continue
+            table_columns = {
+                c.name
+                for group in (
+                    table.columns,
+                    table.dimensions,
+                    table.time_dimensions,
+                    table.measures,
+                    table.facts,
+                )
+                for c in group
+            }
+            for column in columns:
+                if column not in table_columns:
+                    errors.append(
+                        f"关系 '{relationship.name}' 的列 '{column}' 不在表 '{table_name}' 中"
+                    )
+        return _EntryResult(relationship, errors)
+
+    def validate(self, yaml_str: str) -> semantic_model_pb2.SemanticModel:
+        """
+        Validates the yaml, re-using the results of entries that did not change since the previous call.
+
+        Returns: the SemanticModel parsed from the yaml.
+        Raises: ValueError with all validation errors if the model is invalid.
+        """
+        loader = _Loader(yaml_str)
+        try:
+            root = loader.get_single_node()
+            data = loader.construct_document(root) if root is not None else None
+        except yaml.YAMLError as e:
+            raise ValueError(f"YAML 解析错误: {e}")
+        finally:
+            loader.dispose()
+        validate_model_dict(data)
+
+        # The text of every entry of the repeated sections, and of everything else.
+        header_lines: List[str] = []
+        entry_texts: Dict[str, List[str]] = {section: [] for section in _SECTIONS}
+        for key_node, value_node in root.value:
+            if key_node.value in _SECTIONS:
+                if isinstance(value_node, yaml.SequenceNode):
+                    entry_texts[key_node.value] = [
+                        _node_text(yaml_str, node) for node in value_node.value
+                    ]
+            else:
+                header_lines.append(
+                    yaml_str[key_node.start_mark.index : value_node.end_mark.index]
+                )
+        # Everything except the repeated sections is small, so it is always validated in full.
+        model = _parse_entry(
+            "\n".join(header_lines + ["tables: []"]),
+            SCHEMA,
+            "semantic model",
+            semantic_model_pb2.SemanticModel(),
+        )
+
+        changes: List[str] = []
+        errors: List[str] = []
+
+        # Tables.
+        table_results: Dict[Tuple[str, str], _TableResult] = {}
+        table_fps: Dict[str, str] = {}
+        tables_by_name: Dict[str, semantic_model_pb2.Table] = {}
+        for i, (table_data, table_text) in enumerate(
+            zip(data.get("tables") or [], entry_texts["tables"])
+        ):
+            key = (_fingerprint(table_text), self._resolution_key(table_data))
+            result = self._tables.get(key)
+            if result is None:
+                result = self._validate_table(table_text, i)
+                changes.append(f"table {table_data.get('name', i)}")
+            table_results[key] = result
+            errors.extend(result.errors)
+            if result.table is not None:
+                model.tables.append(result.table)
+                tables_by_name[result.table.name] = result.table
+                table_fps[result.table.name] = key[0]
+        self._tables = table_results
+
+        # Relationships depend on the tables they join.
+        relationship_results: Dict[Tuple[str, ...], _EntryResult] = {}
+        for i, (rel_data, rel_text) in enumerate(
+            zip(data.get("relationships") or [], entry_texts["relationships"])
+        ):
+            key = (
+                _fingerprint(rel_text),
+                table_fps.get(str(rel_data.get("left_table")), ""),
+                table_fps.get(str(rel_data.get("right_table")), ""),
+            )
+            entry = self._relationships.get(key)
+            if entry is None:
+                entry = self._validate_relationship(rel_text, i, tables_by_name)
+                changes.append(f"relationship {rel_data.get('name', i)}")
+            relationship_results[key] = entry
+            errors.extend(entry.errors)
+            if entry.message is not None:
+                model.relationships.append(entry.message)
+        self._relationships = relationship_results
+
+        # Verified queries depend on the logical tables they read from, and can only be resolved against the catalog
+        # once all of those tables are valid.
+        vq_results: Dict[Tuple[str, ...], _EntryResult] = {}
+        seen = set()
+        ctx: Optional[semantic_model_pb2.SemanticModel] = None
+        for i, (vq_data, vq_text) in enumerate(
+            zip(data.get("verified_queries") or [], entry_texts["verified_queries"])
+        ):
+            sql = str(vq_data.get("sql", "")).lower()
+            used_tables = sorted(
+                name
+                for name in table_fps
+                if logical_table_name(tables_by_name[name]).lower() in sql
+            )
+            key = (
+                _fingerprint(vq_text),
+                "" if errors else "resolvable",
+                *(table_fps[name] for name in used_tables),
+            )
+            entry = self._verified_queries.get(key)
+            if entry is None:
+                try:
+                    vq = _parse_entry(
+                        vq_text,
+                        VERIFIED_QUERY_SCHEMA,
+                        f"verified_queries[{i}]",
+                        semantic_model_pb2.VerifiedQuery(),
+                    )
+                    vq_errors: List[str] = []
+                    if self.catalog is not None and not errors:
+                        if ctx is None:
+                            ctx = context_to_column_format(model)
+                        vq_errors = validate_verified_query_against_catalog(
+                            vq, ctx, self._catalog_schema()
+                        )
+                    entry = _EntryResult(vq, vq_errors)
+                except Exception as e:
+                    entry = _EntryResult(None, [str(e)])
+                changes.append(f"verified query {vq_data.get('name', i)}")
+            vq_results[key] = entry
+            errors.extend(entry.errors)
+            if entry.message is not None:
+                identity = (entry.message.question, entry.message.sql)
+                if identity in seen:
+                    errors.append(f"验证查询 '{entry.message.name}' 重复")
+                seen.add(identity)
+                model.verified_queries.append(entry.message)
+        self._verified_queries = vq_results
+
+        self.changes = changes
+        if changes:
+            logger.info(f"Re-validated {len(changes)} changed entries: {changes}")
+
+        # Token counts are cached per table, so the context length check is a sum over the cached values.
+        model_tokens = sum(r.tokens for r in table_results.values())
+        model_tokens_limit = prompt_token_budget(_count_search_services(model))
+        if model_tokens > model_tokens_limit:
+            logger.warning(
+                f"Your semantic model is too large. Passed size is ~{model_tokens} tokens. "
+                f"We recommend keeping it below ~{model_tokens_limit} tokens."
+            )
+
+        if errors:
+            raise ValueError("\n".join(errors))
+        return model
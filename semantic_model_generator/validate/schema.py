@@ -159,4 +159,13 @@ def create_schema_for_enum(
     return schema
 
 
-SCHEMA = create_schema_for_message(semantic_model_pb2.SemanticModel.DESCRIPTOR, {})
+_PRECOMPUTED_TYPES: Dict[str, Validator] = {}
+SCHEMA = create_schema_for_message(
+    semantic_model_pb2.SemanticModel.DESCRIPTOR, _PRECOMPUTED_TYPES
+)
+# Schemas of the repeated top-level sections, used to validate a single entry of a semantic model at a time.
+TABLE_SCHEMA = _PRECOMPUTED_TYPES[semantic_model_pb2.Table.DESCRIPTOR.name]
+RELATIONSHIP_SCHEMA = _PRECOMPUTED_TYPES[semantic_model_pb2.Relationship.DESCRIPTOR.name]
+VERIFIED_QUERY_SCHEMA = _PRECOMPUTED_TYPES[
+    semantic_model_pb2.VerifiedQuery.DESCRIPTOR.name
+]
@@ -0,0 +1,237 @@
+# Static checks for LLM generated SQL before it is sent to the warehouse. The SQL is parsed with sqlglot and
+#  - rejected unless it is a single read-only query (no DML, DDL or commands),
+#  - rejected if it uses a table that is not a base table of the semantic model, or a column that the model (or the
+#    catalog snapshot, if one is given) does not define for its table,
+#  - given a LIMIT if it has none, and its LIMIT is clamped if it is too large.
+# Errors are returned as data instead of raised, so that they can be put into a retry prompt for the LLM to fix the
+# SQL without a round trip to the warehouse.
+#
+# Only unresolvable columns count as column errors. Other failures to resolve the SQL (e.g. table functions sqlglot
+# cannot type) let the SQL through, since the warehouse is the final judge and false rejections are worse than a slow
+# failure.
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set
+
+import sqlglot
+from loguru import logger
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, SqlglotError
+from sqlglot.optimizer.qualify import qualify
+
+from semantic_model_generator.validate.catalog import (
+    CatalogSnapshot,
+    normalize_table_fqn,
+)
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+_COLUMN_SECTIONS = (
+    "columns",
+    "dimensions",
+    "time_dimensions",
+    "measures",
+    "facts",
+    "metrics",
+)
+
+# Error codes of SqlGuardError.
+PARSE_ERROR = "parse_error"
+MULTIPLE_STATEMENTS = "multiple_statements"
+NOT_A_QUERY = "not_a_query"
+UNKNOWN_TABLE = "unknown_table"
+UNKNOWN_COLUMN = "unknown_column"
+
+
+@dataclass
+class SqlGuardError:
+    code: str
+    message: str
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"code": self.code, "message": self.message}
+
+
+@dataclass
+class SqlGuardResult:
+    # The SQL to execute, with the LIMIT injected or clamped. The input SQL if there are errors.
+    sql: str
+    errors: List[SqlGuardError] = field(default_factory=list)
+    limit_applied: bool = False
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+    def error_text(self) -> str:
+        """Returns the errors one per line, for retry prompts and for display."""
+        return "\n".join(f"- [{e.code}] {e.message}" for e in self.errors)
+
+
+def _expr_columns(expr: str) -> Set[str]:
+    try:
+        parsed = sqlglot.parse_one(expr, read="snowflake")
+    except SqlglotError:
+        return set()
+    return {c.name.upper() for c in parsed.find_all(exp.Column)}
+
+
+def allowed_tables(
+    model: Dict[str, Any], catalog: Optional[CatalogSnapshot] = None
+) -> Dict[str, Dict[str, str]]:
+    """
+    Returns {DB.SCHEMA.TABLE: {COLUMN: data type}} of the base tables of a semantic model dict (as loaded from yaml).
+    The columns of a table are those in the catalog snapshot if it has the table, and otherwise the columns that the
+    model's expressions use.
+    """
+    tables: Dict[str, Dict[str, str]] = {}
+    for table in model.get("tables") or []:
+        base = table.get("base_table") or {}
+        if not (base.get("database") and base.get("schema") and base.get("table")):
+            continue
+        fqn = normalize_table_fqn(
+            f"{base['database']}.{base['schema']}.{base['table']}"
+        )
+        columns = tables.setdefault(fqn, {})
+        for section in _COLUMN_SECTIONS:
+            for column in table.get(section) or []:
+                data_type = str(column.get("data_type") or "VARCHAR")
+                for name in _expr_columns(str(column.get("expr") or "")):
+                    columns.setdefault(name, data_type)
+    return with_catalog_columns(tables, catalog)
+
+
+def with_catalog_columns(
+    tables: Dict[str, Dict[str, str]], catalog: Optional[CatalogSnapshot]
+) -> Dict[str, Dict[str, str]]:
+    """Returns the tables with the columns of those in the catalog snapshot replaced by the snapshot's columns."""
+    if catalog is None:
+        return tables
+    return {
+        fqn: dict(catalog.columns(fqn)) if catalog.has_table(fqn) else columns
+        for fqn, columns in tables.items()
+    }
+
+
+def _resolve_table(table: exp.Table, tables: Dict[str, Dict[str, str]]) -> List[str]:
+    """Returns the allowed tables that a (possibly partially qualified) table reference can refer to."""
+    parts = [p.upper() for p in (table.catalog, table.db, table.name) if p]
+    return [fqn for fqn in tables if fqn.split(".")[-len(parts) :] == parts]
+
+
+def _parse_error(error: SqlglotError) -> str:
+    # ParseError messages highlight the error position with terminal escape codes, so format its details instead.
+    details = getattr(error, "errors", None)
+    if not details:
+        return str(error)
+    return "; ".join(
+        f"{d.get('description')} (第 {d.get('line')} 行, 第 {d.get('col')} 列)"
+        for d in details
+    )
+
+
+def _apply_limit(
+    query: exp.Query, default_limit: int, max_limit: int
+) -> Optional[exp.Query]:
+    """Returns the query with a LIMIT added or clamped, or None if its LIMIT is fine as is."""
+    limit = query.args.get("limit")
+    if limit is None:
+        if isinstance(query, exp.Select) and query.args.get("fetch") is not None:
+            return None
+        return query.limit(default_limit)
+    value = limit.expression
+    if isinstance(value, exp.Literal) and value.is_int and int(value.name) > max_limit:
+        return query.limit(max_limit)
+    return None
+
+
+def guard_sql(
+    sql: str,
+    tables: Optional[Dict[str, Dict[str, str]]],
+    default_limit: int = DEFAULT_LIMIT,
+    max_limit: int = MAX_LIMIT,
+) -> SqlGuardResult:
+    """
+    Checks that the SQL is a single read-only query over the given tables (see allowed_tables, or None to skip the
+    table and column checks) and bounds the number of rows it returns.
+    """
+    try:
+        statements = [
+            s for s in sqlglot.parse(sql, read="snowflake") if s is not None
+        ]
+    except SqlglotError as e:
+        return SqlGuardResult(
+            sql, [SqlGuardError(PARSE_ERROR, f"SQL 无法解析: {_parse_error(e)}")]
+        )
+    if len(statements) != 1:
+        return SqlGuardResult(
+            sql,
+            [SqlGuardError(MULTIPLE_STATEMENTS, "只能包含一条 SELECT 查询语句")],
+        )
+    query = statements[0]
+    if not isinstance(query, exp.Query) or query.find(
+        exp.DML, exp.DDL, exp.Drop, exp.AlterTable, exp.TruncateTable, exp.Command
+    ):
+        return SqlGuardResult(
+            sql,
+            [
+                SqlGuardError(
+                    NOT_A_QUERY,
+                    f"只允许只读的 SELECT 查询，不允许 {query.key.upper()} 语句",
+                )
+            ],
+        )
+
+    errors = _check_tables_and_columns(query, tables) if tables is not None else []
+    if errors:
+        return SqlGuardResult(sql, errors)
+    limited = _apply_limit(query, default_limit, max_limit)
+    if limited is None:
+        return SqlGuardResult(sql)
+    return SqlGuardResult(limited.sql(dialect="snowflake"), limit_applied=True)
+
+
+def _check_tables_and_columns(
+    query: exp.Query, tables: Dict[str, Dict[str, str]]
+) -> List[SqlGuardError]:
+    ctes = {cte.alias_or_name.upper() for cte in query.find_all(exp.CTE)}
+    # Resolve the table references on a copy with fully qualified names, so that columns resolve against the schema.
+    resolved = query.copy()
+    errors = []
+    for table in resolved.find_all(exp.Table):
+        if not isinstance(table.this, exp.Identifier):
+            continue  # Table functions such as TABLE(FLATTEN(...)).
+        if not table.db and table.name.upper() in ctes:
+            continue
+        matches = _resolve_table(table, tables)
+        if len(matches) == 1:
+            database, schema, name = matches[0].split(".")
+            table.set("catalog", exp.to_identifier(database))
+            table.set("db", exp.to_identifier(schema))
+            table.set("this", exp.to_identifier(name))
+        else:
+            errors.append(
+                SqlGuardError(
+                    UNKNOWN_TABLE,
+                    f"表 '{table.sql(dialect='snowflake')}' "
+                    + ("有歧义" if matches else "不在语义模型中")
+                    + f"，可用的表: {', '.join(sorted(tables))}",
+                )
+            )
+    if errors:
+        return errors
+
+    try:
+        qualify(
+            resolved,
+            schema=CatalogSnapshot(tables=tables).to_sqlglot_schema(),
+            dialect="snowflake",
+            validate_qualify_columns=True,
+        )
+    except (SqlglotError, OptimizeError, ValueError) as e:
+        if "could not be resolved" in str(e).lower():
+            return [SqlGuardError(UNKNOWN_COLUMN, f"列无法解析: {e}")]
+        logger.debug(f"Skipping the column check of the SQL: {e}")
+    return []
+
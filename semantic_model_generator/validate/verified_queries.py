@@ -0,0 +1,94 @@
+import concurrent.futures
+import re
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from loguru import logger
+from snowflake.connector import SnowflakeConnection
+
+from semantic_model_generator.data_processing.cte_utils import (
+    context_to_column_format,
+    expand_all_logical_tables_as_ctes,
+)
+from semantic_model_generator.protos import semantic_model_pb2
+
+# EXPLAIN only compiles the query, while RUN executes it with a small LIMIT to also catch runtime errors.
+CHECK_MODE_EXPLAIN = "explain"
+CHECK_MODE_RUN = "run"
+
+_DEFAULT_MAX_WORKERS = 8
+# Trailing semicolons end the statement, so they cannot be left inside the subquery of a RUN check.
+_TRAILING_TERMINATORS = re.compile(r"[\s;]+$")
+
+
+@dataclass
+class VerifiedQueryCheckResult:
+    name: str
+    question: str
+    success: bool
+    elapsed_sec: float
+    error: Optional[str] = None
+
+
+def _check_sql(conn: SnowflakeConnection, sql: str, mode: str, limit: int) -> None:
+    sql = _TRAILING_TERMINATORS.sub("", sql)
+    if mode == CHECK_MODE_EXPLAIN:
+        query = f"EXPLAIN USING TEXT {sql}"
+    elif mode == CHECK_MODE_RUN:
+        query = f"SELECT * FROM ({sql}) LIMIT {limit}"
+    else:
+        raise ValueError(f"Unknown verified query check mode: {mode}")
+    cursor = conn.cursor()
+    try:
+        cursor.execute(query)
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def check_verified_queries(
+    conn: SnowflakeConnection,
+    model: semantic_model_pb2.SemanticModel,
+    mode: str = CHECK_MODE_EXPLAIN,
+    limit: int = 1,
+    max_workers: int = _DEFAULT_MAX_WORKERS,
+) -> List[VerifiedQueryCheckResult]:
+    """
+    Expands the logical tables of every verified query in the model and checks them concurrently against Snowflake,
+    so a full check takes about as long as the slowest query.
+
+    Args:
+        conn: SnowflakeConnection to run the checks. Each check uses its own cursor.
+        model: the semantic model whose verified queries should be checked.
+        mode: CHECK_MODE_EXPLAIN to only compile each query, or CHECK_MODE_RUN to execute it with a LIMIT.
+        limit: number of rows to fetch in CHECK_MODE_RUN.
+        max_workers: maximum number of queries in flight at once.
+
+    Returns: one result per verified query, in the order of model.verified_queries.
+    """
+    if not model.verified_queries:
+        return []
+    ctx = context_to_column_format(model)
+
+    def _check(
+        verified_query: semantic_model_pb2.VerifiedQuery,
+    ) -> VerifiedQueryCheckResult:
+        start_time = time.time()
+        try:
+            sql = expand_all_logical_tables_as_ctes(verified_query.sql, ctx)
+            _check_sql(conn, sql, mode, limit)
+            error = None
+        except Exception as e:
+            logger.info(f"Verified query {verified_query.name} failed check: {e}")
+            error = str(e)
+        return VerifiedQueryCheckResult(
+            name=verified_query.name,
+            question=verified_query.question,
+            success=error is None,
+            elapsed_sec=time.time() - start_time,
+            error=error,
+        )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(_check, model.verified_queries))
@@ -1,6 +1,23 @@
 import os
+from typing import Any, List, Optional
+
+import sqlglot
 import yaml
 from snowflake.connector import SnowflakeConnection
+from sqlglot import exp
+from sqlglot.errors import OptimizeError, SqlglotError
+from sqlglot.optimizer.annotate_types import annotate_types
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.schema import MappingSchema
+
+from semantic_model_generator.data_processing.cte_utils import (
+    context_to_column_format,
+    expand_all_logical_tables_as_ctes,
+    fully_qualified_table_name,
+)
+from semantic_model_generator.data_processing.proto_utils import yaml_to_semantic_model
+from semantic_model_generator.protos import semantic_model_pb2
+from semantic_model_generator.validate.catalog import CatalogSnapshot
 
 
 def _is_china_region(conn: SnowflakeConnection) -> bool:
@@ -70,7 +87,13 @@ def _validate_yaml_structure(yaml_str: str) -> None:
         data = yaml.safe_load(yaml_str)
     except yaml.YAMLError as e:
         raise ValueError(f"YAML 解析错误: {e}")
-    
+    validate_model_dict(data)
+
+
+def validate_model_dict(data: Any) -> None:
+    """
+    Validate the required fields of a semantic model that has already been loaded from YAML.
+    """
     if not data:
         raise ValueError("YAML 文件为空")
     
@@ -115,13 +138,18 @@ def _validate_tables_exist(yaml_str: str, conn: SnowflakeConnection) -> None:
         schema = base_table.get("schema", "")
         tbl = base_table.get("table", "")
         
-        fqn = f"{db}.{schema}.{tbl}"
-        
-        try:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT 1 FROM {fqn} LIMIT 1")
-        except Exception as e:
-            raise ValueError(f"无法访问表 '{fqn}': {str(e)}")
+        validate_table_exists(f"{db}.{schema}.{tbl}", conn)
+
+
+def validate_table_exists(fqn: str, conn: SnowflakeConnection) -> None:
+    """
+    Validate that a single base table exists in Snowflake and is accessible.
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT 1 FROM {fqn} LIMIT 1")
+    except Exception as e:
+        raise ValueError(f"无法访问表 '{fqn}': {str(e)}")
 
 
 def validate(yaml_str: str, conn: SnowflakeConnection) -> None:
@@ -151,6 +179,134 @@ def validate(yaml_str: str, conn: SnowflakeConnection) -> None:
         send_message(conn, yaml_str, dummy_request)
 
 
+def _type_family(data_type: Optional[exp.DataType]) -> Optional[str]:
+    """Buckets a sqlglot data type into a coarse family, or None if unknown."""
+    if data_type is None:
+        return None
+    if data_type.this in exp.DataType.NUMERIC_TYPES:
+        return "NUMERIC"
+    if data_type.this in exp.DataType.TEXT_TYPES:
+        return "TEXT"
+    if data_type.this in exp.DataType.TEMPORAL_TYPES:
+        return "TEMPORAL"
+    if data_type.this == exp.DataType.Type.BOOLEAN:
+        return "BOOLEAN"
+    return None
+
+
+def _declared_type_family(data_type: str) -> Optional[str]:
+    if not data_type:
+        return None
+    try:
+        return _type_family(exp.DataType.build(data_type, dialect="snowflake"))
+    except (SqlglotError, ValueError):
+        return None
+
+
+def _qualify(sql: str, schema: MappingSchema) -> exp.Expression:
+    """Parses and resolves every table and column in the sql against the schema."""
+    return qualify(
+        sqlglot.parse_one(sql, read="snowflake"),
+        schema=schema,
+        dialect="snowflake",
+        validate_qualify_columns=True,
+    )
+
+
+def _table_exprs(table: semantic_model_pb2.Table) -> List[tuple[str, str, str]]:
+    """Returns (name, expr, declared data type) for every expression defined on the table."""
+    exprs = []
+    for group in (
+        table.columns,
+        table.dimensions,
+        table.time_dimensions,
+        table.measures,
+        table.facts,
+    ):
+        exprs.extend((c.name, c.expr, c.data_type) for c in group)
+    exprs.extend((f.name, f.expr, "") for f in table.filters)
+    return exprs
+
+
+def validate_table_against_catalog(
+    table: semantic_model_pb2.Table,
+    catalog: CatalogSnapshot,
+    schema: Optional[MappingSchema] = None,
+) -> List[str]:
+    """
+    Resolves and type-checks every expression of a logical table against its base table in the catalog snapshot.
+    Returns a list of error messages, empty if the table is valid.
+    """
+    fqn = fully_qualified_table_name(table.base_table)
+    if not catalog.has_table(fqn):
+        return [f"表 '{table.name}' 的 base_table '{fqn}' 不在目录快照中"]
+    schema = schema or catalog.to_sqlglot_schema()
+
+    errors = []
+    for name, expr, data_type in _table_exprs(table):
+        try:
+            resolved = _qualify(f"SELECT {expr} FROM {fqn}", schema)
+        except (SqlglotError, ValueError) as e:
+            errors.append(f"表 '{table.name}' 的 '{name}' 表达式无法解析: {e}")
+            continue
+        declared = _declared_type_family(data_type)
+        inferred = _type_family(annotate_types(resolved, schema=schema).selects[0].type)
+        if declared and inferred and declared != inferred:
+            errors.append(
+                f"表 '{table.name}' 的 '{name}' 声明类型 {data_type} 与表达式类型 {inferred} 不匹配"
+            )
+    return errors
+
+
+def validate_verified_query_against_catalog(
+    verified_query: semantic_model_pb2.VerifiedQuery,
+    model_in_column_format: semantic_model_pb2.SemanticModel,
+    schema: MappingSchema,
+) -> List[str]:
+    """
+    Expands the logical tables of a verified query and resolves it against the catalog schema.
+    Returns a list of error messages, empty if the query is valid.
+    """
+    try:
+        _qualify(
+            expand_all_logical_tables_as_ctes(
+                verified_query.sql, model_in_column_format
+            ),
+            schema,
+        )
+    except (SqlglotError, OptimizeError, ValueError) as e:
+        return [f"验证查询 '{verified_query.name}' 无法解析: {e}"]
+    return []
+
+
+def validate_offline(yaml_str: str, catalog: CatalogSnapshot) -> None:
+    """
+    Validate semantic model YAML against a cached catalog snapshot, without any network calls.
+
+    Checks the YAML structure, then resolves every expr and verified query SQL against the tables and
+    columns of the snapshot with sqlglot, and checks declared data types against the inferred ones.
+
+    yaml_str: yaml content in string format.
+    catalog: CatalogSnapshot holding the base tables referenced by the model.
+    """
+    _validate_yaml_structure(yaml_str)
+    model = yaml_to_semantic_model(yaml_str)
+    schema = catalog.to_sqlglot_schema()
+
+    errors: List[str] = []
+    for table in model.tables:
+        errors.extend(validate_table_against_catalog(table, catalog, schema))
+    # Verified queries can only be resolved once all of their logical tables are.
+    if not errors and model.verified_queries:
+        ctx = context_to_column_format(model)
+        for verified_query in model.verified_queries:
+            errors.extend(
+                validate_verified_query_against_catalog(verified_query, ctx, schema)
+            )
+    if errors:
+        raise ValueError("\n".join(errors))
+
+
 def validate_from_local_path(yaml_path: str, conn: SnowflakeConnection) -> None:
     yaml_str = load_yaml(yaml_path)
     validate(yaml_str, conn)
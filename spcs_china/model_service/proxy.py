@@ -8,7 +8,7 @@ import os
 import json
 import httpx
 from fastapi import FastAPI, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
 app = FastAPI(title="Snowflake SPCS Proxy")
 
@@ -74,6 +74,10 @@ async def chat_completions(request: Request):
         
         return {"data": results}
     
+    # 流式 OpenAI 格式 - 逐块转发 vLLM 的 SSE 响应
+    elif body.get("stream"):
+        return StreamingResponse(_stream_vllm(body), media_type="text/event-stream")
+
     # 直接 OpenAI 格式 - 转发到 vLLM
     else:
         async with httpx.AsyncClient() as client:
@@ -85,6 +89,21 @@ async def chat_completions(request: Request):
             return resp.json()
 
 
+async def _stream_vllm(body: dict):
+    """转发 vLLM 的流式响应，不做缓冲"""
+    if "model" not in body:
+        body["model"] = MODEL_NAME
+    async with httpx.AsyncClient() as client:
+        async with client.stream(
+            "POST",
+            f"{VLLM_URL}/v1/chat/completions",
+            json=body,
+            timeout=120
+        ) as resp:
+            async for chunk in resp.aiter_raw():
+                yield chunk
+
+
 @app.post("/complete")
 async def simple_complete(request: Request):
     """
@@ -41,6 +41,10 @@ MODELS = {
 }
 
 
+# 批量处理时每条 SQL 发送的行数
+BATCH_SIZE = 10
+
+
 # ===============================
 # 辅助函数
 # ===============================
@@ -119,17 +123,77 @@ def call_llm(session, model_key: str, prompt: str, system_prompt: str = None,
     try:
         result = session.sql(query).collect()
         if result and len(result) > 0:
-            response = result[0][0]
-            if response and "</think>" in response:
-                parts = response.split("</think>")
-                if len(parts) > 1:
-                    return parts[-1].strip()
-            return response
+            return _clean_response(result[0][0])
         return "没有收到响应"
     except Exception as e:
         return f"错误: {str(e)}"
 
 
+def _clean_response(response: str) -> str:
+    """去掉 DeepSeek-R1 的推理链，只保留最终回答"""
+    if response and "</think>" in response:
+        parts = response.split("</think>")
+        if len(parts) > 1:
+            return parts[-1].strip()
+    return response
+
+
+def call_llm_batch(session, model_key: str, prompts: list, system_prompt: str = None,
+                   max_tokens: int = 2048, temperature: float = 0.7) -> list:
+    """
+    在一条 SQL 中批量调用 LLM UDF，由 Snowflake 将多行并发发送给服务，而不是逐条调用
+    
+    Args:
+        session: Snowpark session
+        model_key: 模型标识 ("Qwen" 或 "DeepSeek")
+        prompts: 用户输入列表
+        system_prompt: 系统提示词 (可选)
+        max_tokens: 最大输出 token 数
+        temperature: 温度参数
+    
+    Returns:
+        与 prompts 顺序一致的响应列表。整批失败时逐条重试，单条失败返回错误信息
+    """
+    if not prompts:
+        return []
+    model_config = MODELS.get(model_key, MODELS["Qwen"])
+    
+    rows = []
+    for i, prompt in enumerate(prompts):
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
+        messages.append({"role": "user", "content": prompt})
+        payload = {
+            "model": model_config["model_id"],
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature
+        }
+        payload_escaped = json.dumps(payload, ensure_ascii=False).replace("'", "''")
+        rows.append(f"({i}, '{payload_escaped}')")
+    
+    ensure_warehouse(session)
+    
+    udf_path = model_config["udf_path"]
+    query = (
+        f"SELECT column1 AS idx, {udf_path}(column2) AS response "
+        f"FROM VALUES {', '.join(rows)} ORDER BY idx"
+    )
+    
+    try:
+        result = session.sql(query).collect()
+        responses = ["没有收到响应"] * len(prompts)
+        for row in result:
+            if row[1]:
+                responses[row[0]] = _clean_response(row[1])
+        return responses
+    except Exception:
+        # 某一行出错会导致整条 SQL 失败，逐条调用以返回每行的结果或错误
+        return [call_llm(session, model_key, prompt, system_prompt, max_tokens, temperature)
+                for prompt in prompts]
+
+
 def get_service_status(session, service_name: str) -> dict:
     """获取 SPCS 服务状态"""
     try:
@@ -394,15 +458,19 @@ def main():
                 progress_bar = st.progress(0)
                 status_text = st.empty()
                 
-                for i, line in enumerate(lines):
-                    status_text.text(f"处理 {i+1}/{len(lines)}: {line[:30]}...")
-                    full_prompt = f"{batch_prompt}{line}"
-                    response = call_llm(session, selected_model, full_prompt)
-                    results.append({
-                        "输入": line,
-                        "输出": response
-                    })
-                    progress_bar.progress((i + 1) / len(lines))
+                # 每批一条 SQL，批内各行由 Snowflake 并发调用服务
+                for start in range(0, len(lines), BATCH_SIZE):
+                    chunk = lines[start:start + BATCH_SIZE]
+                    status_text.text(f"处理 {start + 1}-{start + len(chunk)}/{len(lines)}...")
+                    responses = call_llm_batch(
+                        session, selected_model, [f"{batch_prompt}{line}" for line in chunk]
+                    )
+                    for line, response in zip(chunk, responses):
+                        results.append({
+                            "输入": line,
+                            "输出": response
+                        })
+                    progress_bar.progress((start + len(chunk)) / len(lines))
                 
                 status_text.text("✅ 处理完成!")
                 st.success(f"处理完成，共 {len(results)} 条")